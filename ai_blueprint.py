@@ -1,20 +1,30 @@
 from flask import Blueprint, request, jsonify, g
 from auth_middleware import token_required
-from google import genai
-from google.genai import types
-from db_helpers import get_db_connection
+from ai_client import create_ai_client, build_insight_prompt, insight_cache_key
+from ai_jobs import submit_insight_job, job_stats, QueueFull, AI_JOB_TIMEOUT
+from db_helpers import get_db_connection, close_db_connection
+from instrumentation import timed
+from datetime import datetime, timedelta
 import psycopg2.extras
-import os
+import math
+import time
 
 from dotenv import load_dotenv
 load_dotenv()
 
 ai_blueprint = Blueprint("ai_blueprint", __name__)
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Swap for ai_client.FakeInsightClient() (or set AI_CLIENT=fake) to run without Gemini
+client = create_ai_client()
 
+MAX_LONG_POLL_SECONDS = 25
+LONG_POLL_INTERVAL = 0.5
+# Times to try claiming a report's active job slot before answering with its latest job
+ENQUEUE_ATTEMPTS = 3
+
+# Pass ?refresh=true to skip the stored insight and ask the model again
 @ai_blueprint.route("/ai/<report_id>", methods=["GET"])
 @token_required
-def generate_insight_for_report(report_id):        
+def generate_insight_for_report(report_id):
         try:
             connection = get_db_connection()
             cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
@@ -22,7 +32,6 @@ def generate_insight_for_report(report_id):
             # Fetch the report from the DB
             cursor.execute("SELECT observation, condition, water_source, location_name, author FROM reports WHERE id = %s", (report_id,))
             report = cursor.fetchone()
-            connection.close()
 
             if not report:
                 return jsonify({"error": "Report not found"}), 404
@@ -31,30 +40,144 @@ def generate_insight_for_report(report_id):
             if report["author"] != g.user["id"]:
                 return jsonify({"error": "Unauthorized"}), 401
 
-            prompt = (
-                f"User submitted a water report with the following details:\n"
-                f"- Observation: {report['observation']}\n"
-                f"- Condition: {report['condition']}\n"
-                f"- Water source: {report['water_source']}\n"
-                f"- Location: {report['location_name']}\n\n"
-                "Provide a short, plain-text suggestion or next step for the user."
-                "Use google search to find environmental agencies names based on the report location, water source, condition, and observation. "
-                "If you find any relevant agencies, include their names in the suggestion. If you don't find any relevant agencies, provide a general suggestion based on the report details."
-                "Keep it concise (1-2 sentences), actionable, and do NOT use bullet points or markdown."
-            )
-
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0),
-                    tools=[types.Tool(google_search=types.GoogleSearch())]
-                )
-            )
-
-            return jsonify({"insight": response.text.strip()}), 200
+            # Insights are stored under a hash of the prompt inputs and the model
+            cache_key = insight_cache_key(report, client.model)
+            if request.args.get("refresh") != "true":
+                cursor.execute("SELECT insight FROM ai_insights WHERE cache_key = %s", (cache_key,))
+                stored = cursor.fetchone()
+                if stored:
+                    return jsonify({"insight": stored["insight"], "cached": True}), 200
+
+            # Hand the connection back before the slow model call
+            connection.commit()
+            close_db_connection()
+
+            with timed("ai"):
+                insight = client.generate_insight(build_insight_prompt(report))
+
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("""INSERT INTO ai_insights (cache_key, report_id, model, insight) VALUES (%s, %s, %s, %s)
+                              ON CONFLICT (cache_key) DO UPDATE SET report_id = EXCLUDED.report_id, insight = EXCLUDED.insight, created_at = CURRENT_TIMESTAMP""",
+                           (cache_key, report_id, client.model, insight))
+            connection.commit()
+
+            return jsonify({"insight": insight, "cached": False}), 200
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+# Queue an insight job - POST /ai/<report_id>/jobs
+# Returns a job id straight away, one active job per report is shared by repeated requests
+@ai_blueprint.route("/ai/<report_id>/jobs", methods=["POST"])
+@token_required
+def enqueue_insight_job(report_id):
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+            cursor.execute("SELECT id, observation, condition, water_source, location_name, author FROM reports WHERE id = %s", (report_id,))
+            report = cursor.fetchone()
+
+            if not report:
+                return jsonify({"error": "Report not found"}), 404
+
+            if report["author"] != g.user["id"]:
+                return jsonify({"error": "Unauthorized"}), 401
+
+            now = datetime.utcnow()
+            cache_key = insight_cache_key(report, client.model)
+
+            # A stored insight completes the job without touching the queue
+            if request.args.get("refresh") != "true":
+                cursor.execute("SELECT insight FROM ai_insights WHERE cache_key = %s", (cache_key,))
+                stored = cursor.fetchone()
+                if stored:
+                    cursor.execute("""INSERT INTO ai_jobs (report_id, author, status, insight, created_at, finished_at)
+                                      VALUES (%s, %s, 'done', %s, %s, %s) RETURNING id, status""",
+                                   (report["id"], report["author"], stored["insight"], now, now))
+                    job = cursor.fetchone()
+                    connection.commit()
+                    return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+
+            # Give up on active jobs whose worker never finished them
+            cursor.execute("""UPDATE ai_jobs SET status = 'failed', error = 'Timed out', finished_at = %s
+                              WHERE report_id = %s AND status IN ('queued', 'running') AND created_at < %s""",
+                           (now, report["id"], now - timedelta(seconds=AI_JOB_TIMEOUT)))
+            for attempt in range(ENQUEUE_ATTEMPTS):
+                cursor.execute("""INSERT INTO ai_jobs (report_id, author, status, created_at) VALUES (%s, %s, 'queued', %s)
+                                  ON CONFLICT (report_id) WHERE status IN ('queued', 'running') DO NOTHING
+                                  RETURNING id, status""",
+                               (report["id"], report["author"], now))
+                job = cursor.fetchone()
+                if job is not None:
+                    break
+                # Another request's job is active, share it. It can finish before this SELECT sees it,
+                # which frees the slot, so the insert is tried again.
+                cursor.execute("SELECT id, status FROM ai_jobs WHERE report_id = %s AND status IN ('queued', 'running')", (report["id"],))
+                job = cursor.fetchone()
+                if job is not None:
+                    connection.commit()
+                    return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+            else:
+                # Jobs keep finishing as fast as they start, the newest one has the freshest insight
+                cursor.execute("SELECT id, status FROM ai_jobs WHERE report_id = %s ORDER BY id DESC LIMIT 1", (report["id"],))
+                job = cursor.fetchone()
+                connection.commit()
+                return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+            connection.commit()
+
+            try:
+                submit_insight_job(job["id"], report, cache_key, client)
+            except QueueFull as e:
+                cursor.execute("UPDATE ai_jobs SET status = 'failed', error = %s, finished_at = %s WHERE id = %s",
+                               (str(e), datetime.utcnow(), job["id"]))
+                connection.commit()
+                return jsonify({"error": str(e)}), 503
+
+            return jsonify({"job_id": job["id"], "status": job["status"]}), 202
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+# Check on an insight job - GET /ai/jobs/<job_id>?wait=<seconds>
+# With wait, the request long-polls until the job finishes or the wait runs out
+@ai_blueprint.route("/ai/jobs/<job_id>", methods=["GET"])
+@token_required
+def show_insight_job(job_id):
+        try:
+            try:
+                wait = float(request.args.get("wait", 0))
+            except ValueError:
+                return jsonify({"error": "wait must be a number"}), 400
+            # A NaN deadline never passes, so the poll would never end
+            if not math.isfinite(wait):
+                return jsonify({"error": "wait must be a number"}), 400
+            wait = max(0.0, min(wait, MAX_LONG_POLL_SECONDS))
+            deadline = time.monotonic() + wait
+
+            while True:
+                connection = get_db_connection()
+                cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                cursor.execute("SELECT id AS job_id, report_id, author, status, insight, error, created_at, finished_at FROM ai_jobs WHERE id = %s", (job_id,))
+                job = cursor.fetchone()
+                connection.commit()
+                # Don't sit on a pooled connection between polls
+                close_db_connection()
+
+                if not job:
+                    return jsonify({"error": "Job not found"}), 404
+                if job["author"] != g.user["id"]:
+                    return jsonify({"error": "Unauthorized"}), 401
+                if job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+                    del job["author"]
+                    return jsonify(job), 200
+                time.sleep(LONG_POLL_INTERVAL)
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
 
+# Queue depth, job latency and failure counts for this worker
+@ai_blueprint.route("/ai/jobs/stats", methods=["GET"])
+def insight_job_stats():
+    return jsonify(job_stats()), 200
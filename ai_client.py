@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import time
+
+AI_MODEL = os.getenv("AI_MODEL", "gemini-2.5-flash")
+# "gemini" talks to Google, "fake" returns canned insights for tests and benchmarks
+AI_CLIENT = os.getenv("AI_CLIENT", "gemini")
+# How long the fake client takes to answer, to stand in for Gemini's latency in load tests
+FAKE_AI_LATENCY_MS = float(os.getenv("FAKE_AI_LATENCY_MS", "0"))
+
+# Report fields the insight depends on, changing any of them needs a new insight
+INSIGHT_FIELDS = ("observation", "condition", "water_source", "location_name")
+
+
+def build_insight_prompt(report):
+    return (
+        f"User submitted a water report with the following details:\n"
+        f"- Observation: {report['observation']}\n"
+        f"- Condition: {report['condition']}\n"
+        f"- Water source: {report['water_source']}\n"
+        f"- Location: {report['location_name']}\n\n"
+        "Provide a short, plain-text suggestion or next step for the user."
+        "Use google search to find environmental agencies names based on the report location, water source, condition, and observation. "
+        "If you find any relevant agencies, include their names in the suggestion. If you don't find any relevant agencies, provide a general suggestion based on the report details."
+        "Keep it concise (1-2 sentences), actionable, and do NOT use bullet points or markdown."
+    )
+
+
+def insight_cache_key(report, model):
+    inputs = [report[field] for field in INSIGHT_FIELDS] + [model]
+    return hashlib.sha256(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+
+class GeminiInsightClient:
+    def __init__(self, model=AI_MODEL):
+        from google import genai
+        from google.genai import types
+        self.model = model
+        self._types = types
+        self._client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+    def generate_insight(self, prompt):
+        response = self._client.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config=self._types.GenerateContentConfig(
+                thinking_config=self._types.ThinkingConfig(thinking_budget=0),
+                tools=[self._types.Tool(google_search=self._types.GoogleSearch())]
+            )
+        )
+        return response.text.strip()
+
+
+class FakeInsightClient:
+    def __init__(self, model="fake-insight-model", insight="Contact your local environmental agency to report this observation.",
+                 latency_ms=FAKE_AI_LATENCY_MS):
+        self.model = model
+        self.insight = insight
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def generate_insight(self, prompt):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self.insight
+
+
+def create_ai_client():
+    if AI_CLIENT == "fake":
+        return FakeInsightClient()
+    return GeminiInsightClient()
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from ai_client import build_insight_prompt
+from db_helpers import pooled_connection
+from instrumentation import timed
+
+AI_WORKERS = int(os.getenv("AI_WORKERS", "4"))
+# Jobs beyond this many waiting are rejected instead of queued
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "50"))
+# Active jobs older than this are assumed lost (e.g. their worker restarted)
+AI_JOB_TIMEOUT = int(os.getenv("AI_JOB_TIMEOUT", "120"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_stats = {
+    "queued": 0,
+    "running": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "latency_seconds_total": 0.0,
+    "latency_seconds_max": 0.0,
+}
+
+
+def get_executor():
+    global _executor, _executor_pid
+    # Threads don't survive a fork, so each gunicorn worker starts its own pool
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=AI_WORKERS, thread_name_prefix="ai-jobs")
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def submit_insight_job(job_id, report, cache_key, client):
+    with _lock:
+        if _stats["queued"] >= AI_MAX_QUEUE:
+            _stats["rejected"] += 1
+            raise QueueFull("Too many insight requests in progress, try again shortly")
+        _stats["queued"] += 1
+        executor = get_executor()
+    executor.submit(run_insight_job, job_id, report, cache_key, client, time.monotonic())
+
+
+def run_insight_job(job_id, report, cache_key, client, submitted_at):
+    with _lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+    try:
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("UPDATE ai_jobs SET status = 'running', started_at = %s WHERE id = %s", (datetime.utcnow(), job_id))
+            connection.commit()
+
+        with timed("ai"):
+            insight = client.generate_insight(build_insight_prompt(report))
+
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("UPDATE ai_jobs SET status = 'done', insight = %s, finished_at = %s WHERE id = %s",
+                           (insight, datetime.utcnow(), job_id))
+            cursor.execute("""INSERT INTO ai_insights (cache_key, report_id, model, insight) VALUES (%s, %s, %s, %s)
+                              ON CONFLICT (cache_key) DO UPDATE SET report_id = EXCLUDED.report_id, insight = EXCLUDED.insight, created_at = CURRENT_TIMESTAMP""",
+                           (cache_key, report["id"], client.model, insight))
+            connection.commit()
+        finished("completed", submitted_at)
+    except Exception as error:
+        finished("failed", submitted_at)
+        try:
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("UPDATE ai_jobs SET status = 'failed', error = %s, finished_at = %s WHERE id = %s",
+                               (str(error), datetime.utcnow(), job_id))
+                connection.commit()
+        except Exception:
+            pass
+
+
+def finished(outcome, submitted_at):
+    latency = time.monotonic() - submitted_at
+    with _lock:
+        _stats["running"] -= 1
+        _stats[outcome] += 1
+        _stats["latency_seconds_total"] += latency
+        _stats["latency_seconds_max"] = max(_stats["latency_seconds_max"], latency)
+
+
+def job_stats():
+    with _lock:
+        stats = dict(_stats)
+    finished_jobs = stats["completed"] + stats["failed"]
+    stats["queue_depth"] = stats.pop("queued")
+    stats["latency_seconds_avg"] = stats["latency_seconds_total"] / finished_jobs if finished_jobs else 0.0
+    stats["workers"] = AI_WORKERS
+    return stats
@@ -4,9 +4,18 @@ from auth_blueprint import authentication_blueprint
 from reports_blueprint import reports_blueprint
 from comments_blueprint import comments_blueprint
 from ai_blueprint import ai_blueprint
-from geocoding_blueprint import geocoding_blueprint
+from geocoding_blueprint import geocoding_blueprint, memory_cache, shared_cache_stats, nominatim
+from db_helpers import close_db_connection, get_pool
+from response_cache import response_cache
+from report_clusters import tile_cache
+from ai_jobs import job_stats
+import auth_middleware
+import instrumentation
+from json_provider import FastJSONProvider
 
 app = Flask(__name__)
+# orjson-backed jsonify when orjson is installed, see json_provider.py
+app.json = FastJSONProvider(app)
 
 CORS(app, resources={
     r"/*": {"origins": ["http://localhost:5173", "https://hydrowave.netlify.app"]}}, supports_credentials=True)
@@ -17,6 +26,21 @@ app.register_blueprint(comments_blueprint)
 app.register_blueprint(ai_blueprint)
 app.register_blueprint(geocoding_blueprint)
 
+# Return each request's pooled connection, including on early returns and errors
+app.teardown_appcontext(close_db_connection)
+
+# Server-Timing headers, slow query logging and GET /metrics, which also exposes the existing stats
+instrumentation.init_app(app, {
+    "db_pool": lambda: get_pool().stats(),
+    "response_cache": response_cache.stats,
+    "cluster_tiles": tile_cache.stats,
+    "token_cache": lambda: auth_middleware.token_cache.stats(),
+    "geocode_memory_cache": memory_cache.stats,
+    "geocode_shared_cache": lambda: shared_cache_stats,
+    "nominatim": lambda: nominatim.stats,
+    "ai_jobs": job_stats,
+})
+
 
 if __name__ == '__main__':
     app.run(port=5000)
\ No newline at end of file
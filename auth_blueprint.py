@@ -1,9 +1,8 @@
-import os
-import jwt
-import bcrypt
-import psycopg2, psycopg2.extras
+import psycopg2, psycopg2.extras, psycopg2.errors
 from flask import Blueprint, jsonify, request
 from db_helpers import get_db_connection
+from auth_middleware import create_token
+from password_hashing import hash_password, check_password, needs_rehash, HasherBusy
 
 authentication_blueprint = Blueprint('authentication_blueprint', __name__)
 
@@ -13,44 +12,38 @@ def sign_up():
     try:
         new_user_data = request.get_json()
 
+        # Hash the password on the bounded bcrypt executor
+        hashed_password = hash_password(new_user_data["password"])
+
         # Establish the connection with the db
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        # Through the connection, run a SQL command to find existing user in the db
-        cursor.execute("SELECT * FROM users WHERE username = %s;", (new_user_data["username"],))
-
-        # Then fetch the user
-        existing_user = cursor.fetchone()
-
-        # Close the connection if there is a user and return message specifying existing user
-        if existing_user:
-            cursor.close()
+        # Add the user to db and return the user object, the UNIQUE constraint on username catches existing users
+        try:
+            cursor.execute(
+                "INSERT INTO users (username, password) VALUES (%s, %s) RETURNING id, username",
+                (new_user_data["username"], hashed_password),
+            )
+        except psycopg2.errors.UniqueViolation:
+            connection.rollback()
             return jsonify({"err": "Username already taken"}), 400
-        
-        # Hash the password
-        hashed_password = bcrypt.hashpw(bytes(new_user_data["password"], 'utf-8'), bcrypt.gensalt())
-        
-        # With no existing user, we can add the user to db and return the user object
-        cursor.execute(
-            "INSERT INTO users (username, password) VALUES (%s, %s) RETURNING id, username",
-            (new_user_data["username"], hashed_password.decode("utf-8")),
-        )
 
-        # Grab the user object from db, then commit (save to db) then close connection with the DB
+        # Grab the user object from db, then commit (save to db), the connection goes back to the pool on teardown
         created_user = cursor.fetchone()
         connection.commit()
-        connection.close()
 
         # Construct the payload
         payload = {"username": created_user["username"], "id": created_user["id"]}
 
-        # Create the token, attaching the payload
-        token = jwt.encode({ "payload": payload }, os.getenv('JWT_SECRET'))
+        # Create the token, attaching the payload, it expires after JWT_EXPIRATION_SECONDS
+        token = create_token(payload)
 
         # Send the token instead of the user
         return jsonify({"token": token}), 201
     
+    except HasherBusy as err:
+        return jsonify({"err": str(err)}), 503
     except Exception as err:
         return jsonify({"err": str(err)}), 401
     
@@ -72,22 +65,27 @@ def sign_in():
             return jsonify({"err": "Invalid credentials."}), 401
         
         # Else, check the password against the hashed version of the password
-        password_is_valid = bcrypt.checkpw(bytes(sign_in_form_data["password"], 'utf-8'), bytes(existing_user["password"], 'utf-8'))
+        password_is_valid = check_password(sign_in_form_data["password"], existing_user["password"])
         
         if not password_is_valid:
             return jsonify({"err": "Invalid credentials."}), 401
+
+        # Upgrade hashes made with an outdated work factor while we have the plain password
+        if needs_rehash(existing_user["password"]):
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s",
+                           (hash_password(sign_in_form_data["password"]), existing_user["id"]))
+            connection.commit()
         
         # Construct the payload
         payload = {"username": existing_user["username"], "id": existing_user["id"]}
 
-        # Create the token, attaching the payload
-        token = jwt.encode({ "payload": payload }, os.getenv('JWT_SECRET'))
+        # Create the token, attaching the payload, it expires after JWT_EXPIRATION_SECONDS
+        token = create_token(payload)
 
         # Send the token instead of the user
         return jsonify({"token": token}), 200
     
+    except HasherBusy as err:
+        return jsonify({"err": str(err)}), 503
     except Exception as err:
         return jsonify({"err": "Invalid credentials."}), 401
-    
-    finally:
-        connection.close()
\ No newline at end of file
@@ -1,8 +1,46 @@
 from functools import wraps
 from flask import request, jsonify, g
+from datetime import datetime, timedelta, timezone
+from cache import TTLCache
+import hashlib
+import time
 import jwt
 import os
 
+from dotenv import load_dotenv
+load_dotenv()
+
+# Key material is read once at startup instead of on every request
+JWT_SECRET = os.getenv('JWT_SECRET')
+JWT_EXPIRATION_SECONDS = int(os.getenv('JWT_EXPIRATION_SECONDS', str(7 * 24 * 3600)))
+# Verified tokens are remembered by digest, never for longer than their own exp
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '300'))
+
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+def create_token(payload):
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=JWT_EXPIRATION_SECONDS)
+    return jwt.encode({"payload": payload, "exp": expires_at}, JWT_SECRET)
+
+
+def verify_token(token):
+    digest = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = token_cache.get(digest)
+    if payload is None:
+        # Decode will throw an error if the token is invalid or expired
+        token_data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        payload = token_data['payload']
+        ttl = TOKEN_CACHE_TTL
+        if 'exp' in token_data:
+            ttl = min(ttl, token_data['exp'] - time.time())
+        if ttl > 0:
+            token_cache.set(digest, payload, ttl)
+    # Handlers get their own copy so the cached payload can't be modified
+    return dict(payload)
+
+
 def token_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -14,14 +52,13 @@ def token_required(f):
         try:
             # Remove the 'Bearer' portion of the Auth header string
             token = authorization_header.split(' ')[1]
-            # Decode will throw an error if the token is invalid, triggering the except block automatically
-            token_data = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=["HS256"])
-            g.user = token_data['payload']
+            g.user = verify_token(token)
 
+        except (IndexError, KeyError, jwt.InvalidTokenError) as err:
+            return jsonify({"err": str(err) or "Unauthorized"}), 401
         except Exception as err:
             return jsonify({"err": str(err)}), 500
-        
+
         return f(*args, **kwargs)
-    
-    return decorated_function
 
+    return decorated_function
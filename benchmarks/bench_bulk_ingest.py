@@ -0,0 +1,93 @@
+# Benchmark of POST /reports/bulk against replaying the same rows through POST /reports.
+#
+#   python benchmarks/bench_bulk_ingest.py [bulk_rows] [single_rows]
+#
+# Uses the database configured for the app and a throwaway user, whose reports are
+# deleted at the end. Requests go through the Flask test client, so the numbers leave
+# out network time, which only widens the gap for the one-request-per-row path. Exits
+# with status 1 when the bulk path loads fewer than TARGET_ROWS_PER_SECOND rows/s.
+import csv
+import io
+import os
+import random
+import sys
+import time
+import uuid
+
+os.environ.setdefault('JWT_SECRET', 'benchmark-secret-that-is-long-enough-for-hs256')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app
+from auth_middleware import create_token
+from db_helpers import connect
+
+TARGET_ROWS_PER_SECOND = 10000
+
+FIELDS = ('title', 'reported_at', 'water_source', 'water_feature', 'location_lat', 'location_long',
+          'location_name', 'observation', 'condition', 'status')
+
+
+def make_row(index):
+    return {
+        'title': f"Benchmark report {index}",
+        'reported_at': f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}T12:00:00",
+        'water_source': random.choice(['river', 'lake', 'well', 'tap']),
+        'water_feature': 'stream',
+        'location_lat': f"{random.uniform(-60, 60):.5f}",
+        'location_long': f"{random.uniform(-170, 170):.5f}",
+        'location_name': 'Benchmark site',
+        'observation': 'Clear water, no odor',
+        'condition': random.choice(['good', 'fair', 'poor']),
+        'status': 'open',
+    }
+
+
+def to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def main():
+    bulk_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    single_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO users (username, password) VALUES (%s, 'x') RETURNING id",
+                   (f"bench-{uuid.uuid4().hex[:12]}",))
+    user_id = cursor.fetchone()[0]
+    connection.commit()
+    headers = {"Authorization": f"Bearer {create_token({'username': 'benchmark', 'id': user_id})}"}
+    client = app.test_client()
+
+    try:
+        rows = [make_row(index) for index in range(single_rows)]
+        started = time.perf_counter()
+        for row in rows:
+            response = client.post('/reports', data=row, headers=headers)
+            assert response.status_code == 201, response.get_json()
+        single_seconds = time.perf_counter() - started
+
+        body = to_csv(make_row(index) for index in range(bulk_rows))
+        started = time.perf_counter()
+        response = client.post('/reports/bulk', data=body, content_type='text/csv', headers=headers)
+        bulk_seconds = time.perf_counter() - started
+        assert response.status_code == 201 and response.get_json()["inserted"] == bulk_rows, response.get_json()
+
+        print(f"single-row path: {single_rows:7d} rows in {single_seconds:7.2f}s = {single_rows / single_seconds:10.0f} rows/s")
+        bulk_rate = bulk_rows / bulk_seconds
+        print(f"bulk path:       {bulk_rows:7d} rows in {bulk_seconds:7.2f}s = {bulk_rate:10.0f} rows/s"
+              f"{'  under target' if bulk_rate < TARGET_ROWS_PER_SECOND else ''} (target {TARGET_ROWS_PER_SECOND} rows/s)")
+    finally:
+        cursor.execute("DELETE FROM reports WHERE author = %s", (user_id,))
+        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        connection.commit()
+        connection.close()
+    sys.exit(1 if bulk_rate < TARGET_ROWS_PER_SECOND else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Latency and size of GET /reports/clusters for a browser window over each zoom level.
+#
+#   python benchmarks/generate_data.py --reset --reports 1000000 --comments 0   # once, scratch database
+#   python benchmarks/bench_clusters.py [repeats]
+#
+# The window is 1280x800 pixels centered on the first generated city. "cold" clears the tile cache
+# before each request so every tile is built from report_clusters, "warm" serves them from the
+# cache. "in box" is how many reports the window holds, the markers a map plotting every report
+# from GET /reports would need.
+import math
+import os
+import statistics
+import sys
+import time
+import psycopg2.extensions
+
+os.environ.setdefault('JWT_SECRET', 'benchmark-secret-that-is-long-enough-for-hs256')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app
+from db_helpers import connect
+from generate_data import CENTERS
+from geo import bbox_conditions
+from report_clusters import tile_cache
+
+WINDOW_WIDTH = 1280
+WINDOW_HEIGHT = 800
+ZOOMS = range(2, 17)
+
+
+def window_bbox(lat, lng, zoom):
+    # Web Mercator pixel coordinates of the center, then the window's corners back in degrees
+    world = 256 << zoom
+    center_x = (lng + 180) / 360 * world
+    center_y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * world
+
+    def latitude(y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / world))))
+
+    min_lng = max((center_x - WINDOW_WIDTH / 2) / world * 360 - 180, -180)
+    max_lng = min((center_x + WINDOW_WIDTH / 2) / world * 360 - 180, 180)
+    return min_lng, latitude(center_y + WINDOW_HEIGHT / 2), max_lng, latitude(center_y - WINDOW_HEIGHT / 2)
+
+
+def time_request(client, url, cold):
+    if cold:
+        tile_cache.clear()
+    started = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_json()
+    return elapsed * 1000, response
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    connection = connect()
+    # A plain cursor, so these counts stay out of the slow query log
+    cursor = connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+    cursor.execute("SELECT count(*) FROM reports")
+    print(f"{cursor.fetchone()[0]} reports, {WINDOW_WIDTH}x{WINDOW_HEIGHT} window, {repeats} requests each\n")
+    print(f"{'zoom':>4} {'in box':>8} {'markers':>8} {'cold p50':>9} {'warm p50':>9} {'body KB':>8}")
+
+    client = app.test_client()
+    lat, lng = CENTERS[0]
+    for zoom in ZOOMS:
+        min_lng, min_lat, max_lng, max_lat = window_bbox(lat, lng, zoom)
+        conditions, params = bbox_conditions(min_lat, min_lng, max_lat, max_lng)
+        cursor.execute(f"SELECT count(*) FROM reports r WHERE {' AND '.join(conditions)}", params)
+        in_box = cursor.fetchone()[0]
+        url = f"/reports/clusters?zoom={zoom}&bbox={min_lng:.6f},{min_lat:.6f},{max_lng:.6f},{max_lat:.6f}"
+
+        cold = statistics.median(time_request(client, url, True)[0] for _ in range(repeats))
+        warm = statistics.median(time_request(client, url, False)[0] for _ in range(repeats))
+        response = time_request(client, url, False)[1]
+        body = response.get_json()
+        markers = len(body["clusters"]) + len(body["reports"])
+        print(f"{zoom:4d} {in_box:8d} {markers:8d} {cold:9.2f} {warm:9.2f} {len(response.get_data()) / 1024:8.1f}")
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
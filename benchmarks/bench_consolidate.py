@@ -0,0 +1,144 @@
+# Benchmark for comment consolidation.
+#
+#   python benchmarks/generate_data.py --reset     # once, against a scratch database
+#   python benchmarks/bench_consolidate.py [repeats]
+#
+# First compares the original nested-scan consolidation with the id-indexed single pass in
+# db_helpers on synthetic joined rows. Then times the full GET /reports?include_comments=true
+# request both ways against the database: the joined query plus consolidation in Python, and the
+# json_agg query with AGGREGATE_COMMENTS_IN_DB. Each time covers the query, decoding, consolidation
+# and JSON encoding, and the two bodies must be identical.
+import copy
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('JWT_SECRET', 'benchmark-secret-that-is-long-enough-for-hs256')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from db_helpers import consolidate_comments_in_reports
+
+
+def nested_scan_consolidation(reports_with_comments):
+    # The implementation this benchmark was written against, kept for comparison
+    consolidated_reports = []
+    for report in reports_with_comments:
+        report_exists = False
+        for consolidated_report in consolidated_reports:
+            if report["id"] == consolidated_report["id"]:
+                report_exists = True
+                consolidated_report["comments"].append(
+                    {"comment_text": report["comment_text"],
+                     "comment_id": report["comment_id"],
+                     "comment_created_at": report["comment_created_at"],
+                     "comment_updated_at": report["comment_updated_at"],
+                     "comment_author_username": report["comment_author_username"]
+                    })
+                break
+        if not report_exists:
+            report["comments"] = []
+            if report["comment_id"] is not None:
+                report["comments"].append(
+                    {"comment_text": report["comment_text"],
+                     "comment_id": report["comment_id"],
+                     "comment_created_at": report["comment_created_at"],
+                     "comment_updated_at": report["comment_updated_at"],
+                     "comment_author_username": report["comment_author_username"]
+                    })
+            del report["comment_id"]
+            del report["comment_text"]
+            del report["comment_author_username"]
+            del report["comment_created_at"]
+            del report["comment_updated_at"]
+            consolidated_reports.append(report)
+    return consolidated_reports
+
+
+def make_report(report_id, now):
+    return {
+        "id": report_id, "report_author_id": report_id % 50, "title": f"Report {report_id}",
+        "reported_at": now, "water_source": "River", "water_feature": "Bank",
+        "location_lat": 40.0, "location_long": -74.0, "location_name": "Somewhere",
+        "observation": "Murky water with foam", "condition": "Polluted", "status": "Open",
+        "created_at": now, "updated_at": now, "image_url": None, "author_username": "user",
+    }
+
+
+def make_rows(report_count, comments_per_report):
+    # Joined rows as the LEFT JOIN returns them
+    now = datetime(2024, 1, 1)
+    rows = []
+    comment_id = 0
+    for report_id in range(1, report_count + 1):
+        comment_count = random.randint(0, comments_per_report * 2)
+        report = make_report(report_id, now)
+        if comment_count == 0:
+            rows.append(dict(report, comment_id=None, comment_text=None, comment_created_at=None,
+                             comment_updated_at=None, comment_author_username=None))
+        for _ in range(comment_count):
+            comment_id += 1
+            stamp = now + timedelta(minutes=comment_id)
+            rows.append(dict(report, comment_id=comment_id, comment_text="Saw this too", comment_created_at=stamp,
+                             comment_updated_at=stamp, comment_author_username="commenter"))
+    return rows
+
+
+def timed(function, data, repeat=3):
+    best = None
+    for _ in range(repeat):
+        payload = copy.deepcopy(data) if isinstance(data, list) and data and isinstance(data[0], dict) else data
+        started = time.perf_counter()
+        function(payload)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_listing(client, url, repeats):
+    # The response cache would answer repeats without running the handler, so each request gets
+    # its own query string, which the handler ignores
+    timings = []
+    body = None
+    for i in range(repeats):
+        started = time.perf_counter()
+        response = client.get(f"{url}&repeat={i}")
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_data()
+    return statistics.median(timings) * 1000, body
+
+
+def compare_listings(repeats):
+    import reports_blueprint
+    from app import app
+
+    client = app.test_client()
+    print(f"\n{'reports':>8} {'python ms':>10} {'json_agg ms':>12} {'body KB':>8}  GET /reports?include_comments=true")
+    for limit in (20, 50, 100):
+        url = f"/reports?limit={limit}&include_comments=true"
+        timings = {}
+        bodies = {}
+        for aggregate_in_db in (False, True):
+            reports_blueprint.AGGREGATE_COMMENTS_IN_DB = aggregate_in_db
+            timings[aggregate_in_db], bodies[aggregate_in_db] = time_listing(client, f"{url}&path={aggregate_in_db}", repeats)
+        assert bodies[False] == bodies[True], f"the two paths return different JSON for {url}"
+        print(f"{limit:>8} {timings[False]:>10.2f} {timings[True]:>12.2f} {len(bodies[False]) / 1024:>8.1f}")
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    random.seed(42)
+    print(f"{'reports':>8} {'rows':>8} {'nested (s)':>12} {'indexed (s)':>12}  synthetic rows")
+    for report_count in (100, 500, 1000, 2000, 5000):
+        rows = make_rows(report_count, comments_per_report=3)
+        nested = timed(nested_scan_consolidation, rows, repeat=1 if report_count > 2000 else 3)
+        indexed = timed(consolidate_comments_in_reports, rows)
+        print(f"{report_count:>8} {len(rows):>8} {nested:>12.4f} {indexed:>12.4f}")
+    compare_listings(repeats)
+
+
+if __name__ == '__main__':
+    main()
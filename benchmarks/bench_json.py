@@ -0,0 +1,92 @@
+# Encode time and allocations of the JSON providers on report payloads from the database.
+#
+#   python benchmarks/generate_data.py --reset     # once, against a scratch database
+#   python benchmarks/bench_json.py [repeats]
+#
+# Compares Flask's DefaultJSONProvider with json_provider.FastJSONProvider, with orjson and with its
+# standard library fallback. Each payload is what a handler passes to jsonify: RealDictRows with
+# datetimes, comments consolidated in Python. Allocations are the peak traced by tracemalloc during
+# one response, which is roughly the size of the encoded body plus the encoder's working memory.
+# "cold" is the first encode with an empty date cache, "median" is over repeats of the same payload.
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2.extras
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import json_provider
+from db_helpers import connect, consolidate_comments_in_reports
+from reports_blueprint import REPORT_COLUMNS
+
+PAYLOADS = [("20 reports", 20, False), ("100 reports with comments", 100, True), ("5000 reports", 5000, False)]
+
+
+def load_payload(cursor, count, with_comments):
+    if with_comments:
+        cursor.execute(f"""WITH page AS (SELECT * FROM reports ORDER BY reported_at DESC, id DESC LIMIT %s)
+                            SELECT {REPORT_COLUMNS}, c.id AS comment_id, c.text AS comment_text, c.created_at AS comment_created_at, c.updated_at AS comment_updated_at, u_comment.username AS comment_author_username
+                            FROM page r
+                            INNER JOIN users u_report ON r.author = u_report.id
+                            LEFT JOIN comments c ON r.id = c.report
+                            LEFT JOIN users u_comment ON c.author = u_comment.id
+                            ORDER BY r.reported_at DESC, r.id DESC, c.id""", (count,))
+        return consolidate_comments_in_reports(cursor.fetchall())
+    cursor.execute(f"""SELECT {REPORT_COLUMNS}
+                        FROM reports r
+                        INNER JOIN users u_report ON r.author = u_report.id
+                        ORDER BY r.reported_at DESC, r.id DESC
+                        LIMIT %s""", (count,))
+    return cursor.fetchall()
+
+
+def measure(provider, payload, repeats):
+    json_provider.http_date.cache_clear()
+    started = time.perf_counter()
+    provider.response(payload).get_data()
+    cold = time.perf_counter() - started
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = provider.response(payload).get_data()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    provider.response(payload).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cold * 1000, statistics.median(timings) * 1000, peak / 1024, len(body) / 1024
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    app = Flask(__name__)
+    connection = connect()
+    cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    orjson = json_provider.orjson
+    if orjson is None:
+        print("orjson isn't installed, only the standard library fallback is measured")
+
+    print(f"{'payload':28} {'provider':22} {'cold ms':>10} {'median ms':>10} {'peak KB':>10} {'body KB':>10}")
+    with app.app_context():
+        for label, count, with_comments in PAYLOADS:
+            payload = load_payload(cursor, count, with_comments)
+            baseline = None
+            for name, provider, module_orjson in (("flask default", DefaultJSONProvider(app), orjson),
+                                                   ("fast, stdlib fallback", json_provider.FastJSONProvider(app), None),
+                                                   ("fast, orjson", json_provider.FastJSONProvider(app), orjson)):
+                if name == "fast, orjson" and orjson is None:
+                    continue
+                json_provider.orjson = module_orjson
+                cold_ms, median_ms, peak_kb, body_kb = measure(provider, payload, repeats)
+                baseline = baseline or median_ms
+                print(f"{label:28} {name:22} {cold_ms:10.2f} {median_ms:10.2f} {peak_kb:10.0f} {body_kb:10.0f}   {baseline / median_ms:4.1f}x")
+            json_provider.orjson = orjson
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
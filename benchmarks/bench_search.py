@@ -0,0 +1,82 @@
+# Latency of GET /reports/search across words from rare to common, with prefixes, filters and paging.
+#
+#   python benchmarks/generate_data.py --reset --reports 1000000 --comments 0   # once, scratch database
+#   python benchmarks/bench_search.py [repeats]
+#
+# Requests go through the Flask test client with the response cache cleared before each one, so
+# every request runs its query. Each line shows how many reports the words match. Only the newest
+# SEARCH_MAX_RANKED of them are ranked. Common words and phrases are read newest first, rare ones
+# through the index, multi-word queries are the ones the planner alone got wrong.
+import os
+import sys
+import time
+
+os.environ.setdefault('JWT_SECRET', 'benchmark-secret-that-is-long-enough-for-hs256')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app
+from db_helpers import connect
+from report_search import SEARCH_CONFIG, SEARCH_MAX_RANKED, parse_search_query
+from response_cache import response_cache
+
+TARGET_MS = 50
+QUERIES = [
+    "dead fish",
+    "sewage",
+    "oil sheen",
+    "algae bloom",
+    "alg",
+    "oil sh",
+    "foam&condition=Polluted",
+    "weeds&water_source=Lake&status=Open",
+    "trash&reported_from=2024-03-01&reported_to=2024-03-31",
+    "cloudy",
+    "water",
+]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def time_request(client, url):
+    response_cache.clear()
+    started = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_json()
+    return elapsed * 1000, response.get_json()
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute("SELECT count(*) FROM reports")
+    print(f"{cursor.fetchone()[0]} reports, {repeats} requests per query, ranking the newest {SEARCH_MAX_RANKED} matches, "
+          f"target p95 < {TARGET_MS} ms\n")
+    print(f"{'query':55} {'matches':>8} {'p50':>7} {'p95':>7}")
+
+    client = app.test_client()
+    over_target = 0
+    for query in QUERIES:
+        words = query.split("&")[0]
+        cursor.execute(f"SELECT count(*) FROM reports WHERE search_vector @@ to_tsquery('{SEARCH_CONFIG}', %s)",
+                       (parse_search_query({"q": words}),))
+        matches = cursor.fetchone()[0]
+
+        first_page = f"/reports/search?limit=20&q={query}"
+        _, body = time_request(client, first_page)
+        for label, url in ((query, first_page), (f"{query}, page 2", f"{first_page}&cursor={body['next_cursor']}")):
+            if body["next_cursor"] is None and url != first_page:
+                continue
+            timings = sorted(time_request(client, url)[0] for _ in range(repeats))
+            p95 = percentile(timings, 0.95)
+            over_target += p95 >= TARGET_MS
+            print(f"{label:55} {matches:8d} {percentile(timings, 0.5):7.1f} {p95:7.1f}{'  over target' if p95 >= TARGET_MS else ''}")
+    connection.close()
+    sys.exit(1 if over_target else 0)
+
+
+if __name__ == '__main__':
+    main()
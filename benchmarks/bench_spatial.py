@@ -0,0 +1,88 @@
+# Benchmark for bounding box and radius queries over synthetic reports.
+#
+#   python benchmarks/bench_spatial.py [report_count]
+#
+# Loads report_count (default 1,000,000) synthetic reports into a scratch copy of the
+# reports table in the database configured for the app, then times viewport queries
+# through the geohash index against the same coordinate range without it.
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from db_helpers import connect
+from geo import geohash_encode, bbox_conditions, radius_to_bbox, distance_sql
+
+TABLE = "bench_spatial_reports"
+# Reports cluster around a handful of cities, like real usage
+CENTERS = [(40.71, -74.00), (34.05, -118.24), (41.88, -87.63), (29.76, -95.37), (47.61, -122.33),
+           (25.76, -80.19), (39.74, -104.99), (-23.55, -46.63), (51.51, -0.13), (35.68, 139.69)]
+
+
+def seed(cursor, report_count):
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"""CREATE TABLE {TABLE} (
+                        id SERIAL PRIMARY KEY,
+                        location_lat REAL NOT NULL,
+                        location_long REAL NOT NULL,
+                        geohash VARCHAR(12))""")
+    buffer = io.StringIO()
+    for _ in range(report_count):
+        if random.random() < 0.8:
+            center_lat, center_lng = random.choice(CENTERS)
+            lat = max(min(random.gauss(center_lat, 0.5), 90), -90)
+            lng = max(min(random.gauss(center_lng, 0.5), 180), -180)
+        else:
+            lat = random.uniform(-60, 70)
+            lng = random.uniform(-180, 180)
+        buffer.write(f"{lat}\t{lng}\t{geohash_encode(lat, lng)}\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {TABLE} (location_lat, location_long, geohash) FROM STDIN", buffer)
+    cursor.execute(f"CREATE INDEX ON {TABLE} (geohash text_pattern_ops)")
+    cursor.execute(f"ANALYZE {TABLE}")
+
+
+def time_query(cursor, sql, params, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, cursor.rowcount
+
+
+def main():
+    report_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    random.seed(7)
+    connection = connect()
+    cursor = connection.cursor()
+    print(f"Seeding {report_count} reports...")
+    seed(cursor, report_count)
+    connection.commit()
+
+    print(f"{'query':<32} {'indexed (ms)':>13} {'no index (ms)':>14} {'rows':>7}")
+    for label, radius in (("radius 1 km", 1000), ("radius 10 km", 10000), ("radius 50 km", 50000)):
+        lat, lng = CENTERS[0]
+        bbox = radius_to_bbox(lat, lng, radius)
+        conditions, params = bbox_conditions(*bbox)
+        distance, distance_params = distance_sql(lat, lng)
+        indexed_sql = (f"SELECT * FROM (SELECT r.id, {distance} AS distance_m FROM {TABLE} r WHERE {' AND '.join(conditions)}) n "
+                       "WHERE distance_m <= %s ORDER BY distance_m LIMIT 100")
+        indexed_ms, rows = time_query(cursor, indexed_sql, distance_params + params + [radius])
+        plain_sql = (f"SELECT * FROM (SELECT r.id, {distance} AS distance_m FROM {TABLE} r WHERE {' AND '.join(conditions[1:])}) n "
+                     "WHERE distance_m <= %s ORDER BY distance_m LIMIT 100")
+        plain_ms, _ = time_query(cursor, plain_sql, distance_params + params[-4:] + [radius], repeat=5)
+        print(f"{label:<32} {indexed_ms:>13.2f} {plain_ms:>14.2f} {rows:>7}")
+
+    cursor.execute(f"DROP TABLE {TABLE}")
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# Whether requests waiting on upstream services hold up report reads, for each gunicorn worker class.
+#
+#   python benchmarks/generate_data.py --reset        # once, against a scratch database
+#   python benchmarks/bench_workers.py [--duration 10] [--slow-clients 8] [--latency-ms 500]
+#
+# For each worker class, gunicorn is started with gunicorn.conf.py against the Nominatim stub and
+# the fake AI client, both answering after --latency-ms. Read clients fetch uncached report
+# listings, first on their own and then while slow clients keep geocoding and insight requests
+# waiting on the stubs. With sync workers the waits take up every worker and the reads queue
+# behind them. With gthread and gevent the reads should stay close to their baseline.
+import argparse
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from generate_data import CENTERS, PASSWORD, USERNAME_PREFIX
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def random_point(rng):
+    lat, lng = rng.choice(CENTERS)
+    return lat + rng.uniform(-0.2, 0.2), lng + rng.uniform(-0.2, 0.2)
+
+
+def read_path(rng, i):
+    # Random areas, so every read misses the response cache and runs its query and encoding
+    lat, lng = random_point(rng)
+    if i % 2:
+        return f"/reports/near?lat={lat:.4f}&lng={lng:.4f}&radius=5000"
+    return f"/reports?limit=100&bbox={lng - 0.1:.4f},{lat - 0.1:.4f},{lng + 0.1:.4f},{lat + 0.1:.4f}"
+
+
+def slow_path(rng, i, report_id):
+    # Unique lookups, so every request goes out to a stub instead of the geocode or insight caches
+    lat, lng = random_point(rng)
+    return [
+        f"/geocode/search?q={uuid.uuid4().hex}",
+        f"/geocode/reverse?lat={lat:.4f}&lng={lng:.4f}",
+        f"/ai/{report_id}?refresh=true",
+    ][i % 3]
+
+
+def start_server(worker_class, port, environment, log):
+    env = dict(os.environ, **environment, GUNICORN_WORKER_CLASS=worker_class)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py",
+                                "--bind", f"127.0.0.1:{port}", "app:app"],
+                               cwd=ROOT, env=env, stdout=log, stderr=log)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            requests.get(f"{base_url}/metrics", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    log.seek(0)
+    sys.exit(f"gunicorn ({worker_class}) didn't start:\n{log.read().decode(errors='replace')[-2000:]}")
+
+
+def sign_in(base_url):
+    response = requests.post(f"{base_url}/auth/sign-in", json={"username": f"{USERNAME_PREFIX}1", "password": PASSWORD})
+    response.raise_for_status()
+    token = response.json()["token"]
+    response = requests.get(f"{base_url}/reports?limit=1&author={USERNAME_PREFIX}1")
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {token}"}, response.json()["reports"][0]["id"]
+
+
+def run_phase(base_url, duration, read_clients, slow_clients, headers, report_id):
+    stop_at = time.monotonic() + duration
+    results = {"read": [], "slow": [], "errors": []}
+    lock = threading.Lock()
+
+    def client(kind, seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        i = 0
+        while time.monotonic() < stop_at:
+            if kind == "read":
+                url, request_headers = base_url + read_path(rng, i), {}
+            else:
+                url, request_headers = base_url + slow_path(rng, i, report_id), headers
+            started = time.perf_counter()
+            try:
+                status = session.get(url, headers=request_headers, timeout=60).status_code
+            except requests.RequestException as error:
+                status = str(error)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                results[kind].append(elapsed)
+                if status != 200:
+                    results["errors"].append(f"{status} {url}")
+            i += 1
+
+    threads = [threading.Thread(target=client, args=("read", n)) for n in range(read_clients)]
+    threads += [threading.Thread(target=client, args=("slow", 1000 + n)) for n in range(slow_clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    reads = sorted(results["read"])
+    return {
+        "read_p50": percentile(reads, 0.5),
+        "read_p95": percentile(reads, 0.95),
+        "read_rps": len(reads) / elapsed,
+        "slow_rps": len(results["slow"]) / elapsed,
+        "errors": results["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report read latency while other requests wait on upstream services")
+    parser.add_argument("--worker-classes", default="sync,gthread,gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--read-clients", type=int, default=4)
+    parser.add_argument("--slow-clients", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=500, help="how long the stubs take to answer")
+    parser.add_argument("--port", type=int, default=8091)
+    args = parser.parse_args()
+
+    # Read by stubs.py at import time
+    os.environ["STUB_LATENCY_MS"] = str(args.latency_ms)
+    from stubs import start_nominatim_stub, stub_environment
+    environment = stub_environment(start_nominatim_stub())
+    environment.update({
+        "FAKE_AI_LATENCY_MS": str(args.latency_ms),
+        "WEB_CONCURRENCY": str(args.workers),
+        "JWT_SECRET": os.getenv("JWT_SECRET", "benchmark-secret-that-is-long-enough-for-hs256"),
+    })
+
+    print(f"{args.workers} workers, {args.read_clients} read clients, {args.slow_clients} slow clients, "
+          f"stubs answer after {args.latency_ms:.0f} ms, {args.duration:.0f} s per phase\n")
+    print(f"{'worker class':14} {'phase':22} {'read p50':>9} {'read p95':>9} {'reads/s':>8} {'slow/s':>7} {'errors':>7}")
+    for worker_class in args.worker_classes.split(","):
+        if worker_class == "gevent" and (importlib.util.find_spec("gevent") is None or importlib.util.find_spec("psycogreen") is None):
+            print(f"{worker_class:14} skipped, needs `pipenv install --categories gevent`")
+            continue
+        with tempfile.TemporaryFile() as log:
+            process, base_url = start_server(worker_class, args.port, environment, log)
+            try:
+                headers, report_id = sign_in(base_url)
+                for phase, slow_clients in (("reads only", 0), (f"reads + {args.slow_clients} waiting", args.slow_clients)):
+                    result = run_phase(base_url, args.duration, args.read_clients, slow_clients, headers, report_id)
+                    print(f"{worker_class:14} {phase:22} {result['read_p50']:9.1f} {result['read_p95']:9.1f} "
+                          f"{result['read_rps']:8.1f} {result['slow_rps']:7.1f} {len(result['errors']):7d}")
+                    if result["errors"]:
+                        print(f"{'':14} first error: {result['errors'][0]}")
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
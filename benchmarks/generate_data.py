@@ -0,0 +1,141 @@
+# Synthetic users, reports and comments for the endpoint benchmarks.
+#
+#   python benchmarks/generate_data.py [--users N] [--reports N] [--comments N] [--seed N] [--reset]
+#
+# Loads into the database configured for the app, after applying the migrations. The data is
+# shaped like real usage: reports cluster around cities, a few authors write most reports, and
+# comments follow a long tail so most reports have none or a few and some have hundreds.
+# The same --seed always produces the same data. Every user's password is "benchmark".
+import argparse
+import bisect
+import io
+import itertools
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import bcrypt
+import migrate
+from db_helpers import connect
+from geo import geohash_encode
+
+PASSWORD = "benchmark"
+USERNAME_PREFIX = "bench-user-"
+# Reports cluster around a handful of cities, like real usage
+CENTERS = [(40.71, -74.00), (34.05, -118.24), (41.88, -87.63), (29.76, -95.37), (47.61, -122.33),
+           (25.76, -80.19), (39.74, -104.99), (-23.55, -46.63), (51.51, -0.13), (35.68, 139.69)]
+CONDITIONS = [("Clean", 5), ("Murky", 3), ("Polluted", 2), ("Algae bloom", 1)]
+WATER_SOURCES = ["River", "Lake", "Stream", "Pond", "Ocean", "Well"]
+WATER_FEATURES = ["Shore", "Surface", "Outflow", "Dock"]
+STATUSES = [("Open", 6), ("Investigating", 2), ("Resolved", 3)]
+# Report text is stitched together from these, so search has a realistic spread of common and rare words
+TITLES = [("Water check", 20), ("Cloudy water", 8), ("Algae bloom", 5), ("Trash in the water", 5), ("Foam on the surface", 3),
+          ("Oil sheen", 2), ("Dead fish", 1), ("Sewage smell", 1), ("Low water level", 2), ("Invasive weeds", 1)]
+DESCRIPTIONS = ["Water looks clear", "Water looks cloudy", "Green scum", "Brown murky water", "Rainbow film",
+                "White foam", "Plastic bottles and bags", "Several dead fish", "Strong chemical odor", "Thick mats of weeds"]
+DETAILS = ["near the shore", "along the bank", "around the dock", "at the outflow pipe", "after heavy rain",
+           "spreading downstream", "covering the surface", "in shallow water", "by the boat ramp", "under the bridge"]
+PLACES = ["Riverside Park", "North Beach", "Mill Creek", "Harbor Point", "Lakeview Trail", "Old Quarry",
+          "Cedar Marsh", "Fox Hollow", "Willow Bend", "Granite Falls"]
+# Exponent of the Zipf-like weights for picking authors and commented reports, higher is more skewed
+SKEW = 1.1
+
+
+def zipf_picker(count, rng):
+    # Item n (1-based) is picked with weight 1 / n^SKEW, over a shuffled order so the hot items are spread out
+    items = list(range(count))
+    rng.shuffle(items)
+    cumulative = list(itertools.accumulate(1 / (rank + 1) ** SKEW for rank in range(count)))
+    total = cumulative[-1]
+    return lambda: items[bisect.bisect_left(cumulative, rng.random() * total)]
+
+
+def weighted(choices, rng):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def random_location(rng):
+    if rng.random() < 0.85:
+        center_lat, center_lng = rng.choice(CENTERS)
+        return max(min(rng.gauss(center_lat, 0.3), 90), -90), max(min(rng.gauss(center_lng, 0.3), 180), -180)
+    return rng.uniform(-60, 70), rng.uniform(-180, 180)
+
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join("\\N" if value is None else str(value) for value in row) + "\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def generate(connection, user_count, report_count, comment_count, seed):
+    rng = random.Random(seed)
+    cursor = connection.cursor()
+    now = datetime(2025, 1, 1)
+
+    # One hash for everyone, so signing in as any generated user works without hashing thousands of passwords
+    hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    copy_rows(cursor, "users", ("username", "password"),
+              ((f"{USERNAME_PREFIX}{n}", hashed) for n in range(1, user_count + 1)))
+    cursor.execute("SELECT id FROM users WHERE username LIKE %s ORDER BY id", (USERNAME_PREFIX + "%",))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    pick_author = zipf_picker(len(user_ids), rng)
+
+    def reports():
+        for n in range(report_count):
+            lat, lng = random_location(rng)
+            reported_at = now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600))
+            yield (user_ids[pick_author()], weighted(TITLES, rng), reported_at, rng.choice(WATER_SOURCES),
+                   rng.choice(WATER_FEATURES), lat, lng, rng.choice(PLACES), f"{rng.choice(DESCRIPTIONS)} {rng.choice(DETAILS)}",
+                   weighted(CONDITIONS, rng), weighted(STATUSES, rng), reported_at, reported_at, geohash_encode(lat, lng))
+
+    copy_rows(cursor, "reports", ("author", "title", "reported_at", "water_source", "water_feature", "location_lat",
+                                  "location_long", "location_name", "observation", "condition", "status",
+                                  "created_at", "updated_at", "geohash"), reports())
+    cursor.execute("SELECT id, reported_at FROM reports ORDER BY id")
+    report_rows = cursor.fetchall()
+    pick_report = zipf_picker(len(report_rows), rng)
+
+    def comments():
+        for n in range(comment_count):
+            report_id, reported_at = report_rows[pick_report()]
+            created_at = reported_at + timedelta(seconds=rng.randint(60, 30 * 24 * 3600))
+            yield (user_ids[pick_author()], report_id, f"Comment {n}", created_at, created_at)
+
+    copy_rows(cursor, "comments", ("author", "report", "text", "created_at", "updated_at"), comments())
+    connection.commit()
+    cursor.execute("ANALYZE")
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load synthetic benchmark data")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--reports", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=300000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="delete every user, report and comment first")
+    args = parser.parse_args()
+
+    connection = connect()
+    migrate.migrate(connection)
+    cursor = connection.cursor()
+    if args.reset:
+        cursor.execute("TRUNCATE users, reports, comments RESTART IDENTITY CASCADE")
+        connection.commit()
+    cursor.execute("SELECT count(*) FROM reports")
+    if cursor.fetchone()[0]:
+        sys.exit("The database already has reports, pass --reset to replace them")
+
+    print(f"Generating {args.users} users, {args.reports} reports and {args.comments} comments (seed {args.seed})")
+    generate(connection, args.users, args.reports, args.comments, args.seed)
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
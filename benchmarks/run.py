@@ -0,0 +1,372 @@
+# Endpoint benchmark suite: latency percentiles, throughput and peak RSS for every route.
+#
+#   python benchmarks/generate_data.py --reset        # once, against a scratch database
+#   python benchmarks/run.py [--requests N] [--concurrency N] [--output FILE] [--compare FILE]
+#
+# By default the app runs in-process behind the Flask test client with the external services
+# replaced by benchmarks/stubs.py. To measure a real server, start the stubs and gunicorn with
+# the environment stubs.py prints, then pass --base-url http://127.0.0.1:8000 and, for RSS,
+# --server-pid with the gunicorn master's pid.
+#
+# Every route registered on the app must have a scenario below, a new route without one fails
+# the run. Results are written as JSON, and --compare exits non-zero when an endpoint's p95
+# is more than --max-regression slower than in the given earlier run.
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+os.environ.setdefault('JWT_SECRET', 'benchmark-secret-that-is-long-enough-for-hs256')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from generate_data import CENTERS, PASSWORD, USERNAME_PREFIX, random_location
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# Smallest p95 increase treated as a regression, below this it's timer noise
+MIN_REGRESSION_MS = 1.0
+# A 1x1 PNG, enough for the uploader to store something
+TINY_PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                         "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082")
+
+
+def spec(method, path, token=None, form=None, files=None, json_body=None, body=None, content_type=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    return {"method": method, "path": path, "headers": headers, "form": form, "files": files,
+            "json": json_body, "body": body, "content_type": content_type}
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, request):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        kwargs = {"method": request["method"], "headers": request["headers"]}
+        if request["json"] is not None:
+            kwargs["json"] = request["json"]
+        elif request["form"] is not None:
+            data = dict(request["form"])
+            for field, (filename, content) in (request["files"] or {}).items():
+                data[field] = (io.BytesIO(content), filename)
+            kwargs["data"] = data
+        elif request["body"] is not None:
+            kwargs["data"] = request["body"]
+            kwargs["content_type"] = request["content_type"]
+        response = client.open(request["path"], **kwargs)
+        body = response.get_data()
+        response.close()
+        return response.status_code, body
+
+    def peak_rss_mb(self):
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class HttpTransport:
+    def __init__(self, base_url, server_pid=None):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip("/")
+        self.server_pid = server_pid
+        self.local = threading.local()
+
+    def send(self, request):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        headers = dict(request["headers"])
+        kwargs = {}
+        if request["json"] is not None:
+            kwargs["json"] = request["json"]
+        elif request["form"] is not None:
+            kwargs["data"] = request["form"]
+            kwargs["files"] = request["files"]
+        elif request["body"] is not None:
+            kwargs["data"] = request["body"]
+            headers["Content-Type"] = request["content_type"]
+        response = session.request(request["method"], self.base_url + request["path"], headers=headers, **kwargs)
+        return response.status_code, response.content
+
+    def peak_rss_mb(self):
+        # Sum of the peak RSS of the gunicorn master and its workers
+        if self.server_pid is None:
+            return None
+        total_kb = 0
+        pids = [self.server_pid]
+        while pids:
+            pid = pids.pop()
+            try:
+                with open(f"/proc/{pid}/status") as status:
+                    total_kb += next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+                with open(f"/proc/{pid}/task/{pid}/children") as children:
+                    pids.extend(int(child) for child in children.read().split())
+            except (OSError, StopIteration):
+                continue
+        return total_kb / 1024
+
+
+def report_form(rng, n):
+    # Dated after the generated data, so the reports a run creates don't pile into the date range scenarios
+    lat, lng = random_location(rng)
+    return {"title": f"Benchmark report {n}", "reported_at": "2025-06-01T12:00:00", "water_source": "River",
+            "water_feature": "Shore", "location_lat": f"{lat:.5f}", "location_long": f"{lng:.5f}",
+            "location_name": "Benchmark site", "observation": "Water looks clear", "condition": "Clean", "status": "Open"}
+
+
+def bulk_body(rng, rows):
+    lines = ["title,reported_at,location_lat,location_long,observation,condition"]
+    for n in range(rows):
+        lat, lng = random_location(rng)
+        lines.append(f"Bulk {n},2025-06-01T12:00:00,{lat:.5f},{lng:.5f},Water looks clear,Clean")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def expect(result, name):
+    status, body = result
+    if status >= 400:
+        sys.exit(f"Setup failed at {name}: {status} {body[:200]!r}")
+    return json.loads(body)
+
+
+def setup(transport, count, rng):
+    # Untimed: a user of our own plus pools of reports and comments it owns, so updates and deletes
+    # never collide, and a sample of existing report ids to read and comment on
+    username = f"bench-run-{uuid.uuid4().hex[:10]}"
+    token = expect(transport.send(spec("POST", "/auth/sign-up", json_body={"username": username, "password": PASSWORD})), "sign up")["token"]
+    ctx = {"username": username, "token": token, "rng": rng}
+
+    own_reports = [expect(transport.send(spec("POST", "/reports", token, form=report_form(rng, n))), "create report")["id"]
+                   for n in range(count + 10)]
+    ctx["own_reports"], ctx["doomed_reports"] = own_reports[:10], own_reports[10:]
+
+    own_comments = [expect(transport.send(spec("POST", f"/reports/{own_reports[0]}/comments", token,
+                                               json_body={"text": f"Benchmark comment {n}"})), "create comment")["comment_id"]
+                    for n in range(count + 10)]
+    ctx["own_comments"], ctx["doomed_comments"] = own_comments[:10], own_comments[10:]
+
+    ctx["job_id"] = expect(transport.send(spec("POST", f"/ai/{own_reports[0]}/jobs", token)), "enqueue job")["job_id"]
+    listed = expect(transport.send(spec("GET", "/reports?limit=100")), "list reports")["reports"]
+    ctx["report_ids"] = [report["id"] for report in listed]
+    return ctx
+
+
+def near_point(rng):
+    lat, lng = rng.choice(CENTERS)
+    return lat + rng.uniform(-0.2, 0.2), lng + rng.uniform(-0.2, 0.2)
+
+
+def bbox_around(rng, half_size=0.1):
+    lat, lng = near_point(rng)
+    return f"{lng - half_size:.4f},{lat - half_size:.4f},{lng + half_size:.4f},{lat + half_size:.4f}"
+
+
+# Endpoint name -> function building the i-th request. Reads rotate through a few query shapes so
+# the numbers mix response cache hits and misses, like real traffic does.
+SCENARIOS = {
+    "authentication_blueprint.sign_up": lambda ctx, i: spec(
+        "POST", "/auth/sign-up", json_body={"username": f"{ctx['username']}-{i}", "password": PASSWORD}),
+    "authentication_blueprint.sign_in": lambda ctx, i: spec(
+        "POST", "/auth/sign-in", json_body={"username": f"{USERNAME_PREFIX}{i % 50 + 1}", "password": PASSWORD}),
+    "reports_blueprint.create_report": lambda ctx, i: spec(
+        "POST", "/reports", ctx["token"], form=report_form(ctx["rng"], i),
+        files={"image_url": ("bench.png", TINY_PNG)} if i % 10 == 0 else None),
+    "reports_blueprint.bulk_create_reports": lambda ctx, i: spec(
+        "POST", "/reports/bulk", ctx["token"], body=bulk_body(ctx["rng"], 100), content_type="text/csv"),
+    "reports_blueprint.reports_index": lambda ctx, i: spec("GET", [
+        "/reports?limit=20",
+        "/reports?limit=20&condition=Polluted&status=Open&include_comments=true",
+        f"/reports?limit=20&author={USERNAME_PREFIX}{i % 20 + 1}",
+        f"/reports?limit=50&bbox={bbox_around(ctx['rng'])}",
+        f"/reports?limit=20&reported_from=2024-{i % 12 + 1:02d}-01&reported_to=2024-{i % 12 + 1:02d}-07",
+    ][i % 5]),
+    "reports_blueprint.reports_near": lambda ctx, i: spec(
+        "GET", "/reports/near?lat={:.4f}&lng={:.4f}&radius=5000".format(*near_point(ctx["rng"]))),
+    "reports_blueprint.search_reports": lambda ctx, i: spec("GET", "/reports/search?limit=20&q=" + [
+        "algae bloom", "oil sh", "dead fish", "sewage&condition=Polluted", "foam&water_source=Lake",
+    ][i % 5]),
+    "reports_blueprint.export_reports_route": lambda ctx, i: spec(
+        "GET", f"/reports/export?format={['csv', 'ndjson', 'geojson'][i % 3]}&include_comments=true"
+               f"&reported_from=2024-{i % 12 + 1:02d}-01&reported_to=2024-{i % 12 + 1:02d}-01"),
+    "reports_blueprint.reports_stats": lambda ctx, i: spec("GET", [
+        "/reports/stats",
+        "/reports/stats?interval=week&condition=Polluted",
+        "/reports/stats?interval=month&grid=3",
+        f"/reports/stats?reported_from=2024-{i % 12 + 1:02d}-01&reported_to=2024-{i % 12 + 1:02d}-28",
+    ][i % 4]),
+    "reports_blueprint.reports_clusters": lambda ctx, i: spec("GET", [
+        "/reports/clusters?zoom=2&bbox=-180,-85,180,85",
+        f"/reports/clusters?zoom=9&bbox={bbox_around(ctx['rng'], 1)}",
+        f"/reports/clusters?zoom=12&bbox={bbox_around(ctx['rng'])}",
+        f"/reports/clusters?zoom=16&bbox={bbox_around(ctx['rng'], 0.01)}",
+    ][i % 4]),
+    "reports_blueprint.reports_cache_stats": lambda ctx, i: spec("GET", "/reports/cache-stats"),
+    "reports_blueprint.show_report": lambda ctx, i: spec("GET", f"/reports/{ctx['rng'].choice(ctx['report_ids'])}"),
+    "reports_blueprint.update_report": lambda ctx, i: spec(
+        "PUT", f"/reports/{ctx['own_reports'][i % 10]}", ctx["token"], form=report_form(ctx["rng"], i)),
+    "reports_blueprint.delete_report": lambda ctx, i: spec("DELETE", f"/reports/{ctx['doomed_reports'][i]}", ctx["token"]),
+    "comments_blueprint.comments_index": lambda ctx, i: spec(
+        "GET", f"/reports/{ctx['rng'].choice(ctx['report_ids'])}/comments?limit=20"),
+    "comments_blueprint.create_comment": lambda ctx, i: spec(
+        "POST", f"/reports/{ctx['rng'].choice(ctx['report_ids'])}/comments", ctx["token"], json_body={"text": f"Comment {i}"}),
+    "comments_blueprint.update_comment": lambda ctx, i: spec(
+        "PUT", f"/reports/{ctx['own_reports'][0]}/comments/{ctx['own_comments'][i % 10]}", ctx["token"],
+        json_body={"text": f"Edited {i}", "updated_at": "2024-06-02T12:00:00"}),
+    "comments_blueprint.delete_comment": lambda ctx, i: spec(
+        "DELETE", f"/reports/{ctx['own_reports'][0]}/comments/{ctx['doomed_comments'][i]}", ctx["token"]),
+    "ai_blueprint.generate_insight_for_report": lambda ctx, i: spec(
+        "GET", f"/ai/{ctx['own_reports'][i % 10]}" + ("?refresh=true" if i % 10 == 0 else ""), ctx["token"]),
+    "ai_blueprint.enqueue_insight_job": lambda ctx, i: spec("POST", f"/ai/{ctx['own_reports'][i % 10]}/jobs", ctx["token"]),
+    "ai_blueprint.show_insight_job": lambda ctx, i: spec("GET", f"/ai/jobs/{ctx['job_id']}", ctx["token"]),
+    "ai_blueprint.insight_job_stats": lambda ctx, i: spec("GET", "/ai/jobs/stats"),
+    "geocoding_blueprint.reverse_geocode": lambda ctx, i: spec(
+        "GET", "/geocode/reverse?lat={:.4f}&lng={:.4f}".format(*near_point(ctx["rng"]))),
+    "geocoding_blueprint.forward_geocode": lambda ctx, i: spec(
+        "GET", f"/geocode/search?q={['Central Park', 'Lake Michigan', 'Hudson River', 'Puget Sound'][i % 4]} {i % 25}"),
+    "geocoding_blueprint.geocode_cache_stats": lambda ctx, i: spec("GET", "/geocode/cache-stats"),
+    "metrics": lambda ctx, i: spec("GET", "/metrics"),
+}
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_endpoint(transport, requests_to_send, concurrency):
+    latencies = []
+    errors = []
+
+    def timed(request):
+        started = time.perf_counter()
+        status, body = transport.send(request)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status >= 400:
+            errors.append(f"{status} {request['method']} {request['path']}: {body[:120]!r}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, requests_to_send))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    peak_rss_mb = transport.peak_rss_mb()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "peak_rss_mb": None if peak_rss_mb is None else round(peak_rss_mb, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_revision')}, {baseline['meta']['started_at']})")
+    print(f"{'endpoint':<45} {'p95 before':>11} {'p95 now':>10} {'change':>8}")
+    regressions = []
+    for name, stats in results["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        marker = ""
+        if change > max_regression and stats["p95_ms"] - before["p95_ms"] > MIN_REGRESSION_MS:
+            regressions.append(name)
+            marker = "  REGRESSION"
+        print(f"{name:<45} {before['p95_ms']:>11.2f} {stats['p95_ms']:>10.2f} {change:>+8.0%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every API endpoint")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--endpoints", help="comma separated endpoint names to run, default all")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="gunicorn master pid, for RSS with --base-url")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file, default benchmarks/results/<timestamp>.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed p95 slowdown, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    if args.base_url:
+        transport = HttpTransport(args.base_url, args.server_pid)
+        endpoints = list(SCENARIOS)
+    else:
+        from stubs import install_stubs
+        install_stubs()
+        from app import app
+        transport = TestClientTransport(app)
+        endpoints = [rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != "static"]
+        missing = [endpoint for endpoint in endpoints if endpoint not in SCENARIOS]
+        if missing:
+            sys.exit(f"No benchmark scenario for: {', '.join(missing)}")
+    if args.endpoints:
+        endpoints = [endpoint for endpoint in endpoints if endpoint in args.endpoints.split(",")]
+
+    rng = random.Random(args.seed)
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    ctx = setup(transport, args.requests, rng)
+
+    results = {
+        "meta": {
+            "started_at": started_at,
+            "git_revision": git_revision(),
+            "mode": "http" if args.base_url else "test_client",
+            "base_url": args.base_url,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "python": sys.version.split()[0],
+        },
+        "endpoints": {},
+    }
+    print(f"{'endpoint':<45} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'rss MB':>7} {'errors':>6}")
+    for endpoint in endpoints:
+        requests_to_send = [SCENARIOS[endpoint](ctx, i) for i in range(args.requests)]
+        stats = run_endpoint(transport, requests_to_send, args.concurrency)
+        results["endpoints"][endpoint] = stats
+        print(f"{endpoint:<45} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+              f"{stats['throughput_rps']:>8.1f} {stats['peak_rss_mb'] or 0:>7.1f} {stats['errors']:>6}")
+        if stats["first_error"]:
+            print(f"    first error: {stats['first_error']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, started_at.replace(":", "") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare and compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
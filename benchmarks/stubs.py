@@ -0,0 +1,85 @@
+# Local stand-ins for the external services, so benchmarks measure this app and not the network.
+#
+#   python benchmarks/stubs.py [port]
+#
+# Run directly, it serves the Nominatim stub in the foreground and prints the environment to
+# start gunicorn with. benchmarks/run.py calls install_stubs() itself for in-process runs.
+#   Cloudinary -> IMAGE_UPLOADER=local, images are written to a temporary directory
+#   Gemini     -> AI_CLIENT=fake, ai_client.FakeInsightClient
+#   Nominatim  -> a local HTTP server answering /reverse and /search with canned results
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Added to every stub response, roughly what a nearby upstream costs
+STUB_LATENCY_MS = float(os.getenv('STUB_LATENCY_MS', '20'))
+
+
+class NominatimStubHandler(BaseHTTPRequestHandler):
+    latency_ms = STUB_LATENCY_MS
+    # (arrival time, path) of every request, for tests counting upstream calls
+    received = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.received.append((time.monotonic(), self.path))
+        time.sleep(self.latency_ms / 1000)
+        if url.path == "/reverse":
+            body = {"lat": params.get("lat"), "lon": params.get("lon"), "display_name": "Stub Street, Stub City",
+                    "address": {"road": "Stub Street", "city": "Stub City", "country": "Stubland"}}
+        elif url.path == "/search":
+            body = [{"lat": "40.71", "lon": "-74.00", "display_name": f"{params.get('q', '')}, Stub City"}]
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_nominatim_stub(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), NominatimStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def stub_environment(nominatim_url):
+    return {
+        "AI_CLIENT": "fake",
+        "IMAGE_UPLOADER": "local",
+        "IMAGE_UPLOAD_DIR": tempfile.mkdtemp(prefix="hydrowave-bench-uploads-"),
+        "NOMINATIM_BASE_URL": nominatim_url,
+        # The real rate limit protects the public Nominatim server, the stub doesn't need it
+        "NOMINATIM_RATE": "100000",
+        "NOMINATIM_BURST": "100000",
+    }
+
+
+def install_stubs():
+    # Must run before app (and so the clients) is imported, they read their settings at import time
+    os.environ.update(stub_environment(start_nominatim_stub()))
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8089
+    nominatim_url = start_nominatim_stub(port)
+    for key, value in stub_environment(nominatim_url).items():
+        print(f"export {key}={value}")
+    print("# Nominatim stub running, Ctrl-C to stop", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from geo import geohash_encode
+
+# Rows are written to Postgres with COPY in batches of this size, all inside one transaction
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '5000'))
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', '100000'))
+# Per-row errors reported back to the client, beyond this only the count grows
+BULK_MAX_ERRORS = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+CSV_MIMETYPES = ('text/csv',)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Same fields create_report reads from its form, with the column limits from the migrations
+REQUIRED_FIELDS = ('reported_at', 'location_lat', 'location_long', 'observation', 'condition')
+TEXT_LIMITS = {
+    'title': 255,
+    'water_source': 50,
+    'water_feature': 50,
+    'observation': 500,
+    'condition': 50,
+    'status': 50,
+    'location_name': None,
+}
+COPY_COLUMNS = ('author', 'title', 'reported_at', 'water_source', 'water_feature', 'location_lat', 'location_long',
+                'location_name', 'observation', 'condition', 'status', 'created_at', 'updated_at', 'geohash')
+
+
+def iter_lines(stream):
+    # Iterating the request stream directly reads it a byte at a time, so split fixed size chunks instead
+    pending = b""
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8') + "\n"
+    if pending:
+        yield pending.decode('utf-8')
+
+
+def read_rows(stream, mimetype):
+    # Yields (row_number, dict or error) without reading the whole body into memory
+    lines = iter_lines(stream)
+    if mimetype in CSV_MIMETYPES:
+        for row_number, row in enumerate(csv.DictReader(lines), start=1):
+            yield row_number, row
+    elif mimetype in NDJSON_MIMETYPES:
+        row_number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield row_number, ValueError("Invalid JSON")
+                continue
+            if not isinstance(row, dict):
+                yield row_number, ValueError("Each line must be a JSON object")
+                continue
+            yield row_number, row
+    else:
+        raise ValueError("Send text/csv or application/x-ndjson")
+
+
+def validate_row(row, author_id, now):
+    # Returns the COPY tuple for a valid row, raises ValueError naming the first problem otherwise
+    values = {}
+    for field, limit in TEXT_LIMITS.items():
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        if value is not None and value.strip() == "":
+            value = None
+        if limit is not None and value is not None and len(value) > limit:
+            raise ValueError(f"{field} is longer than {limit} characters")
+        values[field] = value
+
+    # Text fields are checked after cleaning, so whitespace alone counts as missing
+    for field in REQUIRED_FIELDS:
+        value = values[field] if field in values else row.get(field)
+        if value is None or (isinstance(value, str) and value.strip() == ""):
+            raise ValueError(f"{field} is required")
+
+    try:
+        reported_at = datetime.fromisoformat(str(row['reported_at']))
+    except ValueError:
+        raise ValueError("reported_at must be an ISO 8601 timestamp")
+    try:
+        location_lat = float(row['location_lat'])
+        location_long = float(row['location_long'])
+    except (TypeError, ValueError):
+        raise ValueError("location_lat and location_long must be numbers")
+    if not (-90 <= location_lat <= 90 and -180 <= location_long <= 180):
+        raise ValueError("location_lat or location_long is out of range")
+
+    return (author_id, values['title'], reported_at.isoformat(), values['water_source'], values['water_feature'],
+            location_lat, location_long, values['location_name'], values['observation'], values['condition'],
+            values['status'], now, now, geohash_encode(location_lat, location_long))
+
+
+def create_staging_table(cursor):
+    # Same column types as reports, without its indexes, triggers or generated search vector. Dropped
+    # with the transaction, whether it commits or rolls back.
+    cursor.execute(f"CREATE TEMP TABLE bulk_reports ON COMMIT DROP AS SELECT {', '.join(COPY_COLUMNS)} FROM reports WITH NO DATA")
+
+
+def copy_batch(cursor, batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in batch:
+        # COPY's CSV format reads an unquoted empty field as NULL
+        writer.writerow(['' if value is None else value for value in values])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY bulk_reports ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def ingest_reports(cursor, stream, mimetype, author_id):
+    # Batches are copied into a staging table and moved into reports with one INSERT at the end. The
+    # statement triggers on reports then apply one stats and clusters delta for the whole upload,
+    # instead of one per batch that upserts mostly the same buckets again.
+    create_staging_table(cursor)
+    now = datetime.utcnow().isoformat()
+    inserted = 0
+    error_count = 0
+    errors = []
+    batch = []
+    for row_number, row in read_rows(stream, mimetype):
+        if row_number > BULK_MAX_ROWS:
+            raise ValueError(f"A bulk upload is limited to {BULK_MAX_ROWS} rows")
+        try:
+            if isinstance(row, Exception):
+                raise row
+            batch.append(validate_row(row, author_id, now))
+        except ValueError as error:
+            error_count += 1
+            if len(errors) < BULK_MAX_ERRORS:
+                errors.append({"row": row_number, "error": str(error)})
+            continue
+        if len(batch) >= BULK_BATCH_SIZE:
+            copy_batch(cursor, batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        copy_batch(cursor, batch)
+        inserted += len(batch)
+    if inserted:
+        columns = ', '.join(COPY_COLUMNS)
+        cursor.execute(f"INSERT INTO reports ({columns}) SELECT {columns} FROM bulk_reports")
+    return {"inserted": inserted, "error_count": error_count, "errors": errors}
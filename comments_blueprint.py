@@ -1,14 +1,61 @@
 from flask import Blueprint, jsonify, request, g
-from db_helpers import get_db_connection
+from db_helpers import get_db_connection, query_budget
+from http_caching import versioned_read
 import psycopg2.extras
 from auth_middleware import token_required
+from report_filters import parse_limit
 from datetime import datetime
 
 comments_blueprint = Blueprint('comments_blueprint', __name__)
 
+# Read a report's comments - GET /reports/<report_id>/comments?limit=&cursor=
+# Oldest first, pages by keyset on the comment id, pass next_cursor back as cursor for the next page
+@comments_blueprint.route('/reports/<report_id>/comments', methods=['GET'])
+@query_budget(2)
+@versioned_read
+def comments_index(report_id):
+    try:
+        limit = parse_limit(request.args)
+        cursor_value = request.args.get("cursor", "0")
+        try:
+            after_id = int(cursor_value)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+
+        connection = get_db_connection()
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # Starting from the report tells a missing report (no rows) apart from one without comments (one empty row)
+        cursor.execute("""SELECT c.id AS comment_id,
+                            c.author AS comment_author_id,
+                            c.text AS comment_text,
+                            c.created_at AS comment_created_at,
+                            c.updated_at AS comment_updated_at,
+                            u_comment.username AS comment_author_username
+                        FROM reports r
+                        LEFT JOIN LATERAL (
+                            SELECT * FROM comments WHERE report = r.id AND id > %s ORDER BY id LIMIT %s
+                        ) c ON true
+                        LEFT JOIN users u_comment ON c.author = u_comment.id
+                        WHERE r.id = %s
+                        ORDER BY c.id""",
+                       (after_id, limit, report_id))
+        rows = cursor.fetchall()
+        connection.commit()
+        if not rows:
+            return jsonify({"error": "Report not found"}), 404
+
+        comments = [row for row in rows if row["comment_id"] is not None]
+        next_cursor = str(comments[-1]["comment_id"]) if len(comments) == limit else None
+        return jsonify({"comments": comments, "next_cursor": next_cursor}), 200
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
+
 # Create a comment - POST /reports/<report_id>/comments
 @comments_blueprint.route('/reports/<report_id>/comments', methods=['POST'])
 @token_required
+@query_budget(1)
 def create_comment(report_id):
     try:
         new_comment_data = request.get_json()
@@ -17,28 +64,26 @@ def create_comment(report_id):
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        cursor.execute("""
-                        INSERT INTO comments (report, author, text, created_at, updated_at)
-                        VALUES (%s, %s, %s, %s, %s)
-                        RETURNING id
-                        """,
-                       (report_id, new_comment_data['author'],
-                        new_comment_data['text'], datetime.utcnow(), datetime.utcnow())
-                       )
-        comment_id = cursor.fetchone()["id"]
-        cursor.execute("""SELECT c.id AS comment_id, 
-                            c.author AS comment_author_id, 
+        # Insert the comment and return it joined with its author in the same round trip
+        cursor.execute("""WITH inserted AS (
+                            INSERT INTO comments (report, author, text, created_at, updated_at)
+                            VALUES (%s, %s, %s, %s, %s)
+                            RETURNING *
+                        )
+                        SELECT c.id AS comment_id,
+                            c.author AS comment_author_id,
                             c.text AS comment_text,
                             c.created_at AS comment_created_at,
-                            c.updated_at AS comment_updated_at,   
+                            c.updated_at AS comment_updated_at,
                             u_comment.username AS comment_author_username
-                        FROM comments c
+                        FROM inserted c
                         JOIN users u_comment ON c.author = u_comment.id
-                        WHERE c.id = %s
-                       """, (comment_id,))
+                        """,
+                       (report_id, new_comment_data['author'],
+                        new_comment_data['text'], datetime.utcnow(), datetime.utcnow())
+                       )
         created_comment = cursor.fetchone()
         connection.commit()
-        connection.close()
         return jsonify(created_comment), 201
     except Exception as error:
         return jsonify({"error": str(error)}), 500
@@ -46,22 +91,30 @@ def create_comment(report_id):
 # Update a comment - PUT /reports/<report_id>/comments/<comment_id>
 @comments_blueprint.route('/reports/<report_id>/comments/<comment_id>', methods=['PUT'])
 @token_required
+@query_budget(1)
 def update_comment(report_id, comment_id):
     try:
         updated_comment_data = request.json
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("SELECT * FROM comments WHERE id = %s", (comment_id,))
-        comment_to_update = cursor.fetchone()
-        if comment_to_update is None:
+        # Ownership check and update in one statement, an empty result means the comment doesn't exist
+        cursor.execute("""WITH target AS (
+                            SELECT id, author FROM comments WHERE id = %s
+                        ),
+                        updated AS (
+                            UPDATE comments c SET text = %s, updated_at = %s
+                            FROM target t
+                            WHERE c.id = t.id AND t.author = %s
+                            RETURNING c.*
+                        )
+                        SELECT updated.* FROM target LEFT JOIN updated ON updated.id = target.id""",
+                       (comment_id, updated_comment_data["text"], updated_comment_data["updated_at"], g.user["id"]))
+        updated_comment = cursor.fetchone()
+        if updated_comment is None:
             return jsonify({"error": "Comment not found"}), 404
-        if comment_to_update["author"] != g.user["id"]:
+        if updated_comment["id"] is None:
             return jsonify({"error": "Unauthorized"}), 401
-        cursor.execute("UPDATE comments SET text = %s, updated_at = %s WHERE id = %s RETURNING *",
-                       (updated_comment_data["text"], updated_comment_data["updated_at"], comment_id))
-        updated_comment = cursor.fetchone()
         connection.commit()
-        connection.close()
         return jsonify({"comment": updated_comment}), 201
     except Exception as error:
         return jsonify({"error": str(error)}), 500
@@ -69,31 +122,34 @@ def update_comment(report_id, comment_id):
 # Delete a comment - DELETE /reports/<report_id>/comments/<comment_id>
 @comments_blueprint.route('/reports/<report_id>/comments/<comment_id>', methods=['DELETE'])
 @token_required
+@query_budget(1)
 def delete_comment(report_id, comment_id):
     try:
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        # Get the comment
-        cursor.execute("SELECT * FROM comments WHERE id = %s", (comment_id,))
+        # Allow delete if: comment author OR report author
+        # Both authors are looked up and checked by the DELETE itself
+        cursor.execute("""WITH target AS (
+                            SELECT c.id, c.author AS comment_author, r.author AS report_author
+                            FROM comments c
+                            LEFT JOIN reports r ON r.id = %s
+                            WHERE c.id = %s
+                        ),
+                        deleted AS (
+                            DELETE FROM comments c USING target t
+                            WHERE c.id = t.id AND (t.comment_author = %s OR t.report_author = %s)
+                            RETURNING c.id
+                        )
+                        SELECT target.id, EXISTS (SELECT 1 FROM deleted) AS deleted FROM target""",
+                       (report_id, comment_id, g.user["id"], g.user["id"]))
         comment_to_delete = cursor.fetchone()
         if comment_to_delete is None:
             return jsonify({"error": "Comment not found"}), 404
-
-        # Get the report
-        cursor.execute("SELECT * FROM reports WHERE id = %s", (report_id,))
-        report = cursor.fetchone()
-
-        # Allow delete if: comment author OR report author
-        if (
-            comment_to_delete["author"] != g.user["id"] and
-            report["author"] != g.user["id"]
-        ):
+        if not comment_to_delete["deleted"]:
             return jsonify({"error": "Unauthorized"}), 401
 
-        cursor.execute("DELETE FROM comments WHERE id = %s", (comment_id,))
         connection.commit()
-        connection.close()
 
         return jsonify({"message": "Comment deleted successfully"}), 200
 
@@ -1,58 +1,338 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+from flask import g, has_app_context, current_app, request
+from instrumentation import timed, timed_query
 
-def get_db_connection():
+# Pool settings, configurable per deployment. Each worker opens DB_POOL_MIN_SIZE connections on first use
+# and keeps at least that many open.
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+# Idle connections older than this are pinged before being handed out
+POOL_HEALTHCHECK_AFTER = float(os.getenv('DB_POOL_HEALTHCHECK_AFTER', '30'))
+# Idle connections above the minimum size are closed after this long
+POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def count_query(query=None, vars=None):
+    # Background jobs run outside a request and aren't counted
+    if has_app_context():
+        g.db_query_count = g.get('db_query_count', 0) + 1
+        # Set by tooling such as tests/test_query_plans.py to capture every statement a request issues
+        query_log = g.get('db_query_log')
+        if query_log is not None:
+            query_log.append((query, vars))
+
+
+@contextmanager
+def without_wait_callback():
+    # psycopg2 refuses COPY while a wait callback is set, as psycogreen does under gevent workers (see
+    # gunicorn.conf.py). The callback is lifted for the statement, which then blocks the worker until it
+    # finishes, so no other greenlet runs a query in the meantime.
+    callback = psycopg2.extensions.get_wait_callback()
+    if callback is None:
+        yield
+        return
+    psycopg2.extensions.set_wait_callback(None)
+    try:
+        yield
+    finally:
+        psycopg2.extensions.set_wait_callback(callback)
+
+
+class CountingCursorMixin:
+    def execute(self, query, vars=None):
+        count_query(query, vars)
+        with timed_query(query):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        count_query(query)
+        with timed_query(query):
+            return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        count_query(sql)
+        with timed_query(sql), without_wait_callback():
+            return super().copy_expert(sql, file, size)
+
+
+class CountingCursor(CountingCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class CountingDictCursor(CountingCursorMixin, psycopg2.extras.RealDictCursor):
+    pass
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    # Swap in counting versions of the cursors the app asks for, everything else passes through
+    def cursor(self, *args, **kwargs):
+        cursor_factory = kwargs.get('cursor_factory')
+        if cursor_factory is None:
+            kwargs['cursor_factory'] = CountingCursor
+        elif cursor_factory is psycopg2.extras.RealDictCursor:
+            kwargs['cursor_factory'] = CountingDictCursor
+        return super().cursor(*args, **kwargs)
+
+
+def connect():
     if 'ON_HEROKU' in os.environ:
         connection = psycopg2.connect(
-            os.getenv('DATABASE_URL'), 
-            sslmode='require'
+            os.getenv('DATABASE_URL'),
+            sslmode='require',
+            connection_factory=CountingConnection
         )
     else:
         connection = psycopg2.connect(
             host='localhost',
             database=os.getenv('POSTGRES_DATABASE'),
             user=os.getenv('POSTGRES_USERNAME'),
-            password=os.getenv('POSTGRES_PASSWORD')
+            password=os.getenv('POSTGRES_PASSWORD'),
+            connection_factory=CountingConnection
         )
     return connection
 
 
+def query_budget(limit):
+    # Flags handlers that make more than `limit` database round trips.
+    # Raises when the app is in testing mode so a regression fails the test run, logs otherwise.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.db_query_count = 0
+            response = f(*args, **kwargs)
+            used = g.get('db_query_count', 0)
+            if used > limit:
+                message = f"{request.endpoint} made {used} database queries, its budget is {limit}"
+                if current_app.testing:
+                    raise AssertionError(message)
+                current_app.logger.warning(message)
+            return response
+        return decorated_function
+    return decorator
+
+
+class ConnectionPool:
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # Idle connections as (connection, returned_at) pairs, most recently returned last
+        self._idle = []
+        self._size = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "timeouts": 0,
+            "discarded": 0,
+        }
+
+    def warm(self):
+        # Open connections up to min_size, so the first requests after a fork don't each wait on a connect
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = connect()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve a slot, the connection itself is opened outside the lock
+                    self._size += 1
+                    connection, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout("Timed out waiting for a database connection")
+                waited = True
+                self._condition.wait(remaining)
+
+            wait_seconds = time.monotonic() - started
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_seconds_total"] += wait_seconds
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait_seconds)
+
+        if connection is not None and not self._is_healthy(connection, returned_at):
+            self._close(connection)
+            connection = None
+
+        if connection is None:
+            try:
+                connection = connect()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+        return connection
+
+    def putconn(self, connection):
+        if not connection.closed:
+            try:
+                # Never hand out a connection with a half finished transaction
+                if connection.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                self._close(connection)
+        with self._condition:
+            if connection.closed:
+                self._size -= 1
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            stale = self._prune_idle()
+            self._condition.notify()
+        for connection in stale:
+            self._close(connection)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["min_size"] = self.min_size
+            stats["max_size"] = self.max_size
+        return stats
+
+    def _prune_idle(self):
+        # Shrink back towards min_size, oldest idle connections go first
+        stale = []
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > POOL_MAX_IDLE:
+            connection, _ = self._idle.pop(0)
+            stale.append(connection)
+            self._size -= 1
+        return stale
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < POOL_HEALTHCHECK_AFTER:
+            return True
+        try:
+            # A plain cursor so the ping doesn't count against the request's query budget
+            with connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    # Each gunicorn worker gets its own pool, connections are never shared across a fork
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                pool = ConnectionPool()
+                try:
+                    pool.warm()
+                except psycopg2.Error:
+                    # The rest are opened on demand, where a database that is still down fails the request
+                    pass
+                _pool = pool
+    return _pool
+
+
+def get_db_connection():
+    # Check out one connection per request, it goes back to the pool on teardown
+    if 'db_connection' not in g:
+        with timed("db_connect"):
+            g.db_connection = get_pool().getconn()
+    return g.db_connection
+
+
+def close_db_connection(exception=None):
+    connection = g.pop('db_connection', None)
+    if connection is not None:
+        get_pool().putconn(connection)
+
+
+@contextmanager
+def pooled_connection():
+    # For work outside a request, such as background jobs
+    pool = get_pool()
+    connection = pool.getconn()
+    try:
+        yield connection
+    finally:
+        pool.putconn(connection)
+
+
+COMMENT_FIELDS = ("comment_id", "comment_text", "comment_created_at", "comment_updated_at", "comment_author_username")
+
+
 def consolidate_comments_in_reports(reports_with_comments):
-    print(reports_with_comments)
-    consolidated_reports = []
-    for report in reports_with_comments:
-        # Check if this report has already been added to consolidated_reports
-        report_exists = False
-        for consolidated_report in consolidated_reports:
-            if report["id"] == consolidated_report["id"]:
-                report_exists = True
-                consolidated_report["comments"].append(
-                    {"comment_text": report["comment_text"],
-                     "comment_id": report["comment_id"],
-                     "comment_created_at": report["comment_created_at"],
-                     "comment_updated_at": report["comment_updated_at"],
-                     "comment_author_username": report["comment_author_username"]
-                    })
-                break
-
-        # If the report doesn't exist in consolidated_reports, add it
-        if not report_exists:
+    # Single pass over the joined rows, reports are indexed by id as they are first seen
+    with timed("consolidate"):
+        return _consolidate(reports_with_comments)
+
+
+def _consolidate(reports_with_comments):
+    consolidated_reports = {}
+    for row in reports_with_comments:
+        report = consolidated_reports.get(row["id"])
+        if report is None:
+            report = {key: value for key, value in row.items() if key not in COMMENT_FIELDS}
             report["comments"] = []
-            if report["comment_id"] is not None:
-                report["comments"].append(
-                    {"comment_text": report["comment_text"],
-                     "comment_id": report["comment_id"],
-                     "comment_created_at": report["comment_created_at"],
-                     "comment_updated_at": report["comment_updated_at"],
-                     "comment_author_username": report["comment_author_username"]
-                    }
-                )
-            del report["comment_id"]
-            del report["comment_text"]
-            del report["comment_author_username"]
-            del report["comment_created_at"]
-            del report["comment_updated_at"]
-            consolidated_reports.append(report)
-
-    return consolidated_reports
+            consolidated_reports[row["id"]] = report
+
+        if row["comment_id"] is not None:
+            report["comments"].append(
+                {"comment_text": row["comment_text"],
+                 "comment_id": row["comment_id"],
+                 "comment_created_at": row["comment_created_at"],
+                 "comment_updated_at": row["comment_updated_at"],
+                 "comment_author_username": row["comment_author_username"]
+                })
 
+    # dicts keep insertion order, so reports come out in query order
+    return list(consolidated_reports.values())
@@ -0,0 +1,136 @@
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+# Upper bound on geohash cells used to cover a query box, more cells means more index range scans
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE_LAT = 111320
+# Web Mercator map tiles end here, past it the projection goes to infinity
+MAX_TILE_LAT = 85.0511287798
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even_bit = True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value_range, value = (lng_range, lng) if even_bit else (lat_range, lat)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+        even_bit = not even_bit
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def geohash_cell_size(precision):
+    # Width and height in degrees of a cell at the given precision
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 360.0 / (1 << lng_bits), 180.0 / (1 << lat_bits)
+
+
+def geohash_cover(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_COVER_CELLS):
+    # Find the finest set of geohash prefixes, at most max_cells of them, that covers the box
+    cover = [""]
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cell_width, cell_height = geohash_cell_size(precision)
+        first_col = math.floor((min_lng + 180) / cell_width)
+        last_col = math.floor((min(max_lng, 179.999999) + 180) / cell_width)
+        first_row = math.floor((min_lat + 90) / cell_height)
+        last_row = math.floor((min(max_lat, 89.999999) + 90) / cell_height)
+        if (last_col - first_col + 1) * (last_row - first_row + 1) > max_cells:
+            break
+        cover = [
+            geohash_encode(-90 + (row + 0.5) * cell_height, -180 + (col + 0.5) * cell_width, precision)
+            for row in range(first_row, last_row + 1)
+            for col in range(first_col, last_col + 1)
+        ]
+    return cover
+
+
+def radius_to_bbox(lat, lng, radius_m):
+    lat_delta = radius_m / METERS_PER_DEGREE_LAT
+    lng_delta = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return (max(lat - lat_delta, -90.0), max(lng - lng_delta, -180.0),
+            min(lat + lat_delta, 90.0), min(lng + lng_delta, 180.0))
+
+
+def bbox_conditions(min_lat, min_lng, max_lat, max_lng):
+    # The geohash prefixes narrow the scan through the index, the coordinate range makes it exact
+    prefixes = geohash_cover(min_lat, min_lng, max_lat, max_lng)
+    conditions = []
+    params = []
+    if prefixes != [""]:
+        conditions.append("(" + " OR ".join("r.geohash LIKE %s" for _ in prefixes) + ")")
+        params.extend(prefix + "%" for prefix in prefixes)
+    conditions.append("r.location_lat BETWEEN %s AND %s")
+    params.extend([min_lat, max_lat])
+    conditions.append("r.location_long BETWEEN %s AND %s")
+    params.extend([min_lng, max_lng])
+    return conditions, params
+
+
+def distance_sql(lat, lng):
+    # Haversine distance in meters from a fixed point to each report
+    sql = ("2 * %s * asin(sqrt(power(sin(radians(r.location_lat - %s) / 2), 2)"
+           " + cos(radians(%s)) * cos(radians(r.location_lat))"
+           " * power(sin(radians(r.location_long - %s) / 2), 2)))")
+    return sql, [EARTH_RADIUS_M, lat, lat, lng]
+
+
+def tile_for_point(lat, lng, zoom):
+    # x, y of the 256 pixel Web Mercator tile holding the point, the scheme map libraries use
+    tiles = 1 << zoom
+    lat = math.radians(max(min(lat, MAX_TILE_LAT), -MAX_TILE_LAT))
+    x = int((lng + 180) / 360 * tiles)
+    y = int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * tiles)
+    return min(x, tiles - 1), min(y, tiles - 1)
+
+
+def tile_bounds(zoom, x, y):
+    # (min_lat, min_lng, max_lat, max_lng) of a tile, tiles are numbered from the north west corner
+    tiles = 1 << zoom
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / tiles))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / tiles))))
+    return min_lat, x / tiles * 360 - 180, max_lat, (x + 1) / tiles * 360 - 180
+
+
+def tiles_covering(min_lat, min_lng, max_lat, max_lng, zoom):
+    min_x, max_y = tile_for_point(min_lat, min_lng, zoom)
+    max_x, min_y = tile_for_point(max_lat, max_lng, zoom)
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def parse_bbox(value):
+    # bbox=min_lng,min_lat,max_lng,max_lat, the same order map libraries use
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+        raise ValueError("bbox is out of range or crosses the antimeridian")
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def parse_coordinate(value, name, limit):
+    try:
+        coordinate = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not -limit <= coordinate <= limit:
+        raise ValueError(f"{name} is out of range")
+    return coordinate
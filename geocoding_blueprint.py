@@ -1,10 +1,93 @@
 from flask import Blueprint, request, jsonify
+from db_helpers import get_db_connection, close_db_connection, PoolTimeout
+from cache import TTLCache
+from nominatim_client import NominatimClient, RateLimitExceeded
+import psycopg2, psycopg2.extras
 import requests
+import os
+import re
+import threading
 
 geocoding_blueprint = Blueprint("geocoding_blueprint", __name__)
 
-NOMINATIM_BASE_URL = "https://nominatim.openstreetmap.org"
-USER_AGENT = "HydroWave/1.0 (hydro-wave-app)"  # Required by Nominatim
+# Shared outbound client: keep-alive session, coalesced duplicate lookups and client-side rate limiting
+nominatim = NominatimClient()
+
+# Reverse lookups are rounded to this many decimals (4 is roughly 11 m) so nearby clicks share an entry
+GEOCODE_PRECISION = int(os.getenv("GEOCODE_PRECISION", "4"))
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+GEOCODE_MEMORY_CACHE_SIZE = int(os.getenv("GEOCODE_MEMORY_CACHE_SIZE", "5000"))
+GEOCODE_CACHE_MAX_ROWS = int(os.getenv("GEOCODE_CACHE_MAX_ROWS", "100000"))
+# Trim the shared table back to its max size once every this many writes
+GEOCODE_CACHE_TRIM_EVERY = 100
+
+# In-process tier, checked before the table every worker shares
+memory_cache = TTLCache(GEOCODE_MEMORY_CACHE_SIZE, GEOCODE_CACHE_TTL)
+shared_cache_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+# Request threads update the counters concurrently, and += on a dict item isn't atomic
+_shared_stats_lock = threading.Lock()
+
+
+def count_shared(name):
+    # Returns the new count
+    with _shared_stats_lock:
+        shared_cache_stats[name] += 1
+        return shared_cache_stats[name]
+
+
+def reverse_cache_key(lat, lng):
+    return f"reverse:{lat:.{GEOCODE_PRECISION}f},{lng:.{GEOCODE_PRECISION}f}"
+
+
+def search_cache_key(query):
+    return "search:" + re.sub(r"\s+", " ", query).strip().lower()
+
+
+def get_cached(cache_key):
+    cached = memory_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("SELECT response FROM geocode_cache WHERE cache_key = %s AND created_at > now() - %s * interval '1 second'",
+                       (cache_key, GEOCODE_CACHE_TTL))
+        row = cursor.fetchone()
+        connection.commit()
+    except (psycopg2.Error, PoolTimeout):
+        # The cache is an optimization, fall through to Nominatim if the table is unavailable
+        count_shared("errors")
+        return None
+    finally:
+        # Don't hold a pooled connection while waiting on Nominatim
+        close_db_connection()
+    if row is None:
+        count_shared("misses")
+        return None
+    count_shared("hits")
+    memory_cache.set(cache_key, row["response"])
+    return row["response"]
+
+
+def set_cached(cache_key, response):
+    memory_cache.set(cache_key, response)
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        cursor.execute("""INSERT INTO geocode_cache (cache_key, response, created_at) VALUES (%s, %s, now())
+                          ON CONFLICT (cache_key) DO UPDATE SET response = EXCLUDED.response, created_at = EXCLUDED.created_at""",
+                       (cache_key, psycopg2.extras.Json(response)))
+        if count_shared("writes") % GEOCODE_CACHE_TRIM_EVERY == 0:
+            # Evict expired entries and the oldest ones beyond the size limit
+            cursor.execute("""DELETE FROM geocode_cache WHERE created_at <= now() - %s * interval '1 second'
+                              OR cache_key IN (SELECT cache_key FROM geocode_cache ORDER BY created_at DESC OFFSET %s)""",
+                           (GEOCODE_CACHE_TTL, GEOCODE_CACHE_MAX_ROWS))
+        connection.commit()
+    except (psycopg2.Error, PoolTimeout):
+        count_shared("errors")
+    finally:
+        close_db_connection()
+
 
 # Reverse geocoding: convert lat/lng coordinates to the location name
 @geocoding_blueprint.route("/geocode/reverse", methods=["GET"])
@@ -17,24 +100,34 @@ def reverse_geocode():
         return jsonify({"error": "lat and lng parameters are required"}), 400
 
     try:
-        response = requests.get(
-            f"{NOMINATIM_BASE_URL}/reverse",
-            params={
+        lat = round(float(lat), GEOCODE_PRECISION)
+        lng = round(float(lng), GEOCODE_PRECISION)
+    except ValueError:
+        return jsonify({"error": "lat and lng must be numbers"}), 400
+
+    cache_key = reverse_cache_key(lat, lng)
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
+    try:
+        status_code, result = nominatim.get(
+            "/reverse",
+            {
                 "format": "json",
                 "lat": lat,
                 "lon": lng
-            },
-            headers={
-                "User-Agent": USER_AGENT
-            },
-            timeout=10
+            }
         )
 
-        if response.status_code != 200:
-            return jsonify({"error": "Geocoding service unavailable"}), response.status_code
+        if status_code != 200:
+            return jsonify({"error": "Geocoding service unavailable"}), status_code
 
-        return jsonify(response.json()), 200
+        set_cached(cache_key, result)
+        return jsonify(result), 200
 
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 503
     except requests.exceptions.Timeout:
         return jsonify({"error": "Geocoding request timed out"}), 504
     except requests.exceptions.RequestException as e:
@@ -46,29 +139,40 @@ def forward_geocode():
 
     query = request.args.get("q")
 
-    if not query:
+    if not query or not query.strip():
         return jsonify({"error": "q (query) parameter is required"}), 400
 
+    cache_key = search_cache_key(query)
+    cached = get_cached(cache_key)
+    if cached is not None:
+        return jsonify(cached), 200
+
     try:
-        response = requests.get(
-            f"{NOMINATIM_BASE_URL}/search",
-            params={
+        status_code, result = nominatim.get(
+            "/search",
+            {
                 "format": "json",
-                "q": query,
+                "q": re.sub(r"\s+", " ", query).strip(),
                 "limit": 5
-            },
-            headers={
-                "User-Agent": USER_AGENT
-            },
-            timeout=10
+            }
         )
 
-        if response.status_code != 200:
-            return jsonify({"error": "Geocoding service unavailable"}), response.status_code
+        if status_code != 200:
+            return jsonify({"error": "Geocoding service unavailable"}), status_code
 
-        return jsonify(response.json()), 200
+        set_cached(cache_key, result)
+        return jsonify(result), 200
 
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 503
     except requests.exceptions.Timeout:
         return jsonify({"error": "Geocoding request timed out"}), 504
     except requests.exceptions.RequestException as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+# Cache hit/miss and upstream call counters for this worker
+@geocoding_blueprint.route("/geocode/cache-stats", methods=["GET"])
+def geocode_cache_stats():
+    with _shared_stats_lock:
+        shared = dict(shared_cache_stats)
+    return jsonify({"memory": memory_cache.stats(), "shared": shared, "upstream": nominatim.stats}), 200
@@ -0,0 +1,34 @@
+# Gunicorn settings, loaded by the web process in Procfile. Everything can be overridden per deployment.
+#
+# The geocoding, AI and image upload routes spend nearly all their time waiting on Nominatim, Gemini
+# and Cloudinary. A sync worker is tied up for the whole wait, so a few slow upstream calls leave
+# report reads queueing behind them. The worker classes:
+#   gthread (default)  GUNICORN_THREADS requests at once per worker, on real threads
+#   gevent             up to GUNICORN_WORKER_CONNECTIONS requests per worker as greenlets, psycopg2
+#                      made cooperative by psycogreen. Needs `pipenv install --categories gevent`.
+#   sync               one request per worker
+# Every worker opens up to DB_POOL_MAX_SIZE connections, so keep WEB_CONCURRENCY * DB_POOL_MAX_SIZE
+# under the database's connection limit, and DB_POOL_MAX_SIZE at or above GUNICORN_THREADS.
+import importlib.util
+import os
+
+# Heroku sets WEB_CONCURRENCY from the dyno size
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# Gunicorn quietly turns sync workers into gthread ones when threads is above 1
+threads = int(os.getenv("GUNICORN_THREADS", "8" if worker_class == "gthread" else "1"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+# Heroku's router gives up on a request after 30 seconds, a worker stuck for longer is restarted
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+if worker_class == "gevent" and importlib.util.find_spec("psycogreen") is None:
+    raise RuntimeError("GUNICORN_WORKER_CLASS=gevent needs psycogreen, without it every query blocks the whole worker")
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # Queries wait on the gevent hub instead of blocking it, so other greenlets run meanwhile
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
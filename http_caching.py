@@ -0,0 +1,68 @@
+import hashlib
+import os
+from datetime import timedelta
+from functools import wraps
+from flask import request, make_response, Response, current_app
+from db_helpers import get_db_connection
+from response_cache import response_cache
+from json_provider import RawJSON
+
+# Browsers and the CDN may store report reads but must revalidate them, which is cheap with the ETag
+REPORTS_CACHE_CONTROL = os.getenv('REPORTS_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+
+
+def get_data_version(name='reports'):
+    # Bumped by triggers on every write to reports and comments, see migrations/0006_data_versions.sql
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    # With the database's clock, which is the one updated_at was set from
+    cursor.execute("SELECT version, updated_at, clock_timestamp() AT TIME ZONE 'utc' FROM data_versions WHERE name = %s", (name,))
+    return cursor.fetchone()
+
+
+def last_modified(updated_at):
+    # HTTP dates have whole seconds, rounded up so the header is never older than the write
+    seconds = updated_at.replace(microsecond=0)
+    return seconds + timedelta(seconds=1) if updated_at.microsecond else seconds
+
+
+def make_etag(version):
+    # The same data version serves different bodies per path and query string
+    request_hash = hashlib.sha1(request.full_path.encode('utf-8')).hexdigest()[:16]
+    return f"{version}-{request_hash}"
+
+
+def versioned_read(f):
+    # Answers If-None-Match / If-Modified-Since with a 304 before the handler runs its queries,
+    # then serves the serialized body from the response cache while the data version is unchanged
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        version, updated_at, now = get_data_version()
+        etag = make_etag(version)
+        modified = last_modified(updated_at)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = request.if_modified_since is not None and modified <= request.if_modified_since.replace(tzinfo=None)
+
+        cache_key = request.full_path
+        cached_body = None if not_modified else response_cache.get(cache_key, version)
+        if not_modified:
+            response = Response(status=304)
+        elif cached_body is not None:
+            response = current_app.json.response(RawJSON(cached_body))
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            response_cache.set(cache_key, version, response.get_data())
+
+        response.set_etag(etag)
+        # Another write before that second is over would round to the same time, and a client
+        # revalidating with it would get a 304 for stale data. Until then the ETag alone is sent.
+        if now >= modified:
+            response.last_modified = modified
+        response.headers['Cache-Control'] = REPORTS_CACHE_CONTROL
+        return response
+    return decorated_function
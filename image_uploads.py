@@ -0,0 +1,143 @@
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from db_helpers import pooled_connection
+from instrumentation import timed
+
+# Commit reports right away and upload their images in the background
+ASYNC_IMAGE_UPLOADS = os.getenv("ASYNC_IMAGE_UPLOADS", "false").lower() == "true"
+# "cloudinary" in production, "local" writes files to IMAGE_UPLOAD_DIR for tests and benchmarks
+IMAGE_UPLOADER = os.getenv("IMAGE_UPLOADER", "cloudinary")
+IMAGE_UPLOAD_DIR = os.getenv("IMAGE_UPLOAD_DIR", "uploads")
+IMAGE_UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "2"))
+IMAGE_UPLOAD_RETRIES = int(os.getenv("IMAGE_UPLOAD_RETRIES", "3"))
+IMAGE_UPLOAD_BACKOFF = float(os.getenv("IMAGE_UPLOAD_BACKOFF", "1"))
+# Images larger than this (in pixels on the long side, or in bytes) are downscaled before upload
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(1024 * 1024)))
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+class CloudinaryUploader:
+    def upload(self, data):
+        # Imported here so the local uploader works without Cloudinary credentials
+        from main import upload_image
+        return upload_image(io.BytesIO(data))
+
+
+class LocalFilesystemUploader:
+    def __init__(self, directory=IMAGE_UPLOAD_DIR):
+        self.directory = directory
+
+    def upload(self, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.{image_extension(data)}")
+        with open(path, "wb") as image_file:
+            image_file.write(data)
+        return "file://" + os.path.abspath(path)
+
+
+def image_extension(data):
+    # From the format the image was saved in, prepare_image only re-encodes oversized ones
+    if Image is not None:
+        try:
+            image_format = Image.open(io.BytesIO(data)).format
+        except Exception:
+            image_format = None
+        if image_format:
+            return "jpg" if image_format == "JPEG" else image_format.lower()
+    return "bin"
+
+
+def create_uploader():
+    if IMAGE_UPLOADER == "local":
+        return LocalFilesystemUploader()
+    return CloudinaryUploader()
+
+
+uploader = create_uploader()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def upload_report_image(image):
+    # Synchronous upload straight from the request's file
+    with timed("image_upload"):
+        return uploader.upload(image.read())
+
+
+def prepare_image(data):
+    # Downscale and re-encode oversized photos when Pillow is installed, otherwise upload as-is
+    if Image is None:
+        return data
+    try:
+        image = Image.open(io.BytesIO(data))
+        if max(image.size) <= IMAGE_MAX_DIMENSION and len(data) <= IMAGE_MAX_BYTES:
+            return data
+        # The re-encoded copy loses the EXIF orientation, so rotate the pixels to match it first
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+        return output.getvalue()
+    except Exception:
+        return data
+
+
+def new_upload_id():
+    return uuid.uuid4().hex
+
+
+def schedule_image_upload(report_id, upload_id, data):
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_UPLOAD_WORKERS, thread_name_prefix="image-uploads")
+            _executor_pid = os.getpid()
+    return _executor.submit(run_image_upload, report_id, upload_id, data)
+
+
+def run_image_upload(report_id, upload_id, data):
+    try:
+        data = prepare_image(data)
+        image_url = None
+        for attempt in range(IMAGE_UPLOAD_RETRIES + 1):
+            try:
+                with timed("image_upload"):
+                    image_url = uploader.upload(data)
+                break
+            except Exception:
+                if attempt == IMAGE_UPLOAD_RETRIES:
+                    break
+                time.sleep(IMAGE_UPLOAD_BACKOFF * (2 ** attempt))
+
+        # Only the latest upload for a report may fill in its image, an older one finishing late is dropped
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            if image_url is None:
+                cursor.execute("UPDATE reports SET image_status = 'failed' WHERE id = %s AND image_upload_id = %s",
+                               (report_id, upload_id))
+            else:
+                cursor.execute("UPDATE reports SET image_url = %s, image_status = 'ready' WHERE id = %s AND image_upload_id = %s",
+                               (image_url, report_id, upload_id))
+            connection.commit()
+        return image_url
+    except Exception:
+        # Don't leave the report pending for good, on a fresh connection in case the error came from the last one
+        try:
+            with pooled_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("UPDATE reports SET image_status = 'failed' WHERE id = %s AND image_upload_id = %s",
+                               (report_id, upload_id))
+                connection.commit()
+        except Exception:
+            pass
+        raise
@@ -0,0 +1,182 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request, Response
+from flask.json.provider import JSONProvider
+
+# Statements slower than this are logged with the handler that issued them
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+# Upper bounds in seconds, the Prometheus client's defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+slow_query_log = logging.getLogger('hydrowave.slow_query')
+
+
+class Histogram:
+    # Cumulative bucket counts per label set, rendered in the Prometheus text format
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+                for upper_bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{upper_bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label_text}}} {series['count']}")
+        return lines
+
+
+request_duration = Histogram("hydrowave_request_duration_seconds", "Time spent handling a request.",
+                             ("endpoint", "method", "status"), LATENCY_BUCKETS)
+phase_duration = Histogram("hydrowave_request_phase_seconds", "Time a request spent in each phase.",
+                           ("endpoint", "phase"), LATENCY_BUCKETS)
+queries_per_request = Histogram("hydrowave_db_queries_per_request", "Statements issued per request.",
+                                ("endpoint",), QUERY_COUNT_BUCKETS)
+slow_queries = {"count": 0}
+_slow_queries_lock = threading.Lock()
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or "unmatched"
+    return "background"
+
+
+def record_phase(phase, seconds):
+    # Inside a request the phase adds to that request's totals, reported when it finishes.
+    # Background work (job threads, async uploads) goes straight to the histogram.
+    if has_request_context():
+        timings = g.setdefault('phase_timings', {})
+        timings[phase] = timings.get(phase, 0.0) + seconds
+    else:
+        phase_duration.observe(("background", phase), seconds)
+
+
+@contextmanager
+def timed(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+def normalize_sql(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return re.sub(r"\s+", " ", str(query)).strip()[:1000]
+
+
+@contextmanager
+def timed_query(query):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        record_phase("db", elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            with _slow_queries_lock:
+                slow_queries["count"] += 1
+            slow_query_log.warning("Slow query (%.1f ms) in %s: %s", elapsed * 1000, current_endpoint(), normalize_sql(query))
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def finish_request_timer(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = current_endpoint()
+    timings = g.get('phase_timings', {})
+
+    request_duration.observe((endpoint, request.method, str(response.status_code)), elapsed)
+    for phase, seconds in timings.items():
+        phase_duration.observe((endpoint, phase), seconds)
+    queries_per_request.observe((endpoint,), g.get('db_query_count', 0))
+
+    if SERVER_TIMING:
+        # Streamed bodies are written after this, so their time isn't part of "app"
+        entries = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in timings.items()]
+        entries.append(f"app;dur={elapsed * 1000:.2f}")
+        response.headers['Server-Timing'] = ", ".join(entries)
+    return response
+
+
+class InstrumentedJSONProvider(JSONProvider):
+    # Wraps the app's own provider, so the serialization time of every JSON response is recorded
+    # whichever encoder is in use
+    def __init__(self, app, provider):
+        super().__init__(app)
+        self.provider = provider
+
+    def dumps(self, obj, **kwargs):
+        with timed("json"):
+            return self.provider.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self.provider.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with timed("json"):
+            return self.provider.response(*args, **kwargs)
+
+
+def render_stats(prefix, stats):
+    # Existing stats dicts become gauges, nested dicts add to the name
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.extend(render_stats(name, value))
+        elif isinstance(value, bool):
+            lines.extend([f"# TYPE {name} gauge", f"{name} {int(value)}"])
+        elif isinstance(value, (int, float)):
+            lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return lines
+
+
+def init_app(app, stats_sources):
+    # stats_sources maps a metric prefix to a function returning a flat or nested dict of numbers.
+    # Metrics are per worker process, so with several gunicorn workers each scrape sees one of them.
+    app.json = InstrumentedJSONProvider(app, app.json)
+    app.before_request(start_request_timer)
+    app.after_request(finish_request_timer)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        lines = []
+        for histogram in (request_duration, phase_duration, queries_per_request):
+            lines.extend(histogram.render())
+        lines.extend(["# TYPE hydrowave_slow_queries_total counter", f"hydrowave_slow_queries_total {slow_queries['count']}"])
+        for prefix, source in stats_sources.items():
+            lines.extend(render_stats(f"hydrowave_{prefix}", source()))
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
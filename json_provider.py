@@ -0,0 +1,95 @@
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional, without it responses are encoded by the standard library as before
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Formatted dates are kept for the timestamps seen most recently, listings serve the same ones again and again
+HTTP_DATE_CACHE_SIZE = 16384
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+if orjson is not None:
+    # Datetimes are passed back to default() so they keep the HTTP date format clients already parse,
+    # keys are sorted like Flask's provider sorts them. Dicts with non-string keys are refused rather
+    # than sorted as strings, the standard library sorts them before converting.
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+
+class RawJSON:
+    # Already serialized JSON that jsonify sends as-is, like a body from the response cache
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body.encode("utf-8") if isinstance(body, str) else body
+
+
+@lru_cache(maxsize=HTTP_DATE_CACHE_SIZE)
+def http_date(value):
+    # Same output as werkzeug's http_date, which goes through email.utils and is several times slower.
+    # Naive datetimes are UTC, as they are everywhere in this app.
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+    else:
+        value = datetime(value.year, value.month, value.day)
+    return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (WEEKDAYS[value.weekday()], value.day, MONTHS[value.month - 1],
+                                                    value.year, value.hour, value.minute, value.second)
+
+
+def default(value):
+    # Flask's conversions, with the faster date formatting
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Encodes with orjson when it is installed. Output matches DefaultJSONProvider apart from
+    # non-ASCII text, which is written as UTF-8 instead of \u escapes.
+    default = staticmethod(default)
+
+    def dumps(self, obj, **kwargs):
+        # orjson only writes the compact layout and a two space indent. Anything else (the standard library's
+        # default ", " separators, template filters, explicit sort_keys=False) goes to the standard library.
+        layout = (kwargs.get("indent"), kwargs.get("separators"))
+        if orjson is None or set(kwargs) - {"indent", "separators"} or layout not in ((None, (",", ":")), (2, None)):
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj, indent=layout[0] == 2).decode("utf-8")
+
+    def encode(self, obj, indent=False, newline=False):
+        if orjson is not None:
+            options = ORJSON_OPTIONS
+            if indent:
+                options |= orjson.OPT_INDENT_2
+            if newline:
+                options |= orjson.OPT_APPEND_NEWLINE
+            try:
+                return orjson.dumps(obj, default=default, option=options)
+            except orjson.JSONEncodeError:
+                # Non-string keys, or a type default() doesn't know, which the standard library reports the same way
+                pass
+        text = super().dumps(obj, **({"indent": 2} if indent else {"separators": (",", ":")}))
+        return (text + "\n" if newline else text).encode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, RawJSON):
+            body = obj.body
+        else:
+            indent = (self.compact is None and self._app.debug) or self.compact is False
+            body = self.encode(obj, indent=indent, newline=True)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,89 @@
+# Applies the numbered files in migrations/ that the database hasn't seen yet, in order.
+#
+#   python migrate.py            apply pending migrations
+#   python migrate.py --status   list applied and pending migrations
+#
+# .sql files run as-is, .py files define migrate(cursor) for data changes that need Python.
+# Each migration runs in its own transaction together with its schema_migrations row, so a
+# failure leaves the database at the previous version. Migrations are written to be safe on
+# databases created from the old schema.sql, which is why they use IF NOT EXISTS throughout.
+import importlib.util
+import os
+import sys
+from dotenv import load_dotenv
+from db_helpers import connect
+
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Arbitrary key for pg_advisory_lock, so two release processes never migrate at the same time
+MIGRATION_LOCK_ID = 4201701
+
+
+def list_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        version, extension = os.path.splitext(filename)
+        if extension in ('.sql', '.py') and version[:4].isdigit():
+            migrations.append((version, os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def applied_versions(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version VARCHAR(255) PRIMARY KEY,
+                        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                      )""")
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(cursor, path):
+    if path.endswith('.sql'):
+        with open(path) as migration_file:
+            cursor.execute(migration_file.read())
+    else:
+        spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.migrate(cursor)
+
+
+def migrate(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        applied = applied_versions(cursor)
+        connection.commit()
+        for version, path in list_migrations():
+            if version in applied:
+                continue
+            print(f"Applying {version}")
+            apply_migration(cursor, path)
+            cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        connection.commit()
+
+
+def status(connection):
+    cursor = connection.cursor()
+    applied = applied_versions(cursor)
+    connection.commit()
+    for version, path in list_migrations():
+        print(f"{'applied' if version in applied else 'pending'}  {version}")
+
+
+if __name__ == '__main__':
+    connection = connect()
+    try:
+        if '--status' in sys.argv[1:]:
+            status(connection)
+        else:
+            migrate(connection)
+    finally:
+        connection.close()
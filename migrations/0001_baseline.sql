@@ -1,10 +1,12 @@
-CREATE TABLE users (
+-- Tables as first deployed, a no-op on databases created from the original schema.sql
+
+CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     username VARCHAR(50) UNIQUE NOT NULL,
     password VARCHAR(255) NOT NULL
 );
 
-CREATE TABLE reports (
+CREATE TABLE IF NOT EXISTS reports (
     id SERIAL PRIMARY KEY,
     author INTEGER REFERENCES users(id) ON DELETE CASCADE,
     title VARCHAR(255),
@@ -22,11 +24,11 @@ CREATE TABLE reports (
     location_name TEXT DEFAULT NULL
 );
 
-CREATE TABLE comments (
+CREATE TABLE IF NOT EXISTS comments (
     id SERIAL PRIMARY KEY,
     author INTEGER REFERENCES users(id) ON DELETE CASCADE,
     report INTEGER REFERENCES reports(id) ON DELETE CASCADE,
     text VARCHAR(500),
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
@@ -0,0 +1,4 @@
+-- Image upload state and the geohash spatial key, existing rows get their geohash from 0003
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS image_status VARCHAR(20) DEFAULT NULL;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS image_upload_id VARCHAR(32) DEFAULT NULL;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS geohash VARCHAR(12) DEFAULT NULL;
@@ -0,0 +1,15 @@
+from geo import geohash_encode
+
+
+# Fill in the geohash for reports created before the column existed, in batches by id
+def migrate(cursor):
+    last_id = 0
+    while True:
+        cursor.execute("""SELECT id, location_lat, location_long FROM reports
+                          WHERE geohash IS NULL AND id > %s ORDER BY id LIMIT 1000""", (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        values = [(geohash_encode(location_lat, location_long), report_id) for report_id, location_lat, location_long in rows]
+        cursor.executemany("UPDATE reports SET geohash = %s WHERE id = %s", values)
+        last_id = rows[-1][0]
@@ -0,0 +1,10 @@
+-- Keyset pagination on GET /reports walks this index newest first
+CREATE INDEX IF NOT EXISTS reports_reported_at_id_idx ON reports (reported_at, id);
+
+-- Bounding box and radius queries scan geohash prefixes through this index
+CREATE INDEX IF NOT EXISTS reports_geohash_idx ON reports (geohash text_pattern_ops);
+
+-- Foreign keys on the join paths of the report and comment handlers, Postgres doesn't index them by itself
+CREATE INDEX IF NOT EXISTS reports_author_idx ON reports (author);
+CREATE INDEX IF NOT EXISTS comments_report_idx ON comments (report);
+CREATE INDEX IF NOT EXISTS comments_author_idx ON comments (author);
@@ -0,0 +1,34 @@
+-- Geocoding responses shared by every worker, keyed by quantized coordinates or normalized query text
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    cache_key TEXT PRIMARY KEY,
+    response JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS geocode_cache_created_at_idx ON geocode_cache (created_at);
+
+-- AI insights keyed by a hash of the prompt inputs and the model name
+CREATE TABLE IF NOT EXISTS ai_insights (
+    cache_key CHAR(64) PRIMARY KEY,
+    report_id INTEGER REFERENCES reports(id) ON DELETE CASCADE,
+    model VARCHAR(100) NOT NULL,
+    insight TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ai_insights_report_id_idx ON ai_insights (report_id);
+
+-- Background AI insight jobs, at most one queued or running job per report
+CREATE TABLE IF NOT EXISTS ai_jobs (
+    id SERIAL PRIMARY KEY,
+    report_id INTEGER REFERENCES reports(id) ON DELETE CASCADE,
+    author INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    insight TEXT,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ai_jobs_active_report_idx ON ai_jobs (report_id) WHERE status IN ('queued', 'running');
@@ -0,0 +1,24 @@
+-- Version stamp for report reads, bumped in the writing transaction by the triggers below.
+-- ETags and response caches compare against it, so every worker sees a write at once.
+CREATE TABLE IF NOT EXISTS data_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+INSERT INTO data_versions (name) VALUES ('reports') ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_reports_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'reports';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS reports_bump_version ON reports;
+CREATE TRIGGER reports_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON reports
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_reports_version();
+
+DROP TRIGGER IF EXISTS comments_bump_version ON comments;
+CREATE TRIGGER comments_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON comments
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_reports_version();
@@ -0,0 +1,110 @@
+-- Report counts for GET /reports/stats, kept up to date by the triggers below.
+-- python report_stats.py rebuilds them from scratch.
+--   report_stats       per day, condition, water source and status, for totals and time series
+--   report_cell_stats  per 3 character geohash cell, condition, water source and status, for grid breakdowns
+-- Both are bounded by the number of distinct buckets rather than reports. Cells aren't split by day,
+-- that would make about one bucket per report. Missing values are stored as '' so they can be part
+-- of the key, reports without coordinates have no cell. Buckets that drop to zero are kept until
+-- the next rebuild, reads skip them.
+CREATE TABLE IF NOT EXISTS report_stats (
+    day DATE NOT NULL,
+    condition VARCHAR(50) NOT NULL,
+    water_source VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    report_count INTEGER NOT NULL,
+    PRIMARY KEY (day, condition, water_source, status)
+);
+
+CREATE TABLE IF NOT EXISTS report_cell_stats (
+    cell VARCHAR(3) NOT NULL,
+    condition VARCHAR(50) NOT NULL,
+    water_source VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    report_count INTEGER NOT NULL,
+    PRIMARY KEY (cell, condition, water_source, status)
+);
+
+CREATE OR REPLACE VIEW report_stats_source AS
+    SELECT reported_at::date AS day, condition, COALESCE(water_source, '') AS water_source,
+           COALESCE(status, '') AS status, count(*)::integer AS report_count
+    FROM reports
+    GROUP BY 1, 2, 3, 4;
+
+CREATE OR REPLACE VIEW report_cell_stats_source AS
+    SELECT left(geohash, 3) AS cell, condition, COALESCE(water_source, '') AS water_source,
+           COALESCE(status, '') AS status, count(*)::integer AS report_count
+    FROM reports
+    WHERE geohash IS NOT NULL
+    GROUP BY 1, 2, 3, 4;
+
+INSERT INTO report_stats SELECT * FROM report_stats_source ON CONFLICT DO NOTHING;
+INSERT INTO report_cell_stats SELECT * FROM report_cell_stats_source ON CONFLICT DO NOTHING;
+
+-- Statement-level, so a bulk COPY touches each bucket once. Updates count the old rows out and the
+-- new rows in, most of them net out to nothing. Buckets are written in key order so concurrent
+-- writers lock them in the same order.
+CREATE OR REPLACE FUNCTION report_stats_after_write() RETURNS trigger AS $$
+DECLARE
+    changes TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        changes := 'SELECT *, 1 AS delta FROM new_reports';
+    ELSIF TG_OP = 'DELETE' THEN
+        changes := 'SELECT *, -1 AS delta FROM old_reports';
+    ELSE
+        changes := 'SELECT *, 1 AS delta FROM new_reports UNION ALL SELECT *, -1 AS delta FROM old_reports';
+    END IF;
+
+    EXECUTE format($sql$
+        WITH changes AS (%s),
+        daily AS (
+            INSERT INTO report_stats (day, condition, water_source, status, report_count)
+            SELECT reported_at::date, condition, COALESCE(water_source, ''), COALESCE(status, ''), sum(delta)
+            FROM changes
+            GROUP BY 1, 2, 3, 4
+            HAVING sum(delta) <> 0
+            ORDER BY 1, 2, 3, 4
+            ON CONFLICT (day, condition, water_source, status)
+            DO UPDATE SET report_count = report_stats.report_count + EXCLUDED.report_count
+        )
+        INSERT INTO report_cell_stats (cell, condition, water_source, status, report_count)
+        SELECT left(geohash, 3), condition, COALESCE(water_source, ''), COALESCE(status, ''), sum(delta)
+        FROM changes
+        WHERE geohash IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        HAVING sum(delta) <> 0
+        ORDER BY 1, 2, 3, 4
+        ON CONFLICT (cell, condition, water_source, status)
+        DO UPDATE SET report_count = report_cell_stats.report_count + EXCLUDED.report_count
+    $sql$, changes);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION report_stats_after_truncate() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM report_stats;
+    DELETE FROM report_cell_stats;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS reports_stats_insert ON reports;
+CREATE TRIGGER reports_stats_insert AFTER INSERT ON reports
+    REFERENCING NEW TABLE AS new_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_stats_after_write();
+
+DROP TRIGGER IF EXISTS reports_stats_update ON reports;
+CREATE TRIGGER reports_stats_update AFTER UPDATE ON reports
+    REFERENCING OLD TABLE AS old_reports NEW TABLE AS new_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_stats_after_write();
+
+DROP TRIGGER IF EXISTS reports_stats_delete ON reports;
+CREATE TRIGGER reports_stats_delete AFTER DELETE ON reports
+    REFERENCING OLD TABLE AS old_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_stats_after_write();
+
+DROP TRIGGER IF EXISTS reports_stats_truncate ON reports;
+CREATE TRIGGER reports_stats_truncate AFTER TRUNCATE ON reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_stats_after_truncate();
@@ -0,0 +1,10 @@
+-- Full-text search for GET /reports/search. Postgres keeps the vector in step with the text columns
+-- on every write. Title matches rank above observation matches, which rank above the location name.
+-- Adding a stored generated column rewrites the table, so this holds a lock on reports while it runs.
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+    setweight(to_tsvector('english', COALESCE(observation, '')), 'B') ||
+    setweight(to_tsvector('english', COALESCE(location_name, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS reports_search_idx ON reports USING GIN (search_vector);
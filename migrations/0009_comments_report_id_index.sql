@@ -0,0 +1,4 @@
+-- GET /reports/<id>/comments pages through a report's comments in id order, and listings count them
+-- per report. Both read this index alone, it replaces the single column one from 0004.
+CREATE INDEX IF NOT EXISTS comments_report_id_idx ON comments (report, id);
+DROP INDEX IF EXISTS comments_report_idx;
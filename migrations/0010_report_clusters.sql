@@ -0,0 +1,98 @@
+-- Map clusters for GET /reports/clusters, kept up to date by the triggers below.
+-- python report_clusters.py rebuilds them from scratch.
+-- One row per geohash cell at each precision from 1 to 6 and per condition, holding the report count
+-- and coordinate sums, so a cluster's size, centroid and dominant condition come from the cells of
+-- one precision without reading reports. Sums are kept in double precision, a REAL running total
+-- would drift from the coordinates it adds up. Cells are compared byte-wise ("C") so prefix LIKEs
+-- use the primary key. Cells that drop to zero are kept until the next rebuild, reads skip them.
+CREATE TABLE IF NOT EXISTS report_clusters (
+    precision SMALLINT NOT NULL,
+    cell VARCHAR(6) COLLATE "C" NOT NULL,
+    condition VARCHAR(50) NOT NULL,
+    report_count INTEGER NOT NULL,
+    lat_sum DOUBLE PRECISION NOT NULL,
+    lng_sum DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (precision, cell, condition)
+);
+
+CREATE OR REPLACE VIEW report_clusters_source AS
+    SELECT p AS precision, left(geohash, p) AS cell, condition, count(*)::integer AS report_count,
+           sum(location_lat::double precision) AS lat_sum, sum(location_long::double precision) AS lng_sum
+    FROM reports, generate_series(1, 6) p
+    WHERE geohash IS NOT NULL
+    GROUP BY 1, 2, 3;
+
+INSERT INTO report_clusters SELECT * FROM report_clusters_source ON CONFLICT DO NOTHING;
+
+-- Bumped whenever a cluster changes, that is when a report is created, deleted, moved or changes
+-- condition. Cached cluster tiles are built against it, other report edits and comments leave them be.
+INSERT INTO data_versions (name) VALUES ('report_locations') ON CONFLICT DO NOTHING;
+
+-- Statement-level like the stats triggers. Updates only count rows whose location or condition
+-- changed, so edits to anything else don't touch the table or the version.
+CREATE OR REPLACE FUNCTION report_clusters_after_write() RETURNS trigger AS $$
+DECLARE
+    changes TEXT;
+    changed_rows INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        changes := 'SELECT geohash, condition, location_lat, location_long, 1 AS delta FROM new_reports';
+    ELSIF TG_OP = 'DELETE' THEN
+        changes := 'SELECT geohash, condition, location_lat, location_long, -1 AS delta FROM old_reports';
+    ELSE
+        changes := 'SELECT n.geohash, n.condition, n.location_lat, n.location_long, 1 AS delta FROM new_reports n JOIN old_reports o USING (id)
+                    WHERE (n.geohash, n.condition, n.location_lat, n.location_long) IS DISTINCT FROM (o.geohash, o.condition, o.location_lat, o.location_long)
+                    UNION ALL
+                    SELECT o.geohash, o.condition, o.location_lat, o.location_long, -1 AS delta FROM old_reports o JOIN new_reports n USING (id)
+                    WHERE (n.geohash, n.condition, n.location_lat, n.location_long) IS DISTINCT FROM (o.geohash, o.condition, o.location_lat, o.location_long)';
+    END IF;
+
+    EXECUTE format($sql$
+        WITH changes AS (%s)
+        INSERT INTO report_clusters (precision, cell, condition, report_count, lat_sum, lng_sum)
+        SELECT p, left(geohash, p), condition, sum(delta), sum(delta * location_lat::double precision), sum(delta * location_long::double precision)
+        FROM changes, generate_series(1, 6) p
+        WHERE geohash IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (precision, cell, condition)
+        DO UPDATE SET report_count = report_clusters.report_count + EXCLUDED.report_count,
+                      lat_sum = report_clusters.lat_sum + EXCLUDED.lat_sum,
+                      lng_sum = report_clusters.lng_sum + EXCLUDED.lng_sum
+    $sql$, changes);
+    GET DIAGNOSTICS changed_rows = ROW_COUNT;
+
+    IF changed_rows > 0 THEN
+        UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'report_locations';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION report_clusters_after_truncate() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM report_clusters;
+    UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'report_locations';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS reports_clusters_insert ON reports;
+CREATE TRIGGER reports_clusters_insert AFTER INSERT ON reports
+    REFERENCING NEW TABLE AS new_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_clusters_after_write();
+
+DROP TRIGGER IF EXISTS reports_clusters_update ON reports;
+CREATE TRIGGER reports_clusters_update AFTER UPDATE ON reports
+    REFERENCING OLD TABLE AS old_reports NEW TABLE AS new_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_clusters_after_write();
+
+DROP TRIGGER IF EXISTS reports_clusters_delete ON reports;
+CREATE TRIGGER reports_clusters_delete AFTER DELETE ON reports
+    REFERENCING OLD TABLE AS old_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_clusters_after_write();
+
+DROP TRIGGER IF EXISTS reports_clusters_truncate ON reports;
+CREATE TRIGGER reports_clusters_truncate AFTER TRUNCATE ON reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_clusters_after_truncate();
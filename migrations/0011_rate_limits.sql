@@ -0,0 +1,8 @@
+-- Outbound rate limits shared by every worker and dyno. next_at is when the next call is due at the
+-- steady rate, nominatim_client.SharedRateLimiter takes a slot by moving it forward one interval.
+CREATE TABLE IF NOT EXISTS rate_limits (
+    name VARCHAR(50) PRIMARY KEY,
+    next_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+INSERT INTO rate_limits (name) VALUES ('nominatim') ON CONFLICT DO NOTHING;
@@ -0,0 +1,52 @@
+-- report_clusters keeps precisions 2, 4 and 6 only. Every report write upserted a cell at all six
+-- precisions, and the fine ones are nearly one cell per report, so that was most of the cost of a
+-- bulk upload. Reads of precisions 1, 3 and 5 roll up the next finer level, at most 32 cells each.
+CREATE OR REPLACE VIEW report_clusters_source AS
+    SELECT p AS precision, left(geohash, p) AS cell, condition, count(*)::integer AS report_count,
+           sum(location_lat::double precision) AS lat_sum, sum(location_long::double precision) AS lng_sum
+    FROM reports, generate_series(2, 6, 2) p
+    WHERE geohash IS NOT NULL
+    GROUP BY 1, 2, 3;
+
+CREATE OR REPLACE FUNCTION report_clusters_after_write() RETURNS trigger AS $$
+DECLARE
+    changes TEXT;
+    changed_rows INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        changes := 'SELECT geohash, condition, location_lat, location_long, 1 AS delta FROM new_reports';
+    ELSIF TG_OP = 'DELETE' THEN
+        changes := 'SELECT geohash, condition, location_lat, location_long, -1 AS delta FROM old_reports';
+    ELSE
+        changes := 'SELECT n.geohash, n.condition, n.location_lat, n.location_long, 1 AS delta FROM new_reports n JOIN old_reports o USING (id)
+                    WHERE (n.geohash, n.condition, n.location_lat, n.location_long) IS DISTINCT FROM (o.geohash, o.condition, o.location_lat, o.location_long)
+                    UNION ALL
+                    SELECT o.geohash, o.condition, o.location_lat, o.location_long, -1 AS delta FROM old_reports o JOIN new_reports n USING (id)
+                    WHERE (n.geohash, n.condition, n.location_lat, n.location_long) IS DISTINCT FROM (o.geohash, o.condition, o.location_lat, o.location_long)';
+    END IF;
+
+    EXECUTE format($sql$
+        WITH changes AS (%s)
+        INSERT INTO report_clusters (precision, cell, condition, report_count, lat_sum, lng_sum)
+        SELECT p, left(geohash, p), condition, sum(delta), sum(delta * location_lat::double precision), sum(delta * location_long::double precision)
+        FROM changes, generate_series(2, 6, 2) p
+        WHERE geohash IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (precision, cell, condition)
+        DO UPDATE SET report_count = report_clusters.report_count + EXCLUDED.report_count,
+                      lat_sum = report_clusters.lat_sum + EXCLUDED.lat_sum,
+                      lng_sum = report_clusters.lng_sum + EXCLUDED.lng_sum
+    $sql$, changes);
+    GET DIAGNOSTICS changed_rows = ROW_COUNT;
+
+    IF changed_rows > 0 THEN
+        UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'report_locations';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DELETE FROM report_clusters WHERE precision % 2 = 1;
+-- Tiles cached by running workers were built from the old rows
+UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'report_locations';
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+import psycopg2
+import requests
+from requests.adapters import HTTPAdapter
+from db_helpers import pooled_connection, PoolTimeout
+from instrumentation import timed, record_phase
+
+NOMINATIM_BASE_URL = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org")
+USER_AGENT = "HydroWave/1.0 (hydro-wave-app)"  # Required by Nominatim
+# Nominatim's usage policy allows one request per second. The rate is for the whole deployment,
+# every worker takes its slots from the same rate_limits row.
+NOMINATIM_RATE = float(os.getenv("NOMINATIM_RATE", "1"))
+NOMINATIM_BURST = int(os.getenv("NOMINATIM_BURST", "1"))
+# How long a request may queue for a rate limit slot before we give up on it
+NOMINATIM_MAX_WAIT = float(os.getenv("NOMINATIM_MAX_WAIT", "5"))
+NOMINATIM_TIMEOUT = float(os.getenv("NOMINATIM_TIMEOUT", "10"))
+# While the database is unreachable each worker limits itself to its share of the rate,
+# same default as gunicorn.conf.py
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# Takes a slot if one is due, generic cell rate algorithm style: next_at is when the next call is
+# due at the steady rate, and up to burst calls may run ahead of it. Otherwise returns how long
+# until one is.
+TAKE_SLOT = """WITH clock AS (SELECT clock_timestamp() AT TIME ZONE 'utc' AS now),
+                    taken AS (
+                        UPDATE rate_limits SET next_at = GREATEST(next_at, clock.now) + %(interval)s * interval '1 second'
+                        FROM clock
+                        WHERE name = %(name)s AND next_at - %(tolerance)s * interval '1 second' <= clock.now
+                        RETURNING 1
+                    )
+               SELECT EXISTS (SELECT 1 FROM taken), extract(epoch FROM next_at - %(tolerance)s * interval '1 second' - clock.now)
+               FROM rate_limits, clock
+               WHERE name = %(name)s"""
+# Shortest sleep between attempts, the wait read alongside a lost race can be stale
+MIN_RETRY_WAIT = 0.01
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, max_wait):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            # Tokens go negative while requests are queued, so each waiter gets its own slot
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > self.max_wait:
+                raise RateLimitExceeded("Geocoding rate limit exceeded, try again shortly")
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SharedRateLimiter:
+    # Rate limit kept in the rate_limits table, so it holds across workers and dynos. Waiting requests
+    # retry whenever the next slot is due until max_wait runs out. Falls back to a per-worker bucket
+    # with an equal share of the rate when the database can't be reached.
+    def __init__(self, name, rate, burst, max_wait, workers=WEB_CONCURRENCY):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.fallback = TokenBucket(rate / max(workers, 1), burst, max_wait)
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        params = {"name": self.name, "interval": 1 / self.rate, "tolerance": (self.burst - 1) / self.rate}
+        while True:
+            try:
+                with pooled_connection() as connection:
+                    cursor = connection.cursor()
+                    cursor.execute(TAKE_SLOT, params)
+                    row = cursor.fetchone()
+                    connection.commit()
+            except (psycopg2.Error, PoolTimeout):
+                return time.monotonic() - started + self.fallback.acquire()
+            if row is None:
+                raise RuntimeError(f"No rate_limits row named {self.name}, run python migrate.py")
+            taken, wait = row
+            if taken:
+                return time.monotonic() - started
+            wait = max(float(wait), MIN_RETRY_WAIT)
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded("Geocoding rate limit exceeded, try again shortly")
+            time.sleep(wait)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share the result of the first one
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class NominatimClient:
+    def __init__(self, base_url=NOMINATIM_BASE_URL, rate=NOMINATIM_RATE, burst=NOMINATIM_BURST,
+                 max_wait=NOMINATIM_MAX_WAIT, timeout=NOMINATIM_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limiter = SharedRateLimiter("nominatim", rate, burst, max_wait)
+        self.single_flight = SingleFlight()
+        # One keep-alive session per worker so calls skip the TCP and TLS handshakes
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+        self.stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0, "rate_limited": 0, "rate_wait_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def get(self, path, params):
+        # Returns (status_code, parsed JSON or None)
+        key = (path, tuple(sorted(params.items())))
+        self._count("requests")
+        leader = []
+
+        def call_upstream():
+            leader.append(True)
+            return self._request(path, params)
+
+        result = self.single_flight.do(key, call_upstream)
+        if not leader:
+            self._count("coalesced")
+        return result
+
+    def _request(self, path, params):
+        try:
+            waited = self.limiter.acquire()
+        except RateLimitExceeded:
+            self._count("rate_limited")
+            raise
+        self._count("upstream_calls")
+        self._count("rate_wait_seconds", waited)
+        record_phase("nominatim_wait", waited)
+        with timed("nominatim"):
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+        if response.status_code != 200:
+            return response.status_code, None
+        return response.status_code, response.json()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
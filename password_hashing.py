@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from instrumentation import timed
+
+# Work factor for new hashes, stored hashes with a lower cost are rehashed on sign-in
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+# bcrypt releases the GIL, so these threads use real cores; keep it below the worker's CPU share
+BCRYPT_MAX_CONCURRENCY = int(os.getenv('BCRYPT_MAX_CONCURRENCY', '2'))
+BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', '16'))
+# How long a hash may wait for a free thread before the request is turned away
+BCRYPT_QUEUE_TIMEOUT = float(os.getenv('BCRYPT_QUEUE_TIMEOUT', '2'))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_waiting = 0
+
+
+def get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_CONCURRENCY, thread_name_prefix="bcrypt")
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def run_bounded(function, *args):
+    global _waiting
+    with _lock:
+        if _waiting >= BCRYPT_MAX_QUEUE:
+            raise HasherBusy("Too many sign-in attempts in progress, try again shortly")
+        _waiting += 1
+        executor = get_executor()
+
+    started = threading.Event()
+
+    def task():
+        started.set()
+        return run_on_native_thread(function, *args)
+
+    try:
+        future = executor.submit(task)
+        # Give up on work that never got a thread, but let work that started finish
+        if not started.wait(BCRYPT_QUEUE_TIMEOUT) and future.cancel():
+            raise HasherBusy("Too many sign-in attempts in progress, try again shortly")
+    finally:
+        with _lock:
+            _waiting -= 1
+    return future.result()
+
+
+def run_on_native_thread(function, *args):
+    # Under gevent's monkey patching the executor's threads are greenlets, and a hash would stall every other
+    # request in the worker. gevent's own pool runs it on a real thread and this greenlet waits cooperatively.
+    if "gevent" in sys.modules:
+        from gevent import get_hub, monkey
+        if monkey.is_module_patched("threading"):
+            return get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+
+def hash_password(password):
+    with timed("bcrypt"):
+        hashed = run_bounded(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+
+def check_password(password, hashed):
+    with timed("bcrypt"):
+        return run_bounded(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def needs_rehash(hashed):
+    # bcrypt hashes look like $2b$12$..., the second field is the cost. A higher cost than ours is
+    # kept, lowering BCRYPT_ROUNDS shouldn't make every sign-in pay for a rehash.
+    try:
+        return int(hashed.split('$')[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
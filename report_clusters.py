@@ -0,0 +1,142 @@
+# Map clusters for GET /reports/clusters, read from the report_clusters table in
+# migrations/0010_report_clusters.sql instead of the reports themselves.
+#
+#   python report_clusters.py   recompute the table from scratch
+#
+# Triggers keep the table current, a rebuild is only needed to clear out empty cells or after
+# changing the migration.
+import os
+from dotenv import load_dotenv
+from cache import TTLCache
+from db_helpers import connect
+from geo import geohash_cell_size, geohash_cover, parse_bbox, tile_bounds, tile_for_point, tiles_covering
+
+load_dotenv()
+
+# report_clusters keeps cells of up to 6 characters, about 1.2 by 0.6 km
+MAX_CLUSTER_PRECISION = 6
+# Each zoom level clusters by the finest cells that are still this many pixels wide on the map
+CLUSTER_CELL_PIXELS = int(os.getenv("CLUSTER_CELL_PIXELS", "64"))
+# Past this zoom the reports themselves are returned, newest first and at most CLUSTER_MAX_REPORTS
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "14"))
+CLUSTER_MAX_REPORTS = int(os.getenv("CLUSTER_MAX_REPORTS", "500"))
+MAX_ZOOM = 22
+TILE_PIXELS = 256
+# A browser window spans a few dozen tiles, a box over more than this doesn't match its zoom
+MAX_TILES = 64
+CLUSTER_TILE_CACHE_SIZE = int(os.getenv("CLUSTER_TILE_CACHE_SIZE", "20000"))
+CLUSTER_TILE_CACHE_TTL = int(os.getenv("CLUSTER_TILE_CACHE_TTL", "3600"))
+
+# Clusters per (zoom, x, y) tile, stored as (report_locations version, clusters). A tile built
+# against an older version is rebuilt, so creating, moving or deleting a report in any worker
+# invalidates every worker's tiles.
+tile_cache = TTLCache(CLUSTER_TILE_CACHE_SIZE, CLUSTER_TILE_CACHE_TTL)
+
+
+def stored_precision(precision):
+    # report_clusters keeps even precisions, an odd one is rolled up from the next finer level
+    return precision + precision % 2
+
+
+def precision_for_zoom(zoom):
+    degrees_per_pixel = 360 / (TILE_PIXELS << zoom)
+    for precision in range(MAX_CLUSTER_PRECISION, 1, -1):
+        if geohash_cell_size(precision)[0] / degrees_per_pixel >= CLUSTER_CELL_PIXELS:
+            return precision
+    return 1
+
+
+def parse_cluster_args(args):
+    bbox = args.get("bbox")
+    zoom = args.get("zoom")
+    if not bbox or not zoom:
+        raise ValueError("bbox and zoom are required")
+    try:
+        zoom = int(zoom)
+    except ValueError:
+        raise ValueError("zoom must be an integer")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    bbox = parse_bbox(bbox)
+    tiles = tiles_covering(*bbox, zoom)
+    if len(tiles) > MAX_TILES:
+        raise ValueError(f"bbox spans more than {MAX_TILES} tiles at zoom {zoom}")
+    return bbox, zoom, tiles
+
+
+def cached_tiles(tiles, zoom, version):
+    # Returns the clusters of the tiles cached at this version, and the tiles still to build
+    clusters = []
+    missing = []
+    for x, y in tiles:
+        cached = tile_cache.get((zoom, x, y))
+        if cached is not None and cached[0] == version:
+            clusters.extend(cached[1])
+        else:
+            missing.append((x, y))
+    return clusters, missing
+
+
+def build_cells_query(tiles, zoom):
+    # One statement for all the missing tiles: every cell under the box around them, with its
+    # centroid and its most reported condition
+    precision = precision_for_zoom(zoom)
+    bounds = [tile_bounds(zoom, x, y) for x, y in tiles]
+    prefixes = sorted({prefix[:precision] for prefix in geohash_cover(min(b[0] for b in bounds), min(b[1] for b in bounds),
+                                                                      max(b[2] for b in bounds), max(b[3] for b in bounds))})
+    conditions = ["precision = %s", "report_count <> 0"]
+    params = [precision, stored_precision(precision)]
+    if prefixes != [""]:
+        conditions.append("(" + " OR ".join("cell LIKE %s" for _ in prefixes) + ")")
+        params.extend(prefix + "%" for prefix in prefixes)
+    query = f"""SELECT cell, sum(report_count)::integer AS count,
+                       sum(lat_sum) / sum(report_count) AS lat, sum(lng_sum) / sum(report_count) AS lng,
+                       (array_agg(condition ORDER BY report_count DESC, condition))[1] AS condition
+                FROM (
+                    SELECT left(cell, %s) AS cell, condition, sum(report_count) AS report_count,
+                           sum(lat_sum) AS lat_sum, sum(lng_sum) AS lng_sum
+                    FROM report_clusters
+                    WHERE {" AND ".join(conditions)}
+                    GROUP BY 1, 2
+                ) cells
+                WHERE report_count <> 0
+                GROUP BY cell"""
+    return query, params
+
+
+def cache_tiles(rows, tiles, zoom, version):
+    # Each cell belongs to the tile its centroid falls in, so a cell on a tile edge is counted once.
+    # Empty tiles are cached too.
+    clusters = {tile: [] for tile in tiles}
+    for cell, count, lat, lng, condition in rows:
+        tile_clusters = clusters.get(tile_for_point(lat, lng, zoom))
+        if tile_clusters is not None:
+            tile_clusters.append({"cell": cell, "count": count, "lat": round(lat, 6), "lng": round(lng, 6), "condition": condition})
+    for (x, y), tile_clusters in clusters.items():
+        tile_cache.set((zoom, x, y), (version, tile_clusters))
+    return [cluster for tile_clusters in clusters.values() for cluster in tile_clusters]
+
+
+def clusters_in_bbox(clusters, min_lat, min_lng, max_lat, max_lng):
+    return sorted((cluster for cluster in clusters
+                   if min_lat <= cluster["lat"] <= max_lat and min_lng <= cluster["lng"] <= max_lng),
+                  key=lambda cluster: cluster["cell"])
+
+
+def rebuild(connection):
+    cursor = connection.cursor()
+    # Holds off report writes until the new clusters are committed, reads of the old ones carry on
+    cursor.execute("LOCK TABLE reports IN SHARE MODE")
+    cursor.execute("DELETE FROM report_clusters")
+    cursor.execute("INSERT INTO report_clusters SELECT * FROM report_clusters_source")
+    # Cached tiles may be out of date, so they must not be served again
+    cursor.execute("UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'report_locations'")
+    connection.commit()
+
+
+if __name__ == '__main__':
+    connection = connect()
+    try:
+        rebuild(connection)
+    finally:
+        connection.close()
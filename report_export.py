@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime
+import psycopg2.extras
+from db_helpers import pooled_connection
+
+# Rows fetched from the server-side cursor per round trip, this bounds worker memory for any export size
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '2000'))
+# Output is buffered into chunks of about this many characters before being written to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+
+# Postgres renders timestamps inside json as ISO 8601, matching the rest of the export
+EXPORT_COMMENTS_JSON = """COALESCE((
+                SELECT json_agg(json_build_object(
+                    'comment_id', c.id,
+                    'comment_text', c.text,
+                    'comment_created_at', c.created_at,
+                    'comment_updated_at', c.updated_at,
+                    'comment_author_username', u_comment.username
+                ) ORDER BY c.id)
+                FROM comments c
+                LEFT JOIN users u_comment ON c.author = u_comment.id
+                WHERE c.report = r.id
+            ), '[]'::json) AS comments"""
+
+
+def parse_export_format(args):
+    export_format = args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def to_json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = None
+    for row in rows:
+        if columns is None:
+            columns = list(row.keys())
+            writer.writerow(columns)
+        values = []
+        for column in columns:
+            value = row[column]
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, list):
+                # Comments don't fit in a cell, so they go in as a JSON array
+                value = json.dumps(value, default=to_json_value)
+            values.append(value)
+        writer.writerow(values)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=to_json_value) + "\n"
+
+
+def geojson_lines(rows):
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    for row in rows:
+        properties = dict(row)
+        location_lat = properties.pop("location_lat")
+        location_long = properties.pop("location_long")
+        geometry = None
+        if location_lat is not None and location_long is not None:
+            geometry = {"type": "Point", "coordinates": [location_long, location_lat]}
+        feature = {"type": "Feature", "id": row["id"], "geometry": geometry, "properties": properties}
+        yield separator + json.dumps(feature, default=to_json_value)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+FORMAT_WRITERS = {
+    'csv': csv_lines,
+    'ndjson': ndjson_lines,
+    'geojson': geojson_lines,
+}
+
+
+def stream_rows(query, params):
+    # The export outlives the request's own connection, so it holds a pooled one until the last row.
+    # Closing the generator early (client disconnect) returns the connection, which rolls back and drops the cursor.
+    with pooled_connection() as connection:
+        cursor = connection.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.itersize = EXPORT_ITERSIZE
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+        cursor.close()
+        connection.commit()
+
+
+def export_reports(query, params, export_format):
+    chunk = []
+    chunk_size = 0
+    for line in FORMAT_WRITERS[export_format](stream_rows(query, params)):
+        chunk.append(line)
+        chunk_size += len(line)
+        if chunk_size >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,84 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from geo import bbox_conditions, parse_bbox
+
+# Columns that can be filtered on with a plain equality match
+EQUALITY_FILTERS = ("condition", "water_source", "status")
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def parse_report_filters(args):
+    # Build the WHERE conditions (on the reports alias r) and their parameters from the query string
+    conditions = []
+    params = []
+
+    for column in EQUALITY_FILTERS:
+        value = args.get(column)
+        if value:
+            conditions.append(f"r.{column} = %s")
+            params.append(value)
+
+    author = args.get("author")
+    if author:
+        conditions.append("r.author = (SELECT id FROM users WHERE username = %s)")
+        params.append(author)
+
+    reported_from = args.get("reported_from")
+    if reported_from:
+        conditions.append("r.reported_at >= %s")
+        params.append(parse_timestamp(reported_from, "reported_from"))
+
+    reported_to = args.get("reported_to")
+    if reported_to:
+        upper_bound = parse_timestamp(reported_to, "reported_to")
+        # A bare date includes the whole day
+        if len(reported_to) == 10:
+            upper_bound += timedelta(days=1)
+            conditions.append("r.reported_at < %s")
+        else:
+            conditions.append("r.reported_at <= %s")
+        params.append(upper_bound)
+
+    bbox = args.get("bbox")
+    if bbox:
+        bbox_sql, bbox_params = bbox_conditions(*parse_bbox(bbox))
+        conditions.extend(bbox_sql)
+        params.extend(bbox_params)
+
+    return conditions, params
+
+
+def parse_timestamp(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or timestamp")
+
+
+def parse_limit(args, default=DEFAULT_PAGE_SIZE):
+    limit = args.get("limit")
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(reported_at, report_id):
+    raw = json.dumps([reported_at.isoformat(), report_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    # Cursors are opaque to clients, anything we can't decode is a bad request
+    try:
+        reported_at, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(reported_at), int(report_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,44 @@
+import base64
+import json
+import os
+import re
+
+# Must match the configuration search_vector is built with, see migrations/0008_report_search.sql
+SEARCH_CONFIG = 'english'
+MAX_SEARCH_TERMS = 10
+# Only the newest matches are ranked. Ranking reads every candidate row, so ranking all matches of a
+# common word like "water" takes seconds on a large table, while the newest ones come straight off the
+# primary key index.
+SEARCH_MAX_RANKED = int(os.getenv('SEARCH_MAX_RANKED', '1000'))
+# The planner guesses how many reports several words or a prefix match by treating each word as
+# independent, which is far off for words that go together like "algae bloom". So the newest
+# SEARCH_PROBE_ROWS reports are checked first, and when their share of matches puts the newest
+# SEARCH_MAX_RANKED matches well within the last SEARCH_WALK_ROWS ids, those are read newest first
+# off the primary key. Rarer matches, and any below that window, come from the indexes.
+SEARCH_PROBE_ROWS = int(os.getenv('SEARCH_PROBE_ROWS', '2000'))
+SEARCH_WALK_ROWS = int(os.getenv('SEARCH_WALK_ROWS', '200000'))
+
+
+def parse_search_query(args):
+    # Turns free text into a tsquery where every word must match. The last word also matches as a
+    # prefix for type-ahead, so "algae blo" finds "algae bloom". Only letters and digits are kept,
+    # which leaves nothing for to_tsquery to misread as operators.
+    terms = re.findall(r"[^\W_]+", args.get("q", ""))[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise ValueError("q must contain at least one word")
+    if args.get("prefix", "true").lower() == "true":
+        terms[-1] += ":*"
+    return " & ".join(terms)
+
+
+def encode_search_cursor(rank, report_id):
+    raw = json.dumps([rank, report_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_search_cursor(cursor):
+    try:
+        rank, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(rank), int(report_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
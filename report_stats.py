@@ -0,0 +1,144 @@
+# Report counts for GET /reports/stats, read from the summary tables in migrations/0007_report_stats.sql
+# instead of the reports themselves.
+#
+#   python report_stats.py   recompute the summary tables from scratch
+#
+# Triggers keep the tables current, a rebuild is only needed to clear out empty buckets or after
+# changing the migration.
+from dotenv import load_dotenv
+from db_helpers import connect
+from report_filters import EQUALITY_FILTERS, parse_timestamp
+
+load_dotenv()
+
+# Series bucket -> expression over report_stats.day
+STATS_INTERVALS = {
+    "day": "day",
+    "week": "date_trunc('week', day)::date",
+    "month": "date_trunc('month', day)::date",
+}
+# report_cell_stats keeps 3 character geohash cells, coarser grids are prefixes of them
+MAX_GRID_PRECISION = 3
+DIMENSIONS = ("condition", "water_source", "status")
+
+
+def parse_stats_filters(args):
+    # The summary tables only know the day and the equality columns, so the other report filters can't apply
+    for unsupported in ("author", "bbox"):
+        if args.get(unsupported):
+            raise ValueError(f"{unsupported} can't be used with /reports/stats")
+    conditions = []
+    params = []
+    for column in EQUALITY_FILTERS:
+        value = args.get(column)
+        if value:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+
+    for name, operator in (("reported_from", ">="), ("reported_to", "<=")):
+        value = args.get(name)
+        if value:
+            if len(value) != 10:
+                raise ValueError(f"{name} must be a date, stats are kept per day")
+            conditions.append(f"day {operator} %s")
+            params.append(parse_timestamp(value, name).date())
+    return conditions, params
+
+
+def parse_grid_precision(args):
+    grid = args.get("grid")
+    if grid is None:
+        return None
+    try:
+        precision = int(grid)
+    except ValueError:
+        raise ValueError("grid must be an integer")
+    if not 1 <= precision <= MAX_GRID_PRECISION:
+        raise ValueError(f"grid must be between 1 and {MAX_GRID_PRECISION}")
+    return precision
+
+
+def build_stats_query(args):
+    # One statement: totals, per-dimension counts and the series from report_stats with GROUPING SETS,
+    # plus the grid from report_cell_stats when asked for. Each row is (dimension, value, count).
+    interval = args.get("interval", "day")
+    if interval not in STATS_INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(STATS_INTERVALS)}")
+    precision = parse_grid_precision(args)
+    conditions, params = parse_stats_filters(args)
+    if precision and (args.get("reported_from") or args.get("reported_to")):
+        raise ValueError("grid can't be combined with reported_from or reported_to, cells are kept for all time")
+
+    where = " AND ".join(["report_count <> 0"] + conditions)
+    query = f"""SELECT CASE WHEN GROUPING(condition) = 0 THEN 'condition'
+                            WHEN GROUPING(water_source) = 0 THEN 'water_source'
+                            WHEN GROUPING(status) = 0 THEN 'status'
+                            WHEN GROUPING(period) = 0 THEN 'period'
+                            ELSE 'total' END AS dimension,
+                       COALESCE(condition, water_source, status, period::text) AS value,
+                       sum(report_count)::integer AS count
+                FROM (SELECT condition, water_source, status, {STATS_INTERVALS[interval]} AS period, report_count
+                      FROM report_stats
+                      WHERE {where}) s
+                GROUP BY GROUPING SETS ((), (condition), (water_source), (status), (period))
+                HAVING sum(report_count) > 0 OR GROUPING(condition, water_source, status, period) = 15"""
+    query_params = list(params)
+    if precision:
+        query += f"""
+                UNION ALL
+                SELECT 'cell', left(cell, %s), sum(report_count)::integer
+                FROM report_cell_stats
+                WHERE {where}
+                GROUP BY 2
+                HAVING sum(report_count) > 0"""
+        query_params += [precision] + params
+    return query, query_params, interval, precision
+
+
+def summarize_stats(rows, interval, precision):
+    stats = {"interval": interval, "total": 0}
+    for dimension in DIMENSIONS:
+        stats[f"by_{dimension}"] = []
+    stats["series"] = []
+    if precision:
+        stats["grid_precision"] = precision
+        stats["grid"] = []
+
+    for dimension, value, count in rows:
+        if dimension == "total":
+            # sum() over no rows is NULL
+            stats["total"] = count or 0
+        elif dimension == "period":
+            stats["series"].append({"period": value, "count": count})
+        elif dimension == "cell":
+            stats["grid"].append({"cell": value, "count": count})
+        else:
+            # Missing values are stored as ''
+            stats[f"by_{dimension}"].append({dimension: value or None, "count": count})
+
+    # The series only has periods with reports in them
+    stats["series"].sort(key=lambda point: point["period"])
+    for key in [f"by_{dimension}" for dimension in DIMENSIONS] + (["grid"] if precision else []):
+        stats[key].sort(key=lambda entry: -entry["count"])
+    return stats
+
+
+def rebuild(connection):
+    cursor = connection.cursor()
+    # Holds off report writes until the new counts are committed, reads of the old counts carry on
+    cursor.execute("LOCK TABLE reports IN SHARE MODE")
+    cursor.execute("DELETE FROM report_stats")
+    cursor.execute("INSERT INTO report_stats SELECT * FROM report_stats_source")
+    cursor.execute("DELETE FROM report_cell_stats")
+    cursor.execute("INSERT INTO report_cell_stats SELECT * FROM report_cell_stats_source")
+    # Counts may have changed, so cached /reports/stats responses must not be served again
+    cursor.execute("UPDATE data_versions SET version = version + 1, updated_at = clock_timestamp() AT TIME ZONE 'utc' WHERE name = 'reports'")
+    connection.commit()
+
+
+if __name__ == '__main__':
+    connection = connect()
+    try:
+        rebuild(connection)
+    finally:
+        connection.close()
@@ -1,24 +1,78 @@
-from flask import Blueprint, jsonify, request, g
-from db_helpers import get_db_connection, consolidate_comments_in_reports
+from flask import Blueprint, jsonify, request, g, Response, stream_with_context
+from db_helpers import get_db_connection, consolidate_comments_in_reports, query_budget
+from http_caching import versioned_read, get_data_version
+from response_cache import response_cache
 import psycopg2, psycopg2.extras
 from auth_middleware import token_required
-from main import upload_image
+from image_uploads import ASYNC_IMAGE_UPLOADS, upload_report_image, new_upload_id, schedule_image_upload
+from report_filters import parse_report_filters, parse_limit, encode_cursor, decode_cursor
+from bulk_ingest import ingest_reports
+from report_export import EXPORT_FORMATS, EXPORT_COMMENTS_JSON, parse_export_format, export_reports
+from report_stats import build_stats_query, summarize_stats
+from report_clusters import CLUSTER_MAX_ZOOM, CLUSTER_MAX_REPORTS, precision_for_zoom, parse_cluster_args, cached_tiles, build_cells_query, cache_tiles, clusters_in_bbox
+from report_search import SEARCH_CONFIG, SEARCH_MAX_RANKED, SEARCH_PROBE_ROWS, SEARCH_WALK_ROWS, parse_search_query, encode_search_cursor, decode_search_cursor
+from geo import geohash_encode, radius_to_bbox, bbox_conditions, distance_sql, parse_coordinate
 from datetime import datetime 
+import os
 
 reports_blueprint = Blueprint('reports_blueprint', __name__)
 
+# Let Postgres build each report's comments array instead of consolidating joined rows in Python
+AGGREGATE_COMMENTS_IN_DB = os.getenv('AGGREGATE_COMMENTS_IN_DB', 'false').lower() == 'true'
+MAX_NEAR_RADIUS_M = 100000
+
+REPORT_COLUMNS = """r.id, r.author AS report_author_id, r.title, r.reported_at, r.water_source, r.water_feature, r.location_lat, r.location_long, r.location_name, r.observation, r.condition, r.status, r.created_at, r.updated_at, r.image_url, r.image_status, u_report.username AS author_username"""
+
+# Timestamps are formatted the way jsonify renders datetimes so both paths return identical JSON
+COMMENTS_JSON = """COALESCE((
+                SELECT json_agg(json_build_object(
+                    'comment_id', c.id,
+                    'comment_text', c.text,
+                    'comment_created_at', to_char(c.created_at, 'Dy, DD Mon YYYY HH24:MI:SS "GMT"'),
+                    'comment_updated_at', to_char(c.updated_at, 'Dy, DD Mon YYYY HH24:MI:SS "GMT"'),
+                    'comment_author_username', u_comment.username
+                ) ORDER BY c.id)
+                FROM comments c
+                LEFT JOIN users u_comment ON c.author = u_comment.id
+                WHERE c.report = r.id
+            ), '[]'::json) AS comments"""
+
+# Comments per report on the page, counted in one grouped pass instead of joining every comment row
+COMMENT_COUNT = "COALESCE(comment_counts.comment_count, 0) AS comment_count"
+COMMENT_COUNTS_JOIN = """LEFT JOIN (
+                    SELECT report, count(*) AS comment_count
+                    FROM comments
+                    WHERE report IN (SELECT id FROM page)
+                    GROUP BY report
+                ) comment_counts ON comment_counts.report = r.id"""
+
+def report_geohash(location_lat, location_long):
+    if location_lat in (None, "") or location_long in (None, ""):
+        return None
+    return geohash_encode(float(location_lat), float(location_long))
+
 # Create a report - POST /reports
 @reports_blueprint.route('/reports', methods=['POST'])
 @token_required
+@query_budget(1)
 def create_report():
     try:
         image = request.files.get("image_url")
         # image_url refers to the column name on the reports table
         # If the user does not upload an image it will default to None
         image_url = None
+        image_status = None
+        upload_id = None
+        pending_image = None
         # If the user does upload an image, then we update our image_url field to the uploaded image
-        if image:
-            image_url = upload_image(image)
+        # In async mode the row is saved first and the upload fills in image_url when it finishes
+        if image and ASYNC_IMAGE_UPLOADS:
+            pending_image = image.read()
+            image_status = "pending"
+            upload_id = new_upload_id()
+        elif image:
+            image_url = upload_report_image(image)
+            image_status = "ready"
 
         # Set the author_id to be the id of the currently logged in user
         author_id = g.user["id"]
@@ -34,6 +88,8 @@ def create_report():
         observation = request.form.get("observation")
         condition = request.form.get("condition")
         status = request.form.get("status")
+        # Spatial index key, kept in sync with the coordinates on every write
+        geohash = report_geohash(location_lat, location_long)
 
         # Connect to the database
         connection = get_db_connection()
@@ -41,18 +97,13 @@ def create_report():
             cursor_factory=psycopg2.extras.RealDictCursor)
 
         # Insert all the form data into the database
-        cursor.execute("""
-                        INSERT INTO reports (author, title, reported_at, water_source, water_feature, location_lat, location_long, location_name, observation, condition, status, created_at, updated_at, image_url)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                        """,
-                       (author_id, title, reported_at, water_source, water_feature, location_lat, location_long, location_name, observation, condition, status, datetime.utcnow(), datetime.utcnow(), image_url)
-                       )
-        report_id = cursor.fetchone()["id"]
-
-        # Join the user table and the reports table
-        # Show the newly created information along with the user information
-        cursor.execute("""SELECT r.id, 
+        # and return it joined with the user information in the same round trip
+        cursor.execute("""WITH inserted AS (
+                            INSERT INTO reports (author, title, reported_at, water_source, water_feature, location_lat, location_long, location_name, observation, condition, status, created_at, updated_at, image_url, image_status, image_upload_id, geohash)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                            RETURNING *
+                        )
+                        SELECT r.id, 
                             r.author AS report_author_id, 
                             r.title, 
                             r.reported_at, 
@@ -67,63 +118,365 @@ def create_report():
                             r.created_at,
                             r.updated_at,
                             r.image_url,
+                            r.image_status,
                             u_report.username AS author_username
-                        FROM reports r
+                        FROM inserted r
                         JOIN users u_report ON r.author = u_report.id
-                        WHERE r.id = %s
-                       """, (report_id,))
+                        """,
+                       (author_id, title, reported_at, water_source, water_feature, location_lat, location_long, location_name, observation, condition, status, datetime.utcnow(), datetime.utcnow(), image_url, image_status, upload_id, geohash)
+                       )
         created_report = cursor.fetchone()
         connection.commit()
-        connection.close()
+
+        if pending_image is not None:
+            schedule_image_upload(created_report["id"], upload_id, pending_image)
 
         # Return the newly created information
         return jsonify(created_report), 201
     except Exception as error:
         return jsonify({"error": str(error)}), 500
-    
+
+# Bulk create reports - POST /reports/bulk
+# Body is CSV (with a header row) or NDJSON using the create_report field names, images are not supported.
+# Valid rows are loaded with COPY in one transaction, invalid rows are skipped and reported back by row number.
+@reports_blueprint.route('/reports/bulk', methods=['POST'])
+@token_required
+def bulk_create_reports():
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        result = ingest_reports(cursor, request.stream, request.mimetype, g.user["id"])
+        connection.commit()
+
+        status_code = 201 if result["inserted"] else 400 if result["error_count"] else 200
+        return jsonify(result), status_code
+    except ValueError as error:
+        connection.rollback()
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
+
 # Read reports - GET /reports
+# Supports filters on condition, water_source, status, author and a reported_from/reported_to range.
+# Passing limit and/or cursor switches to keyset pagination on (reported_at, id), newest first.
+# Reports carry a comment_count, the comments themselves come from GET /reports/<id>/comments
+# unless include_comments=true asks for them inline.
 @reports_blueprint.route('/reports', methods=['GET'])
+@query_budget(2)
+@versioned_read
 def reports_index():
     try:
+        conditions, params = parse_report_filters(request.args)
+        paginated = "limit" in request.args or "cursor" in request.args
+        limit = parse_limit(request.args) if paginated else None
+        include_comments = request.args.get("include_comments", "false").lower() == "true"
+        cursor_value = request.args.get("cursor")
+        if cursor_value:
+            conditions.append("(r.reported_at, r.id) < (%s, %s)")
+            params.extend(decode_cursor(cursor_value))
+
+        # Pick the page of reports first so the limit applies to reports, not joined comment rows
+        page_query = "SELECT r.* FROM reports r"
+        if conditions:
+            page_query += " WHERE " + " AND ".join(conditions)
+        page_query += " ORDER BY r.reported_at DESC, r.id DESC"
+        if limit is not None:
+            page_query += " LIMIT %s"
+            params.append(limit)
+
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("""SELECT r.id, r.author AS report_author_id, r.title, r.reported_at, r.water_source, r.water_feature, r.location_lat, r.location_long, r.location_name, r.observation, r.condition, r.status, r.created_at, r.updated_at, r.image_url, u_report.username AS author_username, c.id AS comment_id, c.text AS comment_text, c.created_at AS comment_created_at, c.updated_at AS comment_updated_at, u_comment.username AS comment_author_username
-                            FROM reports r
+        if not include_comments:
+            cursor.execute(f"""WITH page AS ({page_query})
+                                SELECT {REPORT_COLUMNS}, {COMMENT_COUNT}
+                                FROM page r
+                                INNER JOIN users u_report ON r.author = u_report.id
+                                {COMMENT_COUNTS_JOIN}
+                                ORDER BY r.reported_at DESC, r.id DESC;
+                           """, params)
+            consolidated_reports = cursor.fetchall()
+        elif AGGREGATE_COMMENTS_IN_DB:
+            cursor.execute(f"""WITH page AS ({page_query})
+                                SELECT {REPORT_COLUMNS}, {COMMENT_COUNT}, {COMMENTS_JSON}
+                                FROM page r
+                                INNER JOIN users u_report ON r.author = u_report.id
+                                {COMMENT_COUNTS_JOIN}
+                                ORDER BY r.reported_at DESC, r.id DESC;
+                           """, params)
+            consolidated_reports = cursor.fetchall()
+        else:
+            cursor.execute(f"""WITH page AS ({page_query})
+                                SELECT {REPORT_COLUMNS}, {COMMENT_COUNT}, c.id AS comment_id, c.text AS comment_text, c.created_at AS comment_created_at, c.updated_at AS comment_updated_at, u_comment.username AS comment_author_username
+                                FROM page r
+                                INNER JOIN users u_report ON r.author = u_report.id
+                                {COMMENT_COUNTS_JOIN}
+                                LEFT JOIN comments c ON r.id = c.report
+                                LEFT JOIN users u_comment ON c.author = u_comment.id
+                                ORDER BY r.reported_at DESC, r.id DESC, c.id;
+                           """, params)
+            reports = cursor.fetchall()
+
+            consolidated_reports = consolidate_comments_in_reports(reports)
+
+        connection.commit()
+        if not paginated:
+            return jsonify(consolidated_reports), 200
+
+        next_cursor = None
+        if len(consolidated_reports) == limit:
+            last_report = consolidated_reports[-1]
+            next_cursor = encode_cursor(last_report["reported_at"], last_report["id"])
+        return jsonify({"reports": consolidated_reports, "next_cursor": next_cursor}), 200
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
+
+# Reports near a point - GET /reports/near?lat=&lng=&radius=
+# radius is in meters, results are ordered by distance and accept the same filters as GET /reports
+@reports_blueprint.route('/reports/near', methods=['GET'])
+@query_budget(2)
+@versioned_read
+def reports_near():
+    try:
+        lat = parse_coordinate(request.args.get("lat"), "lat", 90)
+        lng = parse_coordinate(request.args.get("lng"), "lng", 180)
+        try:
+            radius = float(request.args.get("radius", 5000))
+        except ValueError:
+            raise ValueError("radius must be a number")
+        if not 0 < radius <= MAX_NEAR_RADIUS_M:
+            raise ValueError(f"radius must be between 0 and {MAX_NEAR_RADIUS_M} meters")
+        limit = parse_limit(request.args)
+
+        conditions, params = parse_report_filters(request.args)
+        bbox_sql, bbox_params = bbox_conditions(*radius_to_bbox(lat, lng, radius))
+        conditions.extend(bbox_sql)
+        params.extend(bbox_params)
+        distance, distance_params = distance_sql(lat, lng)
+
+        connection = get_db_connection()
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(f"""SELECT * FROM (
+                                SELECT {REPORT_COLUMNS}, {distance} AS distance_m
+                                FROM reports r
+                                INNER JOIN users u_report ON r.author = u_report.id
+                                WHERE {" AND ".join(conditions)}
+                            ) nearby
+                            WHERE distance_m <= %s
+                            ORDER BY distance_m, id
+                            LIMIT %s;
+                       """, distance_params + params + [radius, limit])
+        reports = cursor.fetchall()
+        return jsonify(reports), 200
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
+
+# Search reports - GET /reports/search?q=&limit=&cursor=
+# Matches q against the title, observation and location name and ranks the newest SEARCH_MAX_RANKED
+# matches, best first. Accepts the same filters as GET /reports, pass prefix=false to match the last
+# word exactly rather than as a prefix. Pages by keyset on (rank, id), pass next_cursor back as cursor.
+# truncated is true when more matches exist than were ranked, the older ones are left out.
+@reports_blueprint.route('/reports/search', methods=['GET'])
+@query_budget(2)
+@versioned_read
+def search_reports():
+    try:
+        search_query = parse_search_query(request.args)
+        limit = parse_limit(request.args)
+        conditions, params = parse_report_filters(request.args)
+        conditions.insert(0, "r.search_vector @@ query")
+        where = " AND ".join(conditions)
+        matches = [search_query] + params
+        page_condition = ""
+        page_params = []
+        cursor_value = request.args.get("cursor")
+        if cursor_value:
+            page_condition = "WHERE (r.rank, r.id) < (%s::real, %s)"
+            page_params = list(decode_search_cursor(cursor_value))
+
+        connection = get_db_connection()
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # walk.boundary splits the candidates: ids above it are read newest first off the primary key,
+        # those at or below it through the indexes. It is the newest id when the probe finds matches
+        # too sparse to walk for, so everything comes from the indexes. "id + 0" keeps the planner off
+        # the primary key there, it would otherwise walk the whole table for a rare prefix. One
+        # candidate past SEARCH_MAX_RANKED tells whether older matches were left out.
+        cursor.execute(f"""WITH walk AS MATERIALIZED (
+                                SELECT coalesce(max(id), 0) - CASE WHEN (
+                                    SELECT count(*)
+                                    FROM (SELECT * FROM reports ORDER BY id DESC LIMIT %s) r, to_tsquery('{SEARCH_CONFIG}', %s) query
+                                    WHERE {where}
+                                ) * %s >= 2 * %s * %s THEN %s ELSE 0 END AS boundary
+                                FROM reports
+                            )
+                            SELECT {REPORT_COLUMNS}, r.rank, r.matched, r.remaining
+                            FROM (
+                                SELECT r.*, count(*) OVER () AS remaining
+                                FROM (
+                                    SELECT r.*, ts_rank(r.search_vector, r.query) AS rank, count(*) OVER () AS matched
+                                    FROM (
+                                        (SELECT r.*, query
+                                         FROM (SELECT * FROM reports WHERE id > (SELECT boundary FROM walk) ORDER BY id DESC LIMIT %s) r,
+                                              to_tsquery('{SEARCH_CONFIG}', %s) query
+                                         WHERE {where})
+                                        UNION ALL
+                                        (SELECT r.*, query
+                                         FROM reports r, to_tsquery('{SEARCH_CONFIG}', %s) query
+                                         WHERE {where} AND r.id + 0 <= (SELECT boundary FROM walk)
+                                         ORDER BY r.id + 0 DESC)
+                                        LIMIT %s
+                                    ) r
+                                    ORDER BY r.id DESC
+                                    LIMIT %s
+                                ) r
+                                {page_condition}
+                                ORDER BY r.rank DESC, r.id DESC
+                                LIMIT %s
+                            ) r
                             INNER JOIN users u_report ON r.author = u_report.id
-                            LEFT JOIN comments c ON r.id = c.report
-                            LEFT JOIN users u_comment ON r.author = u_comment.id;
-                       """)
+                            ORDER BY r.rank DESC, r.id DESC;
+                       """, [SEARCH_PROBE_ROWS] + matches + [SEARCH_WALK_ROWS, SEARCH_MAX_RANKED, SEARCH_PROBE_ROWS, SEARCH_WALK_ROWS]
+                            + [SEARCH_WALK_ROWS] + matches + matches + [SEARCH_MAX_RANKED + 1, SEARCH_MAX_RANKED]
+                            + page_params + [limit])
         reports = cursor.fetchall()
+        connection.commit()
+
+        truncated = False
+        next_cursor = None
+        for report in reports:
+            truncated = report.pop("matched") > SEARCH_MAX_RANKED
+            remaining = report.pop("remaining")
+        if reports and remaining > limit:
+            next_cursor = encode_search_cursor(reports[-1]["rank"], reports[-1]["id"])
+        return jsonify({"reports": reports, "next_cursor": next_cursor, "truncated": truncated}), 200
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
+
+# Export reports - GET /reports/export?format=csv|ndjson|geojson&include_comments=true
+# Accepts the same filters as GET /reports and streams every matching report, oldest first
+@reports_blueprint.route('/reports/export', methods=['GET'])
+def export_reports_route():
+    try:
+        export_format = parse_export_format(request.args)
+        conditions, params = parse_report_filters(request.args)
+        include_comments = request.args.get("include_comments", "false").lower() == "true"
+
+        columns = REPORT_COLUMNS + (", " + EXPORT_COMMENTS_JSON if include_comments else "")
+        query = f"""SELECT {columns}
+                    FROM reports r
+                    INNER JOIN users u_report ON r.author = u_report.id"""
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.reported_at, r.id"
+
+        response = Response(stream_with_context(export_reports(query, params, export_format)), mimetype=EXPORT_FORMATS[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename="reports.{export_format}"'
+        return response
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
+
+# Report counts - GET /reports/stats?interval=day|week|month&grid=1-3
+# Totals, counts per condition, water source and status, and a time series, read from the summary
+# tables kept by triggers. Accepts the condition, water_source, status and reported_from/reported_to
+# (dates) filters. grid adds counts per geohash cell of that precision, for all time.
+@reports_blueprint.route('/reports/stats', methods=['GET'])
+@query_budget(2)
+@versioned_read
+def reports_stats():
+    try:
+        query, params, interval, precision = build_stats_query(request.args)
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        stats = summarize_stats(cursor.fetchall(), interval, precision)
+        connection.commit()
+        return jsonify(stats), 200
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as error:
+        return jsonify({"error": str(error)}), 500
 
-        consolidated_reports = consolidate_comments_in_reports(reports)
+# Map markers - GET /reports/clusters?bbox=min_lng,min_lat,max_lng,max_lat&zoom=0-22
+# Up to CLUSTER_MAX_ZOOM, clusters with their report count, centroid and most reported condition, built
+# from the cluster table kept by triggers and cached per map tile. Past it, the reports in the box.
+@reports_blueprint.route('/reports/clusters', methods=['GET'])
+@query_budget(2)
+def reports_clusters():
+    try:
+        (min_lat, min_lng, max_lat, max_lng), zoom, tiles = parse_cluster_args(request.args)
+        connection = get_db_connection()
+        if zoom > CLUSTER_MAX_ZOOM:
+            conditions, params = bbox_conditions(min_lat, min_lng, max_lat, max_lng)
+            cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(f"""SELECT r.id, r.title, r.location_lat, r.location_long, r.condition, r.status
+                                FROM reports r
+                                WHERE {" AND ".join(conditions)}
+                                ORDER BY r.reported_at DESC, r.id DESC
+                                LIMIT %s""", params + [CLUSTER_MAX_REPORTS + 1])
+            reports = cursor.fetchall()
+            connection.commit()
+            return jsonify({"zoom": zoom, "precision": None, "clusters": [], "reports": reports[:CLUSTER_MAX_REPORTS],
+                            "truncated": len(reports) > CLUSTER_MAX_REPORTS}), 200
 
+        # Read before the cells, so a write landing in between only makes the new tiles look older than they are
+        version = get_data_version('report_locations')[0]
+        clusters, missing = cached_tiles(tiles, zoom, version)
+        if missing:
+            query, params = build_cells_query(missing, zoom)
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            clusters.extend(cache_tiles(cursor.fetchall(), missing, zoom, version))
         connection.commit()
-        connection.close()
-        return jsonify(consolidated_reports), 200
+        return jsonify({"zoom": zoom, "precision": precision_for_zoom(zoom), "reports": [], "truncated": False,
+                        "clusters": clusters_in_bbox(clusters, min_lat, min_lng, max_lat, max_lng)}), 200
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
     except Exception as error:
         return jsonify({"error": str(error)}), 500
 
+# Response cache hit ratio and memory use for this worker - GET /reports/cache-stats
+@reports_blueprint.route('/reports/cache-stats', methods=['GET'])
+def reports_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
 # Read a single report - GET /reports/<report_id>
 @reports_blueprint.route('/reports/<report_id>', methods=['GET'])
+@query_budget(2)
+@versioned_read
 def show_report(report_id):
     try:
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("""
-            SELECT r.id, r.author AS report_author_id, r.title, r.reported_at, r.water_source, r.water_feature, r.location_lat, r.location_long, r.location_name, r.observation, r.condition, r.status, r.created_at, r.updated_at, r.image_url, u_report.username AS author_username, c.id AS comment_id, c.text AS comment_text, c.created_at AS comment_created_at, c.updated_at AS comment_updated_at, u_comment.username AS comment_author_username
-            FROM reports r
-            INNER JOIN users u_report ON r.author = u_report.id
-            LEFT JOIN comments c ON r.id = c.report
-            LEFT JOIN users u_comment ON c.author = u_comment.id
-            WHERE r.id = %s;""",
-                       (report_id,))
-        unprocessed_report = cursor.fetchall()
-        if unprocessed_report is not None:
-            processed_report = consolidate_comments_in_reports(unprocessed_report)[0]
-            connection.close()
+        if AGGREGATE_COMMENTS_IN_DB:
+            cursor.execute(f"""
+                SELECT {REPORT_COLUMNS}, {COMMENTS_JSON}
+                FROM reports r
+                INNER JOIN users u_report ON r.author = u_report.id
+                WHERE r.id = %s;""",
+                           (report_id,))
+            processed_report = cursor.fetchone()
+        else:
+            cursor.execute(f"""
+                SELECT {REPORT_COLUMNS}, c.id AS comment_id, c.text AS comment_text, c.created_at AS comment_created_at, c.updated_at AS comment_updated_at, u_comment.username AS comment_author_username
+                FROM reports r
+                INNER JOIN users u_report ON r.author = u_report.id
+                LEFT JOIN comments c ON r.id = c.report
+                LEFT JOIN users u_comment ON c.author = u_comment.id
+                WHERE r.id = %s;""",
+                           (report_id,))
+            unprocessed_report = cursor.fetchall()
+            processed_report = consolidate_comments_in_reports(unprocessed_report)[0] if unprocessed_report else None
+
+        if processed_report is not None:
             return jsonify(processed_report), 200
         else:
-            connection.close()
             return jsonify({"error": "Report not found"}), 404
     except Exception as error:
         return jsonify({"error": str(error)}), 500
@@ -131,15 +484,25 @@ def show_report(report_id):
 # Update a report - PUT /reports/<report_id>
 @reports_blueprint.route('/reports/<report_id>', methods=['PUT'])
 @token_required
+@query_budget(1)
 def update_report(report_id):
     try:
         image = request.files.get("image_url")
         # image_url refers to the column name on the reports table
         # If the user does not upload an image it will default to None
         image_url = None
+        image_status = None
+        upload_id = None
+        pending_image = None
         # If the user does upload an image, then we update our image_url field to the uploaded image
-        if image:
-            image_url = upload_image(image)
+        # In async mode the row is saved first and the upload fills in image_url when it finishes
+        if image and ASYNC_IMAGE_UPLOADS:
+            pending_image = image.read()
+            image_status = "pending"
+            upload_id = new_upload_id()
+        elif image:
+            image_url = upload_report_image(image)
+            image_status = "ready"
 
         # Check for image removal signal from frontend
         remove_image = request.form.get("remove_image")
@@ -155,35 +518,33 @@ def update_report(report_id):
         observation = request.form.get("observation")
         condition = request.form.get("condition")
         status = request.form.get("status")
+        geohash = report_geohash(location_lat, location_long)
         
         # Connect to the database
         connection = get_db_connection()
         cursor = connection.cursor(
             cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("SELECT * FROM reports WHERE reports.id = %s", (report_id,))
-        report_to_update = cursor.fetchone()
-        if report_to_update is None:
-            return jsonify({"error": "Report not found"}), 404
-        connection.commit()
-        if report_to_update["author"] is not g.user["id"]:
-            return jsonify({"error": "Unauthorized"}), 401
 
-        # Decide final image_url value
-        if remove_image == "true":
-            final_image_url = None
-        elif image_url:
-            final_image_url = image_url
-        else:
-            final_image_url = report_to_update.get("image_url")
-
-         # Update all the form data in the database
-        cursor.execute("UPDATE reports SET title = %s, reported_at = %s, water_source = %s, water_feature = %s, location_lat = %s, location_long = %s, location_name = %s, observation = %s, condition = %s, status = %s, updated_at = %s, image_url = %s WHERE reports.id = %s RETURNING *",
-                       (title, reported_at, water_source, water_feature, location_lat, location_long, location_name, observation, condition, status, datetime.utcnow(), final_image_url, report_id))
-        report_id = cursor.fetchone()["id"]
-
-        # Join the user table and the reports table
-        # Show the newly created information along with the user information
-        cursor.execute("""SELECT r.id, 
+        # One statement checks ownership, updates the row, drops stale AI insights and joins the user information.
+        # The image columns follow the form: removal wins, then a new upload, otherwise the current values stay
+        # (a pending upload keeps the current image until the new one is ready)
+        cursor.execute("""WITH target AS (
+                            SELECT id, author, image_url, image_status, image_upload_id FROM reports WHERE id = %(report_id)s
+                        ),
+                        updated AS (
+                            UPDATE reports r SET title = %(title)s, reported_at = %(reported_at)s, water_source = %(water_source)s, water_feature = %(water_feature)s, location_lat = %(location_lat)s, location_long = %(location_long)s, location_name = %(location_name)s, observation = %(observation)s, condition = %(condition)s, status = %(status)s, updated_at = %(updated_at)s, geohash = %(geohash)s,
+                                image_url = CASE WHEN %(remove_image)s THEN NULL WHEN %(image_url)s::text IS NOT NULL THEN %(image_url)s ELSE t.image_url END,
+                                image_status = CASE WHEN %(remove_image)s THEN NULL WHEN %(image_status)s::text IS NOT NULL THEN %(image_status)s ELSE t.image_status END,
+                                image_upload_id = CASE WHEN %(remove_image)s THEN NULL WHEN %(image_status)s::text IS NOT NULL THEN %(upload_id)s ELSE t.image_upload_id END
+                            FROM target t
+                            WHERE r.id = t.id AND t.author = %(user_id)s
+                            RETURNING r.*
+                        ),
+                        -- Stored AI insights were generated from the old report fields
+                        invalidated AS (
+                            DELETE FROM ai_insights WHERE report_id IN (SELECT id FROM updated)
+                        )
+                        SELECT r.id, 
                             r.author AS report_author_id, 
                             r.title, 
                             r.reported_at, 
@@ -198,14 +559,27 @@ def update_report(report_id):
                             r.created_at,
                             r.updated_at,
                             r.image_url,
+                            r.image_status,
                             u_report.username AS author_username
-                        FROM reports r
-                        JOIN users u_report ON r.author = u_report.id
-                        WHERE r.id = %s
-                       """, (report_id,))
+                        FROM target t
+                        LEFT JOIN updated r ON r.id = t.id
+                        LEFT JOIN users u_report ON r.author = u_report.id
+                       """,
+                       {"report_id": report_id, "title": title, "reported_at": reported_at, "water_source": water_source,
+                        "water_feature": water_feature, "location_lat": location_lat, "location_long": location_long,
+                        "location_name": location_name, "observation": observation, "condition": condition, "status": status,
+                        "updated_at": datetime.utcnow(), "geohash": geohash, "remove_image": remove_image == "true",
+                        "image_url": image_url, "image_status": image_status, "upload_id": upload_id, "user_id": g.user["id"]})
         updated_report = cursor.fetchone()
+        if updated_report is None:
+            return jsonify({"error": "Report not found"}), 404
+        # The target exists but nothing was updated, so it belongs to someone else
+        if updated_report["id"] is None:
+            return jsonify({"error": "Unauthorized"}), 401
         connection.commit()
-        connection.close()
+
+        if pending_image is not None and remove_image != "true":
+            schedule_image_upload(report_id, upload_id, pending_image)
         return jsonify(updated_report), 200
     except Exception as error:
         return jsonify({"error": str(error)}), 500
@@ -213,20 +587,28 @@ def update_report(report_id):
 # Delete a report - DELETE /reports/<report_id>
 @reports_blueprint.route('/reports/<report_id>', methods=['DELETE'])
 @token_required
+@query_budget(1)
 def delete_report(report_id):
     try:
         connection = get_db_connection()
         cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("SELECT * FROM reports WHERE reports.id = %s", (report_id,))
+        # Check ownership and delete in one round trip, returning the report as it was
+        # (the columns SELECT * returned before search_vector was added)
+        cursor.execute("""WITH target AS (
+                            SELECT id, author, title, reported_at, water_source, water_feature, location_lat, location_long, observation, condition, status, image_url, image_status, image_upload_id, created_at, updated_at, location_name, geohash
+                            FROM reports WHERE reports.id = %s
+                        ),
+                        deleted AS (
+                            DELETE FROM reports r USING target t WHERE r.id = t.id AND t.author = %s RETURNING r.id
+                        )
+                        SELECT target.*, EXISTS (SELECT 1 FROM deleted) AS deleted FROM target""",
+                       (report_id, g.user["id"]))
         report_to_delete = cursor.fetchone()
         if report_to_delete is None:
             return jsonify({"error": "Report not found"}), 404
-        connection.commit()
-        if report_to_delete["author"] is not g.user["id"]:
+        if not report_to_delete.pop("deleted"):
             return jsonify({"error": "Unauthorized"}), 401
-        cursor.execute("DELETE FROM reports WHERE reports.id = %s", (report_id,))
         connection.commit()
-        connection.close()
         return jsonify(report_to_delete), 200
     except Exception as error:
-        return jsonify({"error": str(error)}), 500    
\ No newline at end of file
+        return jsonify({"error": str(error)}), 500
@@ -0,0 +1,69 @@
+# Shared setup for the test suite.
+#
+#   python -m pytest tests
+#
+# Point the app's database settings at a scratch database, the tests apply the migrations and
+# write users and reports to it. External services are replaced as in the benchmarks.
+import os
+import sys
+import uuid
+
+import pytest
+
+os.environ.setdefault('JWT_SECRET', 'test-secret-that-is-long-enough-for-hs256')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+os.environ.setdefault('AI_CLIENT', 'fake')
+os.environ.setdefault('IMAGE_UPLOADER', 'local')
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import migrate
+from db_helpers import connect
+
+
+@pytest.fixture(scope="session")
+def database():
+    connection = connect()
+    migrate.migrate(connection)
+    yield connection
+    connection.close()
+
+
+# Form fields for POST /reports, override per test
+REPORT_FORM = {
+    "title": "Algae bloom", "reported_at": "2024-05-01T10:00:00", "water_source": "Lake",
+    "water_feature": "Shore", "location_lat": "40.71", "location_long": "-74.0", "location_name": "NYC",
+    "observation": "green scum along the shore", "condition": "Polluted", "status": "Open",
+}
+
+
+@pytest.fixture(scope="session")
+def app(database):
+    from app import app
+    app.testing = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def sign_up(client):
+    username = f"test-{uuid.uuid4().hex[:12]}"
+    response = client.post("/auth/sign-up", json={"username": username, "password": "pw"})
+    assert response.status_code == 201, response.get_json()
+    return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+
+@pytest.fixture
+def auth(client):
+    return sign_up(client)
+
+
+@pytest.fixture
+def report(client, auth):
+    response = client.post("/reports", headers=auth, data=REPORT_FORM)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+import ai_blueprint
+
+
+@pytest.fixture
+def job(client, auth, report):
+    response = client.post(f"/ai/{report['id']}/jobs", headers=auth)
+    assert response.status_code == 202, response.get_json()
+    return response.get_json()
+
+
+@pytest.mark.parametrize("wait", ["nan", "inf", "-inf", "soon"])
+def test_wait_must_be_a_finite_number(client, auth, job, wait):
+    response = client.get(f"/ai/jobs/{job['job_id']}?wait={wait}", headers=auth)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "wait must be a number"}
+
+
+def test_negative_wait_answers_at_once(client, auth, job):
+    started = time.monotonic()
+    response = client.get(f"/ai/jobs/{job['job_id']}?wait=-10", headers=auth)
+
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1
+
+
+def test_repeated_requests_share_the_active_job(client, auth, report, monkeypatch):
+    monkeypatch.setattr(ai_blueprint.client, "latency_ms", 500)
+
+    first = client.post(f"/ai/{report['id']}/jobs?refresh=true", headers=auth).get_json()
+    second = client.post(f"/ai/{report['id']}/jobs?refresh=true", headers=auth).get_json()
+
+    assert second["job_id"] == first["job_id"]
+    finished = client.get(f"/ai/jobs/{first['job_id']}?wait=5", headers=auth).get_json()
+    assert finished["status"] == "done"
+    # With the job finished the slot is free again, the next request queues a new job
+    third = client.post(f"/ai/{report['id']}/jobs?refresh=true", headers=auth)
+    assert third.status_code == 202
+    assert third.get_json()["job_id"] != first["job_id"]
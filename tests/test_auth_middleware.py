@@ -0,0 +1,92 @@
+# token_required remembers verified tokens. The cache must never let through a token that jwt.decode
+# would refuse. DELETE /reports/0 stands in for any protected route, it answers 404 once past the check.
+import time
+from datetime import datetime, timezone
+
+import jwt
+import pytest
+
+import auth_middleware
+from auth_middleware import create_token, token_cache
+
+PROTECTED = "/reports/0"
+PAYLOAD = {"username": "someone", "id": 0}
+
+
+def call(client, token):
+    return client.delete(PROTECTED, headers={"Authorization": f"Bearer {token}"}).status_code
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    # Counts the tokens that went through jwt.decode rather than the cache
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth_middleware.jwt, "decode", counting_decode)
+    return calls
+
+
+def test_valid_tokens_are_decoded_once(client, decodes):
+    token = create_token(PAYLOAD)
+
+    assert [call(client, token) for _ in range(3)] == [404, 404, 404]
+    assert decodes == [token]
+
+
+def test_expired_tokens_are_refused(client):
+    token = jwt.encode({"payload": PAYLOAD, "exp": datetime(2020, 1, 1, tzinfo=timezone.utc)}, auth_middleware.JWT_SECRET)
+
+    assert call(client, token) == 401
+    assert call(client, token) == 401
+
+
+def test_cached_tokens_expire_with_their_exp(client):
+    expires_at = int(time.time()) + 1
+    token = jwt.encode({"payload": PAYLOAD, "exp": expires_at}, auth_middleware.JWT_SECRET)
+    assert call(client, token) == 404
+
+    time.sleep(max(expires_at - time.time(), 0) + 0.1)
+
+    assert call(client, token) == 401
+
+
+@pytest.mark.parametrize("forge", ["other secret", "tampered signature", "none algorithm"])
+def test_forged_tokens_are_refused_next_to_a_cached_one(client, forge):
+    # The genuine token with the same payload is already cached
+    token = create_token(PAYLOAD)
+    assert call(client, token) == 404
+
+    if forge == "other secret":
+        forged = jwt.encode(jwt.decode(token, auth_middleware.JWT_SECRET, algorithms=["HS256"]), "not-the-secret-but-long-enough-for-hs256")
+    elif forge == "tampered signature":
+        header, claims, signature = token.split(".")
+        forged = ".".join([header, claims, ("A" if signature[0] != "A" else "B") + signature[1:]])
+    else:
+        forged = jwt.encode(jwt.decode(token, options={"verify_signature": False}), None, algorithm="none")
+
+    assert call(client, forged) == 401
+    assert call(client, token) == 404
+
+
+def test_handlers_get_their_own_copy_of_the_payload():
+    token = create_token(PAYLOAD)
+    auth_middleware.verify_token(token)["id"] = 42
+
+    assert auth_middleware.verify_token(token) == PAYLOAD
+
+
+@pytest.mark.parametrize("header", ["", "Bearer", "Bearer not.a.token", "Basic abc"])
+def test_malformed_headers_are_refused(client, header):
+    assert client.delete(PROTECTED, headers={"Authorization": header}).status_code == 401
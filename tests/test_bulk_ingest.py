@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from bulk_ingest import validate_row
+
+ROW = {"reported_at": "2024-05-01T10:00:00", "location_lat": "40.71", "location_long": "-74.0",
+       "observation": "green scum", "condition": "Polluted"}
+
+
+@pytest.mark.parametrize("field", ["reported_at", "location_lat", "location_long", "observation", "condition"])
+@pytest.mark.parametrize("value", [None, "", "   ", "\t"])
+def test_blank_required_fields_are_row_errors(field, value):
+    with pytest.raises(ValueError, match=f"{field} is required"):
+        validate_row(dict(ROW, **{field: value}), 1, "2024-05-01T10:00:00")
+
+
+def test_whitespace_only_rows_are_reported_not_inserted(client, auth):
+    rows = [ROW, dict(ROW, observation="  "), dict(ROW, condition="\t"), dict(ROW, location_name="   ")]
+    body = "\n".join(json.dumps(row) for row in rows)
+
+    response = client.post("/reports/bulk", headers=auth, data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 201
+    assert response.get_json() == {
+        "inserted": 2,
+        "error_count": 2,
+        "errors": [{"row": 2, "error": "observation is required"}, {"row": 3, "error": "condition is required"}],
+    }
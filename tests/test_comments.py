@@ -0,0 +1,78 @@
+import uuid
+
+import pytest
+
+import reports_blueprint
+from conftest import REPORT_FORM
+
+
+@pytest.fixture
+def commented(client, auth):
+    # A report under a water source of its own, with five comments, oldest first
+    source = f"src-{uuid.uuid4().hex[:12]}"
+    response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, water_source=source))
+    report_id = response.get_json()["id"]
+    comment_ids = []
+    for i in range(5):
+        response = client.post(f"/reports/{report_id}/comments", headers=auth, json={"text": f"Comment {i}"})
+        assert response.status_code == 201, response.get_json()
+        comment_ids.append(response.get_json()["comment_id"])
+    return source, report_id, comment_ids
+
+
+def listed(client, source, **args):
+    response = client.get("/reports", query_string=dict(args, water_source=source, limit=10))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["reports"]
+
+
+def test_comments_page_oldest_first(client, commented):
+    source, report_id, comment_ids = commented
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(f"/reports/{report_id}/comments", query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        pages.append([comment["comment_id"] for comment in body["comments"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == [comment_ids[:2], comment_ids[2:4], comment_ids[4:]]
+
+
+def test_missing_report_and_bad_cursor(client, commented):
+    source, report_id, comment_ids = commented
+
+    assert client.get("/reports/0/comments").status_code == 404
+    assert client.get(f"/reports/{report_id}/comments?cursor=abc").status_code == 400
+
+
+def test_report_without_comments_has_an_empty_page(client, report):
+    response = client.get(f"/reports/{report['id']}/comments")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"comments": [], "next_cursor": None}
+
+
+def test_listing_counts_comments(client, auth, commented):
+    source, report_id, comment_ids = commented
+
+    reports = listed(client, source)
+    assert [(report["id"], report["comment_count"]) for report in reports] == [(report_id, 5)]
+    assert "comments" not in reports[0]
+
+    assert client.delete(f"/reports/{report_id}/comments/{comment_ids[0]}", headers=auth).status_code == 200
+    assert listed(client, source)[0]["comment_count"] == 4
+
+
+@pytest.mark.parametrize("aggregate_in_db", [False, True])
+def test_include_comments_embeds_them(client, commented, monkeypatch, aggregate_in_db):
+    source, report_id, comment_ids = commented
+    monkeypatch.setattr(reports_blueprint, "AGGREGATE_COMMENTS_IN_DB", aggregate_in_db)
+
+    report = listed(client, source, include_comments="true")[0]
+
+    assert report["comment_count"] == 5
+    assert [comment["comment_id"] for comment in report["comments"]] == comment_ids
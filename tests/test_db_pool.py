@@ -0,0 +1,63 @@
+import functools
+
+import psycopg2
+import pytest
+
+import db_helpers
+from db_helpers import ConnectionPool
+
+
+def close_all(pool):
+    for connection, _ in pool._idle:
+        connection.close()
+
+
+@pytest.fixture
+def fresh_pool(monkeypatch):
+    # get_pool as it runs first in a newly forked worker, with the pool size under the test's control
+    monkeypatch.setattr(db_helpers, "_pool", None)
+
+    def use(**sizes):
+        monkeypatch.setattr(db_helpers, "ConnectionPool", functools.partial(ConnectionPool, **sizes))
+
+    yield use
+    if db_helpers._pool is not None:
+        close_all(db_helpers._pool)
+
+
+def test_warm_opens_min_size_connections(database):
+    pool = ConnectionPool(min_size=3, max_size=5)
+    pool.warm()
+    try:
+        stats = pool.stats()
+        assert (stats["size"], stats["idle"], stats["in_use"]) == (3, 3, 0)
+
+        connection = pool.getconn()
+        assert pool.stats()["size"] == 3
+        pool.putconn(connection)
+    finally:
+        close_all(pool)
+
+
+def test_get_pool_warms_on_first_use(database, fresh_pool):
+    fresh_pool(min_size=2, max_size=4)
+
+    pool = db_helpers.get_pool()
+
+    assert pool.stats()["idle"] == 2
+    assert db_helpers.get_pool() is pool
+
+
+def test_get_pool_without_a_database_opens_on_demand(database, fresh_pool, monkeypatch):
+    fresh_pool(min_size=2, max_size=4)
+
+    def refuse():
+        raise psycopg2.OperationalError("could not connect to server")
+
+    monkeypatch.setattr(db_helpers, "connect", refuse)
+    pool = db_helpers.get_pool()
+
+    assert pool.stats()["size"] == 0
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    assert pool.stats()["size"] == 0
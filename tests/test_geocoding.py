@@ -0,0 +1,126 @@
+# The geocode endpoints read the worker's memory cache, then the geocode_cache table every worker
+# shares, then Nominatim (the stub here). Each test looks up coordinates or a place name of its own,
+# since the table keeps entries across test runs.
+import random
+import threading
+import uuid
+
+import pytest
+
+import geocoding_blueprint
+from db_helpers import PoolTimeout
+from nominatim_client import NominatimClient
+from stubs import NominatimStubHandler, start_nominatim_stub
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    return start_nominatim_stub()
+
+
+@pytest.fixture
+def upstream(stub_url, database, monkeypatch):
+    # Returns the paths Nominatim was asked for during the test
+    NominatimStubHandler.received.clear()
+    NominatimStubHandler.latency_ms = 0
+    monkeypatch.setattr(geocoding_blueprint, "nominatim", NominatimClient(base_url=stub_url, rate=1000, burst=1000, max_wait=1))
+    return lambda: [path for _, path in NominatimStubHandler.received]
+
+
+@pytest.fixture
+def point():
+    return round(random.uniform(-80, 80), 4), round(random.uniform(-170, 170), 4)
+
+
+def shared_stats():
+    return dict(geocoding_blueprint.shared_cache_stats)
+
+
+def reverse(client, lat, lng):
+    response = client.get(f"/geocode/reverse?lat={lat}&lng={lng}")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_memory_then_table_then_nominatim(client, upstream, point):
+    lat, lng = point
+    first = reverse(client, lat, lng)
+    assert len(upstream()) == 1
+
+    # Nearby clicks round to the same key and are answered from memory
+    before = shared_stats()
+    assert reverse(client, lat + 0.00001, lng - 0.00001) == first
+    assert len(upstream()) == 1
+    assert shared_stats() == before
+
+    # Another worker, with nothing in memory, reads the table
+    geocoding_blueprint.memory_cache.clear()
+    assert reverse(client, lat, lng) == first
+    assert len(upstream()) == 1
+    assert shared_stats()["hits"] == before["hits"] + 1
+
+
+def test_expired_table_entries_go_to_nominatim(client, database, upstream, point):
+    lat, lng = point
+    reverse(client, lat, lng)
+    cursor = database.cursor()
+    cursor.execute("UPDATE geocode_cache SET created_at = now() - %s * interval '1 second' WHERE cache_key = %s",
+                   (geocoding_blueprint.GEOCODE_CACHE_TTL + 1, geocoding_blueprint.reverse_cache_key(lat, lng)))
+    database.commit()
+    geocoding_blueprint.memory_cache.clear()
+    misses = shared_stats()["misses"]
+
+    reverse(client, lat, lng)
+
+    assert len(upstream()) == 2
+    assert shared_stats()["misses"] == misses + 1
+
+
+def test_searches_share_an_entry_across_spacing_and_case(client, upstream):
+    place = f"Lake {uuid.uuid4().hex[:8]}"
+
+    first = client.get("/geocode/search", query_string={"q": f"  {place}  "}).get_json()
+    again = client.get("/geocode/search", query_string={"q": place.upper().replace(" ", "   ")}).get_json()
+
+    assert again == first
+    assert len(upstream()) == 1
+
+
+def test_an_unavailable_table_falls_through_to_nominatim(client, upstream, point, monkeypatch):
+    def no_connection():
+        raise PoolTimeout("Timed out waiting for a database connection")
+
+    monkeypatch.setattr(geocoding_blueprint, "get_db_connection", no_connection)
+    errors = shared_stats()["errors"]
+
+    reverse(client, *point)
+
+    assert len(upstream()) == 1
+    # The read and the write both failed
+    assert shared_stats()["errors"] == errors + 2
+
+
+def test_counters_are_not_lost_between_threads():
+    before = shared_stats()["hits"]
+
+    def count():
+        for _ in range(20000):
+            geocoding_blueprint.count_shared("hits")
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert shared_stats()["hits"] == before + 8 * 20000
+
+
+def test_stats_endpoint(client, upstream, point):
+    reverse(client, *point)
+
+    body = client.get("/geocode/cache-stats").get_json()
+
+    assert set(body) == {"memory", "shared", "upstream"}
+    assert body["shared"] == shared_stats()
+    assert body["upstream"]["upstream_calls"] == 1
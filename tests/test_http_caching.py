@@ -0,0 +1,93 @@
+# Conditional requests against the versioned report reads. The data version is replaced where a test
+# needs writes at exact times, the handlers still run against the test database.
+from datetime import datetime
+
+import pytest
+
+import http_caching
+from response_cache import response_cache
+
+URL = "/reports?limit=1"
+
+
+@pytest.fixture
+def data_version(monkeypatch):
+    # Set version, updated_at and the database's clock through the returned dict
+    state = {"version": -1, "updated_at": datetime(2024, 5, 1, 12, 0, 0, 200000), "now": datetime(2024, 5, 1, 12, 0, 0, 300000)}
+    monkeypatch.setattr(http_caching, "get_data_version", lambda name='reports': (state["version"], state["updated_at"], state["now"]))
+    response_cache.clear()
+    yield state
+    response_cache.clear()
+
+
+def write(state, at):
+    state["version"] -= 1
+    state["updated_at"] = state["now"] = at
+
+
+def test_last_modified_waits_for_its_second_to_pass(client, data_version):
+    response = client.get(URL)
+    assert response.status_code == 200
+    assert response.last_modified is None
+    assert response.headers["ETag"]
+
+    data_version["now"] = datetime(2024, 5, 1, 12, 0, 1, 100000)
+    response = client.get(URL)
+    assert response.last_modified.replace(tzinfo=None) == datetime(2024, 5, 1, 12, 0, 1)
+
+
+def test_write_in_the_same_second_is_not_modified_since(client, data_version):
+    # A client holding the truncated time an earlier version sent for the first write
+    data_version["now"] = datetime(2024, 5, 1, 12, 0, 0, 600000)
+    write(data_version, datetime(2024, 5, 1, 12, 0, 0, 700000))
+
+    response = client.get(URL, headers={"If-Modified-Since": "Wed, 01 May 2024 12:00:00 GMT"})
+
+    assert response.status_code == 200
+
+
+def test_write_after_last_modified_is_served(client, data_version):
+    data_version["now"] = datetime(2024, 5, 1, 12, 0, 1, 500000)
+    last_modified = client.get(URL).headers["Last-Modified"]
+    assert client.get(URL, headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    write(data_version, datetime(2024, 5, 1, 12, 0, 1, 600000))
+
+    assert client.get(URL, headers={"If-Modified-Since": last_modified}).status_code == 200
+
+
+def test_if_none_match_answers_304_until_a_write(client, auth, report):
+    url = f"/reports/{report['id']}/comments"
+    response = client.get(url)
+    etag = response.headers["ETag"]
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.get_data() == b""
+    assert not_modified.headers["ETag"] == etag
+
+    # The same version serves a different body for another query string
+    assert client.get(url + "?limit=1", headers={"If-None-Match": etag}).status_code == 200
+
+    client.post(url, headers=auth, json={"text": "Still green"})
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [comment["comment_text"] for comment in response.get_json()["comments"]] == ["Still green"]
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(client, data_version):
+    data_version["now"] = datetime(2024, 5, 1, 12, 0, 1, 500000)
+    last_modified = client.get(URL).headers["Last-Modified"]
+
+    response = client.get(URL, headers={"If-None-Match": '"stale"', "If-Modified-Since": last_modified})
+
+    assert response.status_code == 200
+
+
+def test_errors_are_not_cached(client):
+    response = client.get("/reports?cursor=nope")
+
+    assert response.status_code == 400
+    assert "ETag" not in response.headers
+    assert "Cache-Control" not in response.headers
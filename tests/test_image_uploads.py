@@ -0,0 +1,95 @@
+import io
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+import image_uploads
+from db_helpers import pooled_connection
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def pending_upload(database, report_id):
+    upload_id = image_uploads.new_upload_id()
+    cursor = database.cursor()
+    cursor.execute("UPDATE reports SET image_status = 'pending', image_upload_id = %s WHERE id = %s", (upload_id, report_id))
+    database.commit()
+    return upload_id
+
+
+def image_status(database, report_id):
+    cursor = database.cursor()
+    cursor.execute("SELECT image_status, image_url FROM reports WHERE id = %s", (report_id,))
+    row = cursor.fetchone()
+    database.commit()
+    return row
+
+
+def test_upload_fills_in_the_image(database, report, tmp_path, monkeypatch):
+    monkeypatch.setattr(image_uploads, "uploader", image_uploads.LocalFilesystemUploader(str(tmp_path)))
+    upload_id = pending_upload(database, report["id"])
+
+    image_url = image_uploads.run_image_upload(report["id"], upload_id, b"image")
+
+    assert image_status(database, report["id"]) == ("ready", image_url)
+
+
+def test_failed_status_update_marks_the_image_failed(database, report, tmp_path, monkeypatch):
+    monkeypatch.setattr(image_uploads, "uploader", image_uploads.LocalFilesystemUploader(str(tmp_path)))
+    upload_id = pending_upload(database, report["id"])
+    checkouts = []
+
+    @contextmanager
+    def connection_lost_once():
+        checkouts.append(True)
+        if len(checkouts) == 1:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        with pooled_connection() as connection:
+            yield connection
+
+    monkeypatch.setattr(image_uploads, "pooled_connection", connection_lost_once)
+
+    with pytest.raises(psycopg2.OperationalError):
+        image_uploads.run_image_upload(report["id"], upload_id, b"image")
+
+    assert image_status(database, report["id"])[0] == "failed"
+
+
+@pytest.mark.skipif(Image is None, reason="Pillow isn't installed")
+def test_oversized_images_are_downscaled():
+    buffer = io.BytesIO()
+    Image.new("RGB", (image_uploads.IMAGE_MAX_DIMENSION * 2, 100)).save(buffer, format="PNG")
+
+    prepared = Image.open(io.BytesIO(image_uploads.prepare_image(buffer.getvalue())))
+
+    assert prepared.format == "JPEG"
+    assert max(prepared.size) == image_uploads.IMAGE_MAX_DIMENSION
+
+
+@pytest.mark.skipif(Image is None, reason="Pillow isn't installed")
+def test_downscaled_images_keep_their_orientation():
+    # A camera photo stored landscape, tagged to be shown rotated 90 degrees clockwise
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    Image.new("RGB", (image_uploads.IMAGE_MAX_DIMENSION * 2, 100)).save(buffer, format="JPEG", exif=exif)
+
+    prepared = Image.open(io.BytesIO(image_uploads.prepare_image(buffer.getvalue())))
+
+    assert prepared.size == (50, image_uploads.IMAGE_MAX_DIMENSION)
+    assert prepared.getexif().get(0x0112) is None
+
+
+@pytest.mark.skipif(Image is None, reason="Pillow isn't installed")
+@pytest.mark.parametrize("image_format, extension", [("PNG", "png"), ("JPEG", "jpg"), ("WEBP", "webp")])
+def test_local_uploads_are_named_after_their_format(tmp_path, image_format, extension):
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(buffer, format=image_format)
+
+    image_url = image_uploads.LocalFilesystemUploader(str(tmp_path)).upload(buffer.getvalue())
+
+    assert image_url.endswith(f".{extension}")
@@ -0,0 +1,80 @@
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from json_provider import FastJSONProvider, RawJSON
+
+
+@dataclasses.dataclass
+class Point:
+    lat: float
+    lng: float
+
+
+# Shaped like a report row, with every type the database driver hands back
+ROW = {
+    "id": 7,
+    "title": "Algae bloom",
+    "reported_at": datetime(2024, 5, 1, 10, 0, 0, 123456),
+    "created_at": datetime(2024, 5, 1, 12, 30, 5, tzinfo=timezone(timedelta(hours=-4))),
+    "updated_at": datetime(2024, 2, 29, 23, 59, 59, tzinfo=timezone.utc),
+    "day": date(2023, 12, 31),
+    "location_lat": decimal.Decimal("40.710000"),
+    "location_long": decimal.Decimal("-74.0"),
+    "ratio": 0.1,
+    "upload_id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "point": Point(1.5, -2.25),
+    "image_url": None,
+    "ready": False,
+    "comments": [{"comment_id": 1, "comment_created_at": datetime(1999, 1, 1)}],
+}
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def providers(app, request, monkeypatch):
+    if request.param == "orjson" and json_provider.orjson is None:
+        pytest.skip("orjson isn't installed")
+    if request.param == "stdlib":
+        monkeypatch.setattr(json_provider, "orjson", None)
+    return FastJSONProvider(app), DefaultJSONProvider(app)
+
+
+@pytest.mark.parametrize("value", [ROW, [ROW, ROW], {"count": 3, "by_day": {2: 1, 10: 2}}, [], "text"])
+def test_responses_match_the_default_provider(app, providers, value):
+    fast, default = providers
+    with app.app_context():
+        assert fast.response(value).get_data() == default.response(value).get_data()
+
+
+def test_dumps_match_the_default_provider(providers):
+    fast, default = providers
+
+    for layout in ({}, {"separators": (",", ":")}, {"indent": 2}, {"indent": 4}):
+        assert fast.dumps(ROW, **layout) == default.dumps(ROW, **layout)
+
+
+def test_http_dates_match_werkzeug():
+    from werkzeug.http import http_date
+
+    for value in (ROW["reported_at"], ROW["created_at"], ROW["updated_at"], ROW["day"]):
+        assert json_provider.http_date(value) == http_date(value)
+
+
+def test_raw_json_is_sent_as_is(app):
+    with app.app_context():
+        response = FastJSONProvider(app).response(RawJSON('{"cached":true}\n'))
+
+    assert response.get_data() == b'{"cached":true}\n'
+    assert response.mimetype == "application/json"
+
+
+def test_unknown_types_still_fail(providers):
+    fast, default = providers
+
+    with pytest.raises(TypeError):
+        fast.dumps({"value": object()})
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from nominatim_client import NominatimClient, RateLimitExceeded
+from stubs import NominatimStubHandler, start_nominatim_stub
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    return start_nominatim_stub()
+
+
+@pytest.fixture
+def stub(stub_url, database):
+    # Every test starts with no recorded calls and the shared limiter's next slot due now
+    NominatimStubHandler.received.clear()
+    NominatimStubHandler.latency_ms = 20
+    cursor = database.cursor()
+    cursor.execute("UPDATE rate_limits SET next_at = now() AT TIME ZONE 'utc' WHERE name = 'nominatim'")
+    database.commit()
+    return stub_url
+
+
+def run_concurrently(calls):
+    # Starts every call at once, returns their results or exceptions in order
+    results = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def run(i, call):
+        barrier.wait()
+        started = time.monotonic()
+        try:
+            results[i] = (call(), time.monotonic() - started)
+        except Exception as error:
+            results[i] = (error, time.monotonic() - started)
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_lookups_share_one_upstream_call(stub):
+    NominatimStubHandler.latency_ms = 300
+    client = NominatimClient(base_url=stub, rate=1000, burst=1000, max_wait=1)
+
+    results = run_concurrently([lambda: client.get("/search", {"format": "json", "q": "Lake Erie"})] * 8)
+
+    assert len(NominatimStubHandler.received) == 1
+    assert client.stats["coalesced"] == 7
+    assert all(result == (200, results[0][0][1]) for result, _ in results)
+
+
+def test_workers_share_the_rate(stub):
+    # Two clients stand in for two workers, between them they still make one call per interval
+    workers = [NominatimClient(base_url=stub, rate=10, burst=1, max_wait=5) for _ in range(2)]
+
+    results = run_concurrently([lambda i=i: workers[i % 2].get("/search", {"format": "json", "q": f"place {i}"})
+                                for i in range(6)])
+
+    assert all(result[0] == 200 for result, _ in results)
+    arrivals = sorted(arrived for arrived, _ in NominatimStubHandler.received)
+    assert len(arrivals) == 6
+    # Separate per-worker limits would let the two clients call in pairs and finish in about 0.2 s
+    assert arrivals[-1] - arrivals[0] >= 0.4
+    assert all(later - earlier >= 0.05 for earlier, later in zip(arrivals, arrivals[1:]))
+
+
+def test_requests_queue_until_the_wait_budget_runs_out(stub):
+    client = NominatimClient(base_url=stub, rate=5, burst=1, max_wait=0.5)
+
+    results = run_concurrently([lambda i=i: client.get("/search", {"format": "json", "q": f"lake {i}"})
+                                for i in range(6)])
+
+    served = [elapsed for result, elapsed in results if not isinstance(result, Exception)]
+    rejected = [elapsed for result, elapsed in results if isinstance(result, RateLimitExceeded)]
+    assert len(served) + len(rejected) == 6
+    assert 1 <= len(served) <= 3
+    # Rejected requests waited for a slot until the next one would have been past their budget
+    assert rejected and all(elapsed >= 0.5 - 0.2 for elapsed in rejected)
+    assert client.stats["rate_limited"] == len(rejected)
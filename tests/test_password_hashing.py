@@ -0,0 +1,67 @@
+import uuid
+
+import bcrypt
+import pytest
+
+import password_hashing
+
+
+@pytest.fixture
+def rounds(monkeypatch):
+    # One above bcrypt's minimum, so the suite can store a hash with a lower cost
+    monkeypatch.setattr(password_hashing, "BCRYPT_ROUNDS", 5)
+    return 5
+
+
+def stored_hash(database, password, cost):
+    username = f"test-{uuid.uuid4().hex[:12]}"
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=cost)).decode('utf-8')
+    cursor = database.cursor()
+    cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, hashed))
+    database.commit()
+    return username, hashed
+
+
+def password_of(database, username):
+    cursor = database.cursor()
+    cursor.execute("SELECT password FROM users WHERE username = %s", (username,))
+    hashed = cursor.fetchone()[0]
+    database.commit()
+    return hashed
+
+
+def test_needs_rehash_only_below_the_configured_cost(rounds):
+    assert password_hashing.needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=4)).decode('utf-8'))
+    assert not password_hashing.needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=5)).decode('utf-8'))
+    assert not password_hashing.needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=6)).decode('utf-8'))
+    assert not password_hashing.needs_rehash("not a bcrypt hash")
+
+
+def test_sign_in_rehashes_a_cheaper_hash(client, database, rounds):
+    username, hashed = stored_hash(database, "pw", 4)
+
+    response = client.post("/auth/sign-in", json={"username": username, "password": "pw"})
+
+    assert response.status_code == 200, response.get_json()
+    rehashed = password_of(database, username)
+    assert rehashed.split('$')[2] == "05"
+    assert bcrypt.checkpw(b"pw", rehashed.encode('utf-8'))
+    assert client.post("/auth/sign-in", json={"username": username, "password": "pw"}).status_code == 200
+
+
+def test_sign_in_keeps_a_costlier_hash(client, database, rounds):
+    username, hashed = stored_hash(database, "pw", 6)
+
+    response = client.post("/auth/sign-in", json={"username": username, "password": "pw"})
+
+    assert response.status_code == 200, response.get_json()
+    assert password_of(database, username) == hashed
+
+
+def test_wrong_password_leaves_the_hash_alone(client, database, rounds):
+    username, hashed = stored_hash(database, "pw", 4)
+
+    response = client.post("/auth/sign-in", json={"username": username, "password": "wrong"})
+
+    assert response.status_code == 401
+    assert password_of(database, username) == hashed
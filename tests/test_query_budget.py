@@ -0,0 +1,151 @@
+# Every write endpoint stays within its query budget and answers with the JSON the statements it
+# replaced returned. The REFERENCE_* queries are those statements, run against the same rows.
+import psycopg2.extras
+import pytest
+from flask import Flask, g
+
+from conftest import REPORT_FORM, sign_up
+from db_helpers import get_db_connection, close_db_connection, query_budget
+
+REFERENCE_REPORT = """SELECT r.id, r.author AS report_author_id, r.title, r.reported_at, r.water_source, r.water_feature,
+                             r.location_lat, r.location_long, r.location_name, r.observation, r.condition, r.status,
+                             r.created_at, r.updated_at, r.image_url, r.image_status, u_report.username AS author_username
+                      FROM reports r
+                      JOIN users u_report ON r.author = u_report.id
+                      WHERE r.id = %s"""
+# SELECT * FROM reports, less the search_vector column added since
+REFERENCE_DELETED_REPORT = """SELECT id, author, title, reported_at, water_source, water_feature, location_lat, location_long,
+                                     observation, condition, status, image_url, image_status, image_upload_id, created_at,
+                                     updated_at, location_name, geohash
+                              FROM reports WHERE id = %s"""
+REFERENCE_COMMENT = """SELECT c.id AS comment_id, c.author AS comment_author_id, c.text AS comment_text,
+                              c.created_at AS comment_created_at, c.updated_at AS comment_updated_at,
+                              u_comment.username AS comment_author_username
+                       FROM comments c
+                       JOIN users u_comment ON c.author = u_comment.id
+                       WHERE c.id = %s"""
+REFERENCE_UPDATED_COMMENT = "SELECT * FROM comments WHERE id = %s"
+
+
+def reference_json(app, database, query, row_id):
+    # The row as jsonify rendered it
+    cursor = database.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.execute(query, (row_id,))
+    row = cursor.fetchone()
+    database.commit()
+    with app.app_context():
+        return app.json.response(row).get_json()
+
+
+def call(client, method, url, **kwargs):
+    # Returns the response and the queries its handler made, kept in g by query_budget
+    with client:
+        response = client.open(url, method=method, **kwargs)
+        return response, g.get("db_query_count")
+
+
+@pytest.fixture
+def other(client):
+    return sign_up(client)
+
+
+@pytest.fixture
+def comment(client, auth, report):
+    response = client.post(f"/reports/{report['id']}/comments", headers=auth, json={"text": "Saw this too"})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_create_report(app, database, client, auth):
+    response, queries = call(client, "POST", "/reports", headers=auth, data=REPORT_FORM)
+
+    assert response.status_code == 201
+    assert queries == 1
+    assert response.get_json() == reference_json(app, database, REFERENCE_REPORT, response.get_json()["id"])
+
+
+def test_update_report(app, database, client, auth, report):
+    response, queries = call(client, "PUT", f"/reports/{report['id']}", headers=auth,
+                             data=dict(REPORT_FORM, title="Algae bloom spreading", location_lat="40.8"))
+
+    assert response.status_code == 200
+    assert queries == 1
+    assert response.get_json()["title"] == "Algae bloom spreading"
+    assert response.get_json() == reference_json(app, database, REFERENCE_REPORT, report["id"])
+
+
+def test_delete_report(app, database, client, auth, report):
+    expected = reference_json(app, database, REFERENCE_DELETED_REPORT, report["id"])
+
+    response, queries = call(client, "DELETE", f"/reports/{report['id']}", headers=auth)
+
+    assert response.status_code == 200
+    assert queries == 1
+    assert response.get_json() == expected
+    assert client.get(f"/reports/{report['id']}").status_code == 404
+
+
+def test_create_comment(app, database, client, auth, report):
+    response, queries = call(client, "POST", f"/reports/{report['id']}/comments", headers=auth, json={"text": "Saw this too"})
+
+    assert response.status_code == 201
+    assert queries == 1
+    assert response.get_json() == reference_json(app, database, REFERENCE_COMMENT, response.get_json()["comment_id"])
+
+
+def test_update_comment(app, database, client, auth, report, comment):
+    response, queries = call(client, "PUT", f"/reports/{report['id']}/comments/{comment['comment_id']}", headers=auth,
+                             json={"text": "Still there", "updated_at": "2024-06-01T09:00:00"})
+
+    assert response.status_code == 201
+    assert queries == 1
+    assert response.get_json() == {"comment": reference_json(app, database, REFERENCE_UPDATED_COMMENT, comment["comment_id"])}
+    assert response.get_json()["comment"]["text"] == "Still there"
+
+
+def test_delete_comment_by_report_author(client, auth, other, report):
+    response = client.post(f"/reports/{report['id']}/comments", headers=other, json={"text": "Saw this too"})
+    comment_id = response.get_json()["comment_id"]
+
+    response, queries = call(client, "DELETE", f"/reports/{report['id']}/comments/{comment_id}", headers=auth)
+
+    assert response.status_code == 200
+    assert queries == 1
+    assert response.get_json() == {"message": "Comment deleted successfully"}
+
+
+@pytest.mark.parametrize("method, path, kwargs", [
+    ("PUT", "/reports/{report}", {"data": REPORT_FORM}),
+    ("DELETE", "/reports/{report}", {}),
+    ("PUT", "/reports/{report}/comments/{comment}", {"json": {"text": "x", "updated_at": "2024-06-01"}}),
+    ("DELETE", "/reports/{report}/comments/{comment}", {}),
+])
+def test_missing_and_foreign_rows(client, other, report, comment, method, path, kwargs):
+    # 404 and 401 are told apart within the same single statement
+    response, queries = call(client, method, path.format(report=report["id"], comment=comment["comment_id"]), headers=other, **kwargs)
+    assert (response.status_code, queries) == (401, 1)
+    assert response.get_json() == {"error": "Unauthorized"}
+
+    response, queries = call(client, method, path.format(report=0, comment=0), headers=other, **kwargs)
+    assert (response.status_code, queries) == (404, 1)
+
+
+def test_budget_overrun_fails_in_testing_and_warns_otherwise(database, caplog):
+    budget_app = Flask(__name__)
+    budget_app.teardown_appcontext(close_db_connection)
+
+    @budget_app.route("/two-queries")
+    @query_budget(1)
+    def two_queries():
+        cursor = get_db_connection().cursor()
+        cursor.execute("SELECT 1")
+        cursor.execute("SELECT 2")
+        return "ok"
+
+    budget_app.testing = True
+    with pytest.raises(AssertionError, match="made 2 database queries, its budget is 1"):
+        budget_app.test_client().get("/two-queries")
+
+    budget_app.testing = False
+    assert budget_app.test_client().get("/two-queries").status_code == 200
+    assert "made 2 database queries, its budget is 1" in caplog.text
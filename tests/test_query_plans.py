@@ -0,0 +1,161 @@
+# No statement the blueprints issue plans a sequential scan on a large table.
+#
+# The test database is seeded up to QUERY_PLAN_REPORTS synthetic reports with comments, once, then
+# each endpoint is driven through the test client while the counting cursor records every statement.
+# Each one is run through EXPLAIN (FORMAT JSON). Small tables (users at the seeded size, the cache and
+# version tables) are left to the planner, a seq scan is the right plan for them.
+import io
+import json
+import os
+import random
+
+import psycopg2.extensions
+import pytest
+from flask import g, request_started
+
+import reports_blueprint
+from geo import geohash_encode
+from response_cache import response_cache
+
+QUERY_PLAN_REPORTS = int(os.getenv('QUERY_PLAN_REPORTS', '60000'))
+# Estimated row count from which a sequential scan counts as a regression
+LARGE_TABLE_MIN_ROWS = 50000
+USER_COUNT = 5000
+COMMENTS_PER_REPORT = 2
+
+
+def seed(connection, report_count):
+    cursor = connection.cursor()
+    cursor.execute("SELECT count(*) FROM reports")
+    existing = cursor.fetchone()[0]
+    if existing >= report_count:
+        return
+    cursor.execute("""INSERT INTO users (username, password)
+                      SELECT 'seed-user-' || n, 'x' FROM generate_series(1, %s) n
+                      ON CONFLICT (username) DO NOTHING""", (USER_COUNT,))
+    cursor.execute("SELECT min(id), max(id) FROM users WHERE username LIKE 'seed-user-%%'")
+    min_user, max_user = cursor.fetchone()
+
+    buffer = io.StringIO()
+    for _ in range(report_count - existing):
+        lat, lng = random.uniform(-60, 60), random.uniform(-170, 170)
+        buffer.write(f"{random.randint(min_user, max_user)}\tSeed report\t2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:00\t"
+                     f"{random.choice(['river', 'lake', 'well'])}\t{lat}\t{lng}\tClear\t{random.choice(['good', 'fair', 'poor'])}\topen\t{geohash_encode(lat, lng)}\n")
+    buffer.seek(0)
+    cursor.copy_from(buffer, "reports", columns=("author", "title", "reported_at", "water_source", "location_lat",
+                                                 "location_long", "observation", "condition", "status", "geohash"))
+    cursor.execute("""INSERT INTO comments (author, report, text)
+                      SELECT %s + (r.id * 7 + n) %% (%s - %s + 1), r.id, 'Seed comment'
+                      FROM reports r, generate_series(1, %s) n
+                      WHERE r.id > (SELECT coalesce(max(report), 0) FROM comments)""",
+                   (min_user, max_user, min_user, COMMENTS_PER_REPORT))
+    connection.commit()
+    cursor.execute("ANALYZE")
+    connection.commit()
+
+
+def scenarios(client):
+    # Each step is (name, response), run in order so later steps can use ids created by earlier ones
+    credentials = {"username": f"plan-check-{random.randint(0, 10**9)}", "password": "pw"}
+    response = client.post('/auth/sign-up', json=credentials)
+    headers = {"Authorization": f"Bearer {response.get_json()['token']}"}
+    yield "sign up", response
+    yield "sign in", client.post('/auth/sign-in', json=credentials)
+
+    report = {"title": "Plan check", "reported_at": "2024-06-01T12:00:00", "location_lat": "40.7", "location_long": "-74.0",
+              "observation": "Clear", "condition": "good", "water_source": "river"}
+    response = client.post('/reports', data=report, headers=headers)
+    report_id = response.get_json()["id"]
+    yield "create report", response
+
+    page = client.get('/reports?limit=20')
+    yield "list reports", page
+    yield "list reports, next page", client.get(f'/reports?limit=20&cursor={page.get_json()["next_cursor"]}')
+    yield "list reports by condition", client.get('/reports?limit=20&condition=poor')
+    yield "list reports with comments", client.get('/reports?limit=20&include_comments=true')
+    yield "list reports by author", client.get('/reports?limit=20&author=seed-user-42')
+    yield "list reports by date range", client.get('/reports?limit=20&reported_from=2024-03-01&reported_to=2024-03-02')
+    yield "list reports in bbox", client.get('/reports?limit=20&bbox=-74.1,40.6,-73.9,40.8')
+    yield "reports near", client.get('/reports/near?lat=40.7&lng=-74.0&radius=5000')
+    yield "search reports", client.get('/reports/search?q=plan che&condition=good')
+    yield "map clusters", client.get('/reports/clusters?zoom=9&bbox=-75,40,-73,41.5')
+    yield "map reports", client.get('/reports/clusters?zoom=16&bbox=-74.01,40.69,-73.99,40.71')
+    yield "show report", client.get(f'/reports/{report_id}')
+    yield "report stats by date range", client.get('/reports/stats?interval=week&condition=poor&reported_from=2024-03-01&reported_to=2024-03-31')
+    yield "export reports by date range", client.get('/reports/export?format=ndjson&include_comments=true&reported_from=2024-03-01&reported_to=2024-03-01')
+
+    response = client.post(f'/reports/{report_id}/comments', json={"text": "Plan check comment"}, headers=headers)
+    comment_id = response.get_json()["comment_id"]
+    yield "create comment", response
+    yield "report comments", client.get(f'/reports/{report_id}/comments?limit=20')
+    yield "update comment", client.put(f'/reports/{report_id}/comments/{comment_id}', json={"text": "Edited", "updated_at": "2024-06-02T12:00:00"}, headers=headers)
+    yield "delete comment", client.delete(f'/reports/{report_id}/comments/{comment_id}', headers=headers)
+
+    yield "update report", client.put(f'/reports/{report_id}', data=report, headers=headers)
+    yield "ai insight", client.get(f'/ai/{report_id}', headers=headers)
+    yield "delete report", client.delete(f'/reports/{report_id}', headers=headers)
+
+
+def large_tables(cursor):
+    cursor.execute("SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples >= %s", (LARGE_TABLE_MIN_ROWS,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def seq_scans(plan, tables):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, tables))
+    return found
+
+
+def explain(cursor, query, vars):
+    statement = cursor.mogrify(query, vars).decode('utf-8') if vars is not None else query
+    cursor.execute("EXPLAIN (FORMAT JSON) " + statement)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+@pytest.fixture
+def captured(app):
+    # The counting cursor appends every statement of a request to g.db_query_log
+    captured = []
+
+    def capture_queries(sender, **extra):
+        g.db_query_log = captured
+
+    request_started.connect(capture_queries, app)
+    yield captured
+    request_started.disconnect(capture_queries, app)
+
+
+@pytest.mark.parametrize("aggregate_in_db", [False, True])
+def test_no_seq_scans_on_large_tables(database, client, captured, monkeypatch, aggregate_in_db):
+    seed(database, QUERY_PLAN_REPORTS)
+    monkeypatch.setattr(reports_blueprint, "AGGREGATE_COMMENTS_IN_DB", aggregate_in_db)
+    # A plain cursor, so the EXPLAINs themselves aren't counted or captured
+    cursor = database.cursor(cursor_factory=psycopg2.extensions.cursor)
+    tables = large_tables(cursor)
+    database.rollback()
+    assert {"reports", "comments"} <= tables
+
+    regressions = []
+    response_cache.clear()
+    for name, response in scenarios(client):
+        assert response.status_code < 400, f"{name}: {response.status_code} {response.get_data(as_text=True)}"
+        # Streamed responses hold the request context until they are closed
+        response.close()
+        for query, vars in captured:
+            # COPY and executemany batches can't be explained, and the version lookup only touches data_versions
+            if query is None or query.lstrip().upper().startswith("COPY") or (vars is None and "%s" in query):
+                continue
+            scanned = seq_scans(explain(cursor, query, vars), tables)
+            database.rollback()
+            if scanned:
+                regressions.append(f"{name}: SEQ SCAN on {', '.join(scanned)}\n    {' '.join(query.split())[:200]}")
+        captured.clear()
+
+    assert not regressions, "\n".join(regressions)
@@ -0,0 +1,123 @@
+# Map clusters follow report writes through the cluster table and the tile cache. Each test places
+# its reports around a random point just north of where the query plan test seeds reports, so a small
+# box around it holds only the test's own reports.
+import random
+
+import pytest
+
+import report_clusters
+from conftest import REPORT_FORM
+from geo import geohash_cell_size
+
+
+def bbox(lat, lng, half):
+    return f"{max(lng - half, -180)},{max(lat - half, -85)},{min(lng + half, 180)},{min(lat + half, 85)}"
+
+
+@pytest.fixture
+def place(client, auth):
+    lat, lng = random.uniform(61, 64), random.uniform(-170, 170)
+
+    def create(dlat=0.0, dlng=0.0, **fields):
+        response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, location_lat=f"{lat + dlat:.5f}",
+                                                                   location_long=f"{lng + dlng:.5f}", **fields))
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()["id"]
+
+    create.lat, create.lng = lat, lng
+    create.bbox = bbox(lat, lng, 0.15)
+    return create
+
+
+def clusters(client, box, zoom):
+    response = client.get(f"/reports/clusters?zoom={zoom}&bbox={box}")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def total(client, box, zoom):
+    return sum(cluster["count"] for cluster in clusters(client, box, zoom)["clusters"])
+
+
+def test_counts_and_conditions(client, place):
+    place(condition="Polluted")
+    place(condition="Polluted")
+    place(0.0001, 0.0001, condition="Clear")
+    place(0.1, 0.1, condition="Clear")
+
+    body = clusters(client, place.bbox, 12)
+
+    assert body["precision"] == 5
+    assert all(len(cluster["cell"]) == 5 for cluster in body["clusters"])
+    assert sorted((cluster["count"], cluster["condition"]) for cluster in body["clusters"]) == [(1, "Clear"), (3, "Polluted")]
+    busiest = max(body["clusters"], key=lambda cluster: cluster["count"])
+    assert busiest["lat"] == pytest.approx(place.lat + 0.0001 / 3, abs=1e-5)
+
+
+@pytest.mark.parametrize("zoom", range(report_clusters.CLUSTER_MAX_ZOOM + 1))
+def test_every_zoom_counts_every_report(client, place, zoom):
+    # Even precisions are read as stored, odd ones are rolled up from the next finer level. Coarse
+    # cells also hold other tests' reports, so the count is compared before and after, over a box
+    # wide enough to hold the centroid of any cell the reports fall in.
+    precision = report_clusters.precision_for_zoom(zoom)
+    box = bbox(place.lat, place.lng, max(geohash_cell_size(precision)) + 0.001)
+    before = total(client, box, zoom)
+
+    for i in range(3):
+        place(0.0002 * i, 0.0003 * i)
+    body = clusters(client, box, zoom)
+
+    assert body["precision"] == precision
+    assert sum(cluster["count"] for cluster in body["clusters"]) - before == 3
+
+
+def test_writes_invalidate_cached_tiles(client, auth, place):
+    report_id = place(condition="Clear")
+    place(0.1, 0.1, condition="Clear")
+    assert total(client, place.bbox, 11) == 2
+
+    place(0.1, 0.1)
+    assert total(client, place.bbox, 11) == 3
+
+    # Moved out of the box
+    moved = dict(REPORT_FORM, location_lat="0.5", location_long="0.5")
+    assert client.put(f"/reports/{report_id}", headers=auth, data=moved).status_code == 200
+    assert total(client, place.bbox, 11) == 2
+
+    assert client.delete(f"/reports/{report_id}", headers=auth).status_code == 200
+    assert total(client, place.bbox, 11) == 2
+
+
+def test_condition_changes_show_up(client, auth, place):
+    report_id = place(condition="Clear")
+    assert [cluster["condition"] for cluster in clusters(client, place.bbox, 11)["clusters"]] == ["Clear"]
+
+    same_place = dict(REPORT_FORM, location_lat=f"{place.lat:.5f}", location_long=f"{place.lng:.5f}", condition="Murky")
+    assert client.put(f"/reports/{report_id}", headers=auth, data=same_place).status_code == 200
+    assert [cluster["condition"] for cluster in clusters(client, place.bbox, 11)["clusters"]] == ["Murky"]
+
+    assert client.delete(f"/reports/{report_id}", headers=auth).status_code == 200
+    assert clusters(client, place.bbox, 11)["clusters"] == []
+
+
+def test_past_the_max_zoom_reports_are_listed(client, place):
+    report_id = place()
+
+    body = clusters(client, bbox(place.lat, place.lng, 0.002), report_clusters.CLUSTER_MAX_ZOOM + 1)
+
+    assert body["clusters"] == []
+    assert [report["id"] for report in body["reports"]] == [report_id]
+
+
+def test_rebuild_gives_the_same_clusters(client, database, place):
+    place()
+    place(0.1, 0.1)
+    before = clusters(client, place.bbox, 9)
+
+    report_clusters.rebuild(database)
+
+    cursor = database.cursor()
+    cursor.execute("SELECT count(*) FROM report_clusters WHERE precision % 2 = 1 OR report_count = 0")
+    assert cursor.fetchone()[0] == 0
+    database.commit()
+    assert clusters(client, place.bbox, 9) == before
@@ -0,0 +1,97 @@
+# The summary tables behind GET /reports/stats follow report writes, and a rebuild from the reports
+# gives the same counts. Each test files its reports under a water source no other report has.
+import uuid
+
+import pytest
+
+import report_stats
+from conftest import REPORT_FORM
+
+STATS_TABLES = (("report_stats", "report_stats_source"), ("report_cell_stats", "report_cell_stats_source"))
+
+
+@pytest.fixture
+def source():
+    return f"src-{uuid.uuid4().hex[:12]}"
+
+
+def create(client, auth, **fields):
+    response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, **fields))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["id"]
+
+
+def stats(client, source, **args):
+    response = client.get("/reports/stats", query_string=dict(args, water_source=source))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def counts(entries, key):
+    return {entry[key]: entry["count"] for entry in entries}
+
+
+def drift(database):
+    # Rows where the trigger-maintained tables and a recount from reports disagree, empty buckets aside
+    cursor = database.cursor()
+    rows = []
+    for table, view in STATS_TABLES:
+        cursor.execute(f"""(SELECT * FROM {table} WHERE report_count <> 0 EXCEPT SELECT * FROM {view})
+                           UNION ALL
+                           (SELECT * FROM {view} EXCEPT SELECT * FROM {table} WHERE report_count <> 0)""")
+        rows.extend((table, row) for row in cursor.fetchall())
+    database.commit()
+    return rows
+
+
+def test_create_update_and_delete(client, auth, source):
+    first = create(client, auth, water_source=source, condition="Polluted", reported_at="2024-05-01T10:00:00")
+    create(client, auth, water_source=source, condition="Polluted", reported_at="2024-05-02T10:00:00")
+    create(client, auth, water_source=source, condition="Clear", reported_at="2024-05-02T18:00:00", location_lat="51.5", location_long="-0.12")
+
+    created = stats(client, source, grid=2)
+    assert created["total"] == 3
+    assert counts(created["by_condition"], "condition") == {"Polluted": 2, "Clear": 1}
+    assert counts(created["series"], "period") == {"2024-05-01": 1, "2024-05-02": 2}
+    assert counts(created["grid"], "cell") == {"dr": 2, "gc": 1}
+
+    response = client.put(f"/reports/{first}", headers=auth,
+                          data=dict(REPORT_FORM, water_source=source, condition="Clear", reported_at="2024-06-03T10:00:00"))
+    assert response.status_code == 200, response.get_json()
+
+    updated = stats(client, source, interval="month")
+    assert updated["total"] == 3
+    assert counts(updated["by_condition"], "condition") == {"Polluted": 1, "Clear": 2}
+    assert counts(updated["series"], "period") == {"2024-05-01": 2, "2024-06-01": 1}
+
+    assert client.delete(f"/reports/{first}", headers=auth).status_code == 200
+
+    deleted = stats(client, source)
+    assert deleted["total"] == 2
+    assert counts(deleted["by_condition"], "condition") == {"Polluted": 1, "Clear": 1}
+    assert counts(deleted["series"], "period") == {"2024-05-02": 2}
+    assert stats(client, source, condition="Polluted", reported_from="2024-05-02", reported_to="2024-05-02")["total"] == 1
+
+
+def test_triggers_match_a_recount(client, database, auth, source):
+    report_id = create(client, auth, water_source=source)
+    client.put(f"/reports/{report_id}", headers=auth, data=dict(REPORT_FORM, water_source=source, status="Closed"))
+    create(client, auth, water_source=source, status="")
+
+    assert drift(database) == []
+
+
+def test_rebuild_gives_the_same_counts(client, database, auth, source):
+    report_id = create(client, auth, water_source=source, condition="Murky")
+    client.delete(f"/reports/{report_id}", headers=auth)
+    create(client, auth, water_source=source, condition="Murky")
+    before = stats(client, source, grid=3)
+
+    report_stats.rebuild(database)
+
+    assert drift(database) == []
+    cursor = database.cursor()
+    cursor.execute("SELECT count(*) FROM report_stats WHERE report_count = 0")
+    assert cursor.fetchone()[0] == 0
+    database.commit()
+    assert stats(client, source, grid=3) == before
@@ -0,0 +1,113 @@
+# Keyset pagination and filters on GET /reports. Each test files its reports under a water source no
+# other report has and filters on it.
+import uuid
+
+import pytest
+
+import report_filters
+from conftest import REPORT_FORM
+
+
+@pytest.fixture
+def source():
+    return f"src-{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def author(client):
+    username = f"test-{uuid.uuid4().hex[:12]}"
+    response = client.post("/auth/sign-up", json={"username": username, "password": "pw"})
+    return username, {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+
+def create(client, auth, source, reported_at, **fields):
+    response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, water_source=source, reported_at=reported_at, **fields))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["id"]
+
+
+def walk(client, source, limit, **filters):
+    # Every page's ids, following next_cursor to the end
+    pages = []
+    cursor = None
+    while True:
+        args = dict(filters, water_source=source, limit=limit, **({"cursor": cursor} if cursor else {}))
+        response = client.get("/reports", query_string=args)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        pages.append([report["id"] for report in body["reports"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_newest_first(client, auth, source):
+    # Two reports at the same time are ordered by id
+    oldest = create(client, auth, source, "2024-01-01T08:00:00")
+    tied_first = create(client, auth, source, "2024-03-01T08:00:00")
+    tied_second = create(client, auth, source, "2024-03-01T08:00:00")
+    newest = create(client, auth, source, "2024-05-01T08:00:00")
+    middle = create(client, auth, source, "2024-02-01T08:00:00")
+
+    pages = walk(client, source, 2)
+
+    assert pages == [[newest, tied_second], [tied_first, middle], [oldest]]
+
+
+def test_pages_while_reports_are_added(client, auth, source):
+    # A report newer than the cursor doesn't shift the pages after it
+    ids = [create(client, auth, source, f"2024-01-0{day}T08:00:00") for day in range(1, 5)]
+    response = client.get("/reports", query_string={"water_source": source, "limit": 2})
+    cursor = response.get_json()["next_cursor"]
+
+    create(client, auth, source, "2024-06-01T08:00:00")
+    response = client.get("/reports", query_string={"water_source": source, "limit": 2, "cursor": cursor})
+
+    assert [report["id"] for report in response.get_json()["reports"]] == [ids[1], ids[0]]
+
+
+def test_filters(client, auth, author, source):
+    username, other = author
+    polluted = create(client, auth, source, "2024-04-10T08:00:00", condition="Polluted", status="Open")
+    clear = create(client, auth, source, "2024-04-11T23:59:59", condition="Clear", status="Closed")
+    theirs = create(client, other, source, "2024-04-12T00:00:00", condition="Clear", status="Open")
+
+    def ids(**filters):
+        return sorted(sum(walk(client, source, 10, **filters), []))
+
+    assert ids(condition="Clear") == sorted([clear, theirs])
+    assert ids(status="Open", condition="Clear") == [theirs]
+    assert ids(author=username) == [theirs]
+    # A bare reported_to date includes the whole day
+    assert ids(reported_from="2024-04-11", reported_to="2024-04-11") == [clear]
+    assert ids(reported_to="2024-04-11T12:00:00") == [polluted]
+    assert ids(reported_from="2024-04-11T12:00:00") == sorted([clear, theirs])
+    assert ids(author="nobody-by-this-name") == []
+
+
+def test_without_limit_or_cursor_every_report_is_listed(client, auth, source):
+    ids = [create(client, auth, source, f"2024-02-0{day}T08:00:00") for day in range(1, 4)]
+
+    response = client.get("/reports", query_string={"water_source": source})
+
+    assert [report["id"] for report in response.get_json()] == ids[::-1]
+
+
+@pytest.mark.parametrize("args", [{"limit": "ten"}, {"limit": "0"}, {"cursor": "not-a-cursor"}, {"reported_from": "yesterday"}])
+def test_bad_arguments_are_rejected(client, args):
+    response = client.get("/reports", query_string=args)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"]
+
+
+def test_limit_is_capped(client, auth, source, monkeypatch):
+    monkeypatch.setattr(report_filters, "MAX_PAGE_SIZE", 2)
+    for day in range(1, 4):
+        create(client, auth, source, f"2024-02-0{day}T08:00:00")
+
+    response = client.get("/reports", query_string={"water_source": source, "limit": 50})
+
+    assert response.status_code == 200
+    assert len(response.get_json()["reports"]) == 2
+    assert response.get_json()["next_cursor"]
@@ -0,0 +1,84 @@
+import uuid
+
+import pytest
+
+from conftest import REPORT_FORM
+from response_cache import ResponseCache, response_cache
+
+
+@pytest.fixture
+def listing(client, auth):
+    # A listing only this test's reports appear in
+    source = f"src-{uuid.uuid4().hex[:12]}"
+    client.post("/reports", headers=auth, data=dict(REPORT_FORM, water_source=source))
+    response_cache.clear()
+    return f"/reports?water_source={source}"
+
+
+def test_reads_are_served_from_the_cache(client, listing):
+    before = response_cache.stats()
+    first = client.get(listing)
+    second = client.get(listing)
+    after = response_cache.stats()
+
+    assert second.get_data() == first.get_data()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+
+
+@pytest.mark.parametrize("write", ["create", "update", "delete", "comment"])
+def test_writes_invalidate_cached_reads(client, auth, listing, write):
+    source = listing.split("=")[1]
+    reports = client.get(listing).get_json()
+    report_id = reports[0]["id"]
+
+    if write == "create":
+        client.post("/reports", headers=auth, data=dict(REPORT_FORM, water_source=source, title="Second bloom"))
+    elif write == "update":
+        client.put(f"/reports/{report_id}", headers=auth, data=dict(REPORT_FORM, water_source=source, title="Renamed"))
+    elif write == "delete":
+        client.delete(f"/reports/{report_id}", headers=auth)
+    else:
+        client.post(f"/reports/{report_id}/comments", headers=auth, json={"text": "Worse today"})
+    invalidations = response_cache.stats()["invalidations"]
+    reports = client.get(listing).get_json()
+
+    assert response_cache.stats()["invalidations"] == invalidations + 1
+    if write == "create":
+        assert sorted(report["title"] for report in reports) == ["Algae bloom", "Second bloom"]
+    elif write == "update":
+        assert [report["title"] for report in reports] == ["Renamed"]
+    elif write == "delete":
+        assert reports == []
+    else:
+        assert reports[0]["comment_count"] == 1
+
+
+def test_oldest_entries_are_evicted_past_max_bytes():
+    cache = ResponseCache(max_bytes=30)
+    cache.set("a", 1, b"0123456789")
+    cache.set("b", 1, b"0123456789")
+    cache.get("a", 1)
+    cache.set("c", 1, b"0123456789")
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == b"0123456789"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 30
+
+
+def test_entries_from_another_version_are_misses():
+    cache = ResponseCache()
+    cache.set("a", 1, b"old")
+
+    assert cache.get("a", 2) is None
+    assert cache.get("a", 1) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_bodies_larger_than_the_cache_are_not_kept():
+    cache = ResponseCache(max_bytes=10)
+    cache.set("a", 1, b"x" * 20)
+
+    assert cache.stats()["entries"] == 0
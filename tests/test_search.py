@@ -0,0 +1,118 @@
+import uuid
+
+import pytest
+
+import reports_blueprint
+from conftest import REPORT_FORM
+from response_cache import response_cache
+
+
+@pytest.fixture
+def word(client, auth):
+    # Seven reports sharing a word no other report has, oldest first
+    word = f"zq{uuid.uuid4().hex[:10]}"
+    ids = []
+    for i in range(7):
+        observation = f"{word} " * (i % 3 + 1) + "near the dock"
+        response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, observation=observation))
+        assert response.status_code == 201, response.get_json()
+        ids.append(response.get_json()["id"])
+    return word, ids
+
+
+def search_all(client, url):
+    # Follows next_cursor to the end, returning the ids in order and the truncated flag of every page
+    ids, flags = [], []
+    cursor = None
+    while True:
+        response_cache.clear()
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        ids.extend(report["id"] for report in body["reports"])
+        flags.append(body["truncated"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids, flags
+
+
+@pytest.mark.parametrize("walk_rows", [0, 1000000])
+def test_truncated_when_older_matches_are_left_out(client, word, monkeypatch, walk_rows):
+    # walk_rows 0 reads every candidate through the index, a large window walks the primary key
+    text, ids = word
+    monkeypatch.setattr(reports_blueprint, "SEARCH_WALK_ROWS", walk_rows)
+    monkeypatch.setattr(reports_blueprint, "SEARCH_PROBE_ROWS", 10)
+    monkeypatch.setattr(reports_blueprint, "SEARCH_MAX_RANKED", 5)
+
+    found, flags = search_all(client, f"/reports/search?q={text}&limit=2")
+
+    assert sorted(found) == sorted(ids[-5:])
+    assert flags == [True, True, True]
+
+
+@pytest.mark.parametrize("walk_rows", [0, 1000000])
+def test_every_match_ranked_when_under_the_limit(client, word, monkeypatch, walk_rows):
+    text, ids = word
+    monkeypatch.setattr(reports_blueprint, "SEARCH_WALK_ROWS", walk_rows)
+    monkeypatch.setattr(reports_blueprint, "SEARCH_PROBE_ROWS", 10)
+
+    found, flags = search_all(client, f"/reports/search?q={text}&limit=7")
+
+    # A full last page has no cursor to an empty one
+    assert sorted(found) == sorted(ids)
+    assert flags == [False]
+
+
+def test_walk_and_index_agree(client, word, monkeypatch):
+    text, ids = word
+    monkeypatch.setattr(reports_blueprint, "SEARCH_PROBE_ROWS", 10)
+    pages = {}
+    for walk_rows in (0, 1000000):
+        monkeypatch.setattr(reports_blueprint, "SEARCH_WALK_ROWS", walk_rows)
+        pages[walk_rows] = search_all(client, f"/reports/search?q={text} dock&limit=3")[0]
+
+    assert pages[0] == pages[1000000]
+    assert sorted(pages[0]) == sorted(ids)
+
+
+def search(client, url):
+    response_cache.clear()
+    response = client.get(url)
+    return response.status_code, response.get_json()
+
+
+def test_more_occurrences_rank_first(client, word):
+    text, ids = word
+
+    status, body = search(client, f"/reports/search?q={text}&limit=7")
+
+    assert status == 200
+    # Observations repeat the word 1, 2, 3, 1, 2, 3, 1 times
+    assert set(report["id"] for report in body["reports"][:2]) == {ids[2], ids[5]}
+    assert [report["rank"] for report in body["reports"]] == sorted((report["rank"] for report in body["reports"]), reverse=True)
+
+
+def test_last_word_matches_as_a_prefix(client, word):
+    text, ids = word
+
+    assert len(search(client, f"/reports/search?q=dock {text[:-3]}&limit=10")[1]["reports"]) == 7
+    assert search(client, f"/reports/search?q=dock {text[:-3]}&prefix=false&limit=10")[1]["reports"] == []
+
+
+def test_filters_apply_to_matches(client, auth, word):
+    text, ids = word
+    response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, observation=f"{text} by the pier", condition="Clear"))
+    clear_id = response.get_json()["id"]
+
+    status, body = search(client, f"/reports/search?q={text}&condition=Clear")
+
+    assert status == 200
+    assert [report["id"] for report in body["reports"]] == [clear_id]
+
+
+@pytest.mark.parametrize("url", ["/reports/search?q=", "/reports/search?q=%26%7C!", "/reports/search?q=dock&cursor=nope"])
+def test_bad_queries_are_rejected(client, url):
+    status, body = search(client, url)
+
+    assert status == 400
+    assert body["error"]
@@ -0,0 +1,104 @@
+# Bounding box and radius queries. Each test files its reports under a water source no other report
+# has, so only its own reports can match.
+import math
+import random
+import uuid
+
+import pytest
+
+from conftest import REPORT_FORM
+from geo import EARTH_RADIUS_M, METERS_PER_DEGREE_LAT
+
+
+@pytest.fixture
+def source():
+    return f"src-{uuid.uuid4().hex[:12]}"
+
+
+def create(client, auth, source, lat, lng, **fields):
+    response = client.post("/reports", headers=auth, data=dict(REPORT_FORM, water_source=source, location_lat=f"{lat:.6f}",
+                                                               location_long=f"{lng:.6f}", **fields))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["id"]
+
+
+def in_bbox(client, source, min_lng, min_lat, max_lng, max_lat):
+    response = client.get("/reports", query_string={"water_source": source, "bbox": f"{min_lng},{min_lat},{max_lng},{max_lat}"})
+    assert response.status_code == 200, response.get_json()
+    return sorted(report["id"] for report in response.get_json())
+
+
+def near(client, source, lat, lng, radius, **args):
+    response = client.get("/reports/near", query_string=dict(args, water_source=source, lat=lat, lng=lng, radius=radius))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def test_bbox_matches_a_scan(client, auth, source):
+    # Around 0,0 where every geohash level splits, so boxes are covered by several prefixes
+    points = {}
+    for _ in range(30):
+        lat, lng = round(random.uniform(-2, 2), 6), round(random.uniform(-2, 2), 6)
+        points[create(client, auth, source, lat, lng)] = (lat, lng)
+
+    for _ in range(20):
+        min_lat, max_lat = sorted(random.uniform(-2.5, 2.5) for _ in range(2))
+        min_lng, max_lng = sorted(random.uniform(-2.5, 2.5) for _ in range(2))
+        expected = sorted(report_id for report_id, (lat, lng) in points.items()
+                          if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng)
+        assert in_bbox(client, source, min_lng, min_lat, max_lng, max_lat) == expected
+
+
+def test_bbox_edges_are_inclusive(client, auth, source):
+    on_edge = create(client, auth, source, 10.5, 20.25)
+    create(client, auth, source, 10.500001, 20.25)
+
+    assert in_bbox(client, source, 20.0, 10.0, 20.25, 10.5) == [on_edge]
+
+
+def test_near_orders_by_distance_within_the_radius(client, auth, source):
+    lat, lng = -67.0, random.uniform(-170, 170)
+    meters_per_degree_lng = METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))
+    far = create(client, auth, source, lat + 3000 / METERS_PER_DEGREE_LAT, lng)
+    closest = create(client, auth, source, lat, lng + 100 / meters_per_degree_lng)
+    second = create(client, auth, source, lat - 1000 / METERS_PER_DEGREE_LAT, lng)
+    # Inside the box around the circle, outside the circle
+    corner = create(client, auth, source, lat + 1900 / METERS_PER_DEGREE_LAT, lng + 1900 / meters_per_degree_lng)
+
+    reports = near(client, source, lat, lng, 2000)
+
+    assert [report["id"] for report in reports] == [closest, second]
+    for report in reports:
+        assert report["distance_m"] == pytest.approx(haversine(lat, lng, report["location_lat"], report["location_long"]), abs=0.5)
+    assert [report["id"] for report in near(client, source, lat, lng, 5000)] == [closest, second, corner, far]
+    assert [report["id"] for report in near(client, source, lat, lng, 5000, limit=1)] == [closest]
+
+
+def test_near_applies_filters(client, auth, source):
+    lat, lng = -66.0, random.uniform(-170, 170)
+    create(client, auth, source, lat, lng, condition="Polluted")
+    clear = create(client, auth, source, lat + 0.001, lng, condition="Clear")
+
+    assert [report["id"] for report in near(client, source, lat, lng, 1000, condition="Clear")] == [clear]
+
+
+@pytest.mark.parametrize("url", [
+    "/reports?bbox=1,2,3",
+    "/reports?bbox=10,0,-10,1",
+    "/reports?bbox=0,-91,1,1",
+    "/reports/near?lng=0&radius=100",
+    "/reports/near?lat=0&lng=181",
+    "/reports/near?lat=0&lng=0&radius=0",
+    "/reports/near?lat=0&lng=0&radius=far",
+])
+def test_bad_arguments_are_rejected(client, url):
+    response = client.get(url)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"]